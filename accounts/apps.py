@@ -4,7 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
-    
-def ready(self):
+
+    def ready(self):
         # IMPORT THE SIGNALS HERE
-        import accounts.signals
\ No newline at end of file
+        import accounts.signals
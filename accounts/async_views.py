@@ -0,0 +1,168 @@
+"""
+Async versions of the read-heavy pages in ``accounts.views``.
+
+``accounts.urls`` routes to these when ``ASYNC_VIEWS`` is on (off by
+default; it only makes sense under ``resonate.asgi``). They load their data with the
+async ORM and the ``a``-prefixed helpers, gathering independent lookups
+such as a profile's user and posts queries. Each
+request's queries still run one at a time on its thread-sensitive thread,
+since a database connection can't be shared across threads; the gain is
+that a request waiting on the database no longer holds a worker thread.
+Templates render through ``sync_to_async``, as fragment caching and lazy
+relations in them are synchronous.
+
+Only reads are duplicated here. A POST (adding a comment) is handed to the
+sync view, so writes have a single implementation. Behaviour and query
+budgets are the same as the sync views'.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, render
+
+from resonate.middleware import query_budget
+
+from . import likebuffer, views
+from .facets import facet_counts_within
+from .feed import aget_feed_page
+from .forms import CommentForm, ProfileForm
+from .hydration import ahydrate_posts
+from .models import Comment, Facet, Like, Post, normalize_facet
+from .pagination import decode_cursor
+from .profiles import aload_profile
+from .search import get_search_backend
+from .trending import atrending_posts, parse_category
+
+arender = sync_to_async(render)
+
+
+async def alist(queryset):
+    return [item async for item in queryset]
+
+
+@login_required
+@query_budget(4)
+async def profile_view(request, username=None):
+    if request.method == "POST":
+        return await sync_to_async(views.profile_view)(request, username)
+
+    user = await request.auser()
+    lookup = {"username": username} if username else {"id": user.id}
+    page = await aload_profile(user, decode_cursor(request.GET.get("before")), **lookup)
+    profile_user = page.user
+
+    form = ProfileForm(instance=page.profile) if user == profile_user else None
+
+    return await arender(request, "accounts/profile.html", {
+        "profile_user": profile_user,
+        "profile": page.profile,
+        "posts": page.posts,
+        "next_cursor": page.next_cursor,
+        "follower_count": page.follower_count,
+        "following_count": page.following_count,
+        "total_posts": page.post_count,
+        "form": form,
+        "is_following": page.is_following,
+        "header_version": page.header_version,
+    })
+
+
+@login_required
+@query_budget(7)
+async def feed(request):
+    user = await request.auser()
+    posts, next_cursor = await aget_feed_page(user)
+    posts = await ahydrate_posts(posts, user, comments_per_post=0)
+
+    return await arender(request, "accounts/feed.html", {
+        "posts": posts,
+        "next_cursor": next_cursor,
+    })
+
+
+@login_required
+@query_budget(7)
+async def trending(request):
+    user = await request.auser()
+    category = parse_category(request.GET.get("category"))
+    posts = await ahydrate_posts(await atrending_posts(category), user, comments_per_post=0)
+
+    return await arender(request, "accounts/trending.html", {
+        "posts": posts,
+        "category": category,
+        "categories": Post.CATEGORY_CHOICES,
+    })
+
+
+@login_required
+@query_budget(4)
+async def musician_detail(request, user_id):
+    if request.method == "POST":
+        return await sync_to_async(views.musician_detail)(request, user_id)
+
+    user = await request.auser()
+    page = await aload_profile(user, decode_cursor(request.GET.get("before")), id=user_id)
+
+    return await arender(request, "accounts/musician_detail.html", {
+        "musician": page.user,
+        "profile": page.profile,
+        "posts": page.posts,
+        "next_cursor": page.next_cursor,
+        "is_following": page.is_following,
+        "total_posts": page.post_count,
+        "follower_count": page.follower_count,
+        "following_count": page.following_count,
+        "header_version": page.header_version,
+    })
+
+
+@query_budget(7)
+async def search_musicians(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        page_number = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page_number = 1
+
+    filters = {
+        Facet.INSTRUMENT: normalize_facet(request.GET.get("instrument")),
+        Facet.LOCATION: normalize_facet(request.GET.get("location")),
+    }
+    # The search backends run raw SQL, so they go through the sync bridge.
+    page, instrument_facets, location_facets = await asyncio.gather(
+        sync_to_async(get_search_backend().search)(query, page=page_number, filters=filters),
+        sync_to_async(facet_counts_within)(Facet.INSTRUMENT, filters),
+        sync_to_async(facet_counts_within)(Facet.LOCATION, filters),
+    )
+
+    return await arender(request, "accounts/search.html", {
+        "query": query,
+        "results": page.results,
+        "page": page,
+        "filters": filters,
+        "instrument_facets": instrument_facets,
+        "location_facets": location_facets,
+    })
+
+
+@login_required
+@query_budget(7)
+async def view_post(request, post_id):
+    if request.method == "POST":
+        return await sync_to_async(views.view_post)(request, post_id)
+
+    user = await request.auser()
+    post = await aget_object_or_404(Post, id=post_id)
+    liked, post_comments = await asyncio.gather(
+        Like.objects.filter(post=post, user=user).aexists(),
+        alist(Comment.objects.filter(post=post).select_related('user__profile').order_by('created_at')),
+    )
+    post.is_liked_by_user = likebuffer.liked(user.id, post.id, liked)
+    post.like_count += likebuffer.pending_change(post.id)
+
+    return await arender(request, "accounts/view_post.html", {
+        'post': post,
+        'comment_form': CommentForm(),
+        'comments': post_comments,
+    })
@@ -0,0 +1,91 @@
+"""
+Logged-in users served from the cache.
+
+Django's ``AuthenticationMiddleware`` loads ``request.user`` from the
+database on every request. ``CachedAuthenticationMiddleware`` keeps the user
+in the cache for ``AUTH_USER_CACHE_TIMEOUT`` seconds instead. Saving or
+deleting a user drops its entry once the transaction commits, so profile
+edits and password changes take effect on the next request. Anything
+unusual (no session, an unknown backend, a session auth hash that doesn't
+match the cached user) falls back to ``django.contrib.auth``. Async views
+get the same through ``await request.auser()``.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+def get_timeout():
+    return getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 300)
+
+
+def user_cache_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def get_user(request):
+    """Like ``django.contrib.auth.get_user``, but try the cache before the database."""
+    user_id = request.session.get(SESSION_KEY)
+    backend_path = request.session.get(BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if user is not None and session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, get_timeout())
+    return user
+
+
+async def aget_user(request):
+    """Async ``get_user``, for ``request.auser()``."""
+    user_id = await request.session.aget(SESSION_KEY)
+    backend_path = await request.session.aget(BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return await auth.aget_user(request)
+
+    key = user_cache_key(user_id)
+    user = await cache.aget(key)
+    session_hash = await request.session.aget(HASH_SESSION_KEY)
+    if user is not None and session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+
+    user = await auth.aget_user(request)
+    if user.is_authenticated:
+        await cache.aset(key, user, get_timeout())
+    return user
+
+
+def forget_user(user_id):
+    key = user_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+
+        def cached_user():
+            # Memoized per request, as in AuthenticationMiddleware.
+            if not hasattr(request, "_cached_user"):
+                request._cached_user = get_user(request)
+            return request._cached_user
+
+        async def acached_user():
+            # Shares the memo with request.user, so either loads the user once.
+            if not hasattr(request, "_cached_user"):
+                request._cached_user = await aget_user(request)
+            return request._cached_user
+
+        request.user = SimpleLazyObject(cached_user)
+        request.auser = acached_user
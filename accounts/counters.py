@@ -0,0 +1,82 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .fragments import bump_rows
+from .models import Comment, Follow, Like, Post, Profile
+from .trending import adjusted_score
+
+
+def adjusted(name, delta):
+    """
+    An update expression adding ``delta`` to the counter ``name``, never going below zero.
+
+    A counter that has drifted to zero would otherwise fail the unsigned
+    column's check on the next decrement, and with it the user's delete.
+    """
+    if delta >= 0:
+        return F(name) + delta
+    return Greatest(F(name) + delta, Value(0))
+
+
+def adjust_profile(user_id, **deltas):
+    """Atomically add ``deltas`` (e.g. ``follower_count=1``) to a user's profile counters."""
+    Profile.objects.filter(user_id=user_id).update(
+        **{name: adjusted(name, delta) for name, delta in deltas.items()}
+    )
+
+
+def adjust_post(post_id, **deltas):
+    """
+    Atomically add ``deltas`` (e.g. ``like_count=-1``) to a post's counters.
+
+    ``trending_score`` may be adjusted too. None of them drops below zero.
+    """
+    Post.objects.filter(pk=post_id).update(
+        **{
+            name: adjusted_score(delta) if name == "trending_score" else adjusted(name, delta)
+            for name, delta in deltas.items()
+        }
+    )
+
+
+def _count_of(source, field, outer):
+    """Correlated ``COUNT(*)`` of ``source`` rows whose ``field`` equals the outer row's ``outer``."""
+    counts = (
+        source.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+# (model, counter, counted model, its column, matching column on the model)
+COUNTERS = [
+    (Profile, "follower_count", Follow, "following", "user"),
+    (Profile, "following_count", Follow, "follower", "user"),
+    (Profile, "post_count", Post, "author", "user"),
+    (Post, "like_count", Like, "post", "pk"),
+    (Post, "comment_count", Comment, "post", "pk"),
+]
+
+
+def reconcile(dry_run=False, only=None):
+    """
+    Recompute every counter from the source tables and fix rows that drifted.
+
+    ``only`` limits it to some counters, e.g. ``["Post.like_count"]``.
+    Returns a ``{"Model.field": rows_fixed}`` mapping.
+    """
+    drift = {}
+    for model, name, source, field, outer in COUNTERS:
+        if only is not None and f"{model.__name__}.{name}" not in only:
+            continue
+        actual = _count_of(source, field, outer)
+        stale = model.objects.annotate(actual=actual).exclude(**{name: F("actual")})
+        stale_ids = list(stale.values_list("pk", flat=True))
+        drift[f"{model.__name__}.{name}"] = len(stale_ids)
+        if stale_ids and not dry_run:
+            model.objects.filter(pk__in=stale_ids).update(**{name: actual})
+            bump_rows(model, stale_ids)
+    return drift
@@ -0,0 +1,98 @@
+"""
+Instrument and location facets for musician discovery.
+
+Each profile stores normalized ``instrument_key``/``location_key`` columns
+(see ``Profile.save``) and ``Facet`` rows hold precomputed profile counts per
+key, adjusted by accounts.signals whenever a profile's keys change.
+"""
+from django.db.models import Count, F
+
+from .counters import adjusted
+from .models import Facet, Profile
+
+KEY_FIELDS = {
+    Facet.INSTRUMENT: "instrument_key",
+    Facet.LOCATION: "location_key",
+}
+
+
+def adjust(kind, key, label, delta):
+    if not key:
+        return
+    if delta > 0:
+        Facet.objects.get_or_create(kind=kind, key=key, defaults={"label": label.strip()[:100]})
+    Facet.objects.filter(kind=kind, key=key).update(profile_count=adjusted("profile_count", delta))
+
+
+def profile_changed(old_keys, profile):
+    """Move facet counts from a profile's previously stored keys to its current ones."""
+    old_instrument, old_location = old_keys
+    if old_instrument != profile.instrument_key:
+        adjust(Facet.INSTRUMENT, old_instrument, "", -1)
+        adjust(Facet.INSTRUMENT, profile.instrument_key, profile.instrument, 1)
+    if old_location != profile.location_key:
+        adjust(Facet.LOCATION, old_location, "", -1)
+        adjust(Facet.LOCATION, profile.location_key, profile.location, 1)
+
+
+def top_facets(kind, limit=20):
+    """The most common values of a facet, read straight from the precomputed counts."""
+    return list(
+        Facet.objects.filter(kind=kind, profile_count__gt=0)
+        .order_by("-profile_count", "label")[:limit]
+    )
+
+
+def facet_counts_within(kind, filters, limit=20):
+    """
+    Counts for ``kind`` among profiles matching the other selected facets.
+
+    ``filters`` maps facet kinds to selected keys. With no other facet
+    selected the precomputed counts are returned; otherwise the counts come
+    from a GROUP BY over the (instrument_key, location_key) index.
+    """
+    others = {KEY_FIELDS[k]: v for k, v in filters.items() if k != kind and v}
+    if not others:
+        return top_facets(kind, limit)
+
+    key_field = KEY_FIELDS[kind]
+    rows = (
+        Profile.objects.filter(**others).exclude(**{key_field: ""})
+        .values(key_field)
+        .annotate(total=Count("id"))
+        .order_by("-total", key_field)[:limit]
+    )
+    labels = dict(
+        Facet.objects.filter(kind=kind, key__in=[row[key_field] for row in rows]).values_list("key", "label")
+    )
+    return [
+        Facet(kind=kind, key=row[key_field], label=labels.get(row[key_field], row[key_field]), profile_count=row["total"])
+        for row in rows
+    ]
+
+
+def profile_filters(filters):
+    """Translate ``{kind: key}`` selections into ``Profile`` column lookups."""
+    return {KEY_FIELDS[kind]: key for kind, key in filters.items() if key}
+
+
+def rebuild():
+    """Recompute every facet count from the profiles table. Returns the number of facets."""
+    Facet.objects.all().delete()
+    facets = []
+    for kind, key_field in KEY_FIELDS.items():
+        label_field = key_field.removesuffix("_key")
+        rows = (
+            Profile.objects.exclude(**{key_field: ""})
+            .values(key_field)
+            .annotate(total=Count("id"), label=F(label_field))
+        )
+        seen = {}
+        for row in rows.order_by(key_field):
+            seen.setdefault(row[key_field], [row["label"].strip()[:100], 0])[1] += row["total"]
+        facets.extend(
+            Facet(kind=kind, key=key, label=label, profile_count=total)
+            for key, (label, total) in seen.items()
+        )
+    Facet.objects.bulk_create(facets)
+    return len(facets)
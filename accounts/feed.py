@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from . import timeline
+from .models import Follow, Post
+from .pagination import akeyset_page, keyset_page
+
+
+def get_page_size():
+    return getattr(settings, "FEED_PAGE_SIZE", 20)
+
+
+def feed_queryset(user):
+    """Posts by the people ``user`` follows, plus their own posts."""
+    followed_ids = Follow.objects.filter(follower=user).values("following_id")
+    return Post.objects.filter(
+        Q(author_id__in=followed_ids) | Q(author=user)
+    ).select_related("author", "author__profile")
+
+
+def get_feed_page(user, cursor=None, limit=None):
+    """Return ``(posts, next_cursor)`` for one page of the user's home feed."""
+    limit = limit or get_page_size()
+    if timeline.is_enabled():
+        return timeline.get_timeline_page(user, cursor, limit)
+    return keyset_page(feed_queryset(user), cursor, limit)
+
+
+async def aget_feed_page(user, cursor=None, limit=None):
+    """Async ``get_feed_page``."""
+    limit = limit or get_page_size()
+    if timeline.is_enabled():
+        # Each timeline query depends on the one before; nothing to overlap.
+        return await sync_to_async(timeline.get_timeline_page)(user, cursor, limit)
+    return await akeyset_page(feed_queryset(user), cursor, limit)
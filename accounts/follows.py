@@ -0,0 +1,77 @@
+"""
+The set of users a viewer follows.
+
+``following_ids`` loads it once per request: the set is memoized on the
+user object, which ``CachedAuthenticationMiddleware`` creates afresh for
+each request. Between requests it is kept in the cache for
+``FOLLOW_SET_CACHE_TIMEOUT`` seconds and dropped whenever the user follows
+or unfollows someone. Checking any number of profiles then costs at most
+one query.
+
+Dropping the entry only reaches other workers through a shared cache. With
+the local-memory cache they keep their copy until it expires, which is why
+the timeout defaults to a few minutes unless ``CACHE_URL`` is set.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+MEMO_ATTRIBUTE = "_following_ids"
+
+
+def get_timeout():
+    return getattr(settings, "FOLLOW_SET_CACHE_TIMEOUT", 300)
+
+
+def follow_set_key(user_id):
+    return f"following-ids:{user_id}"
+
+
+def following_ids(user):
+    """Return a frozenset of the IDs ``user`` follows (empty for anonymous users)."""
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, MEMO_ATTRIBUTE, None)
+    if ids is None:
+        key = follow_set_key(user.pk)
+        cached = cache.get(key)
+        if cached is None:
+            cached = list(Follow.objects.filter(follower_id=user.pk).values_list("following_id", flat=True))
+            cache.set(key, cached, get_timeout())
+        ids = frozenset(cached)
+        setattr(user, MEMO_ATTRIBUTE, ids)
+    return ids
+
+
+async def afollowing_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, MEMO_ATTRIBUTE, None)
+    if ids is None:
+        key = follow_set_key(user.pk)
+        cached = await cache.aget(key)
+        if cached is None:
+            cached = [pk async for pk in Follow.objects.filter(follower_id=user.pk).values_list("following_id", flat=True)]
+            await cache.aset(key, cached, get_timeout())
+        ids = frozenset(cached)
+        setattr(user, MEMO_ATTRIBUTE, ids)
+    return ids
+
+
+def is_following(user, target):
+    """Whether ``user`` follows ``target``, a user or a user ID."""
+    target_id = getattr(target, "pk", target)
+    return target_id in following_ids(user)
+
+
+async def ais_following(user, target):
+    target_id = getattr(target, "pk", target)
+    return target_id in await afollowing_ids(user)
+
+
+def forget(user_id):
+    """Drop the cached follow set of ``user_id`` once the current transaction commits."""
+    key = follow_set_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -1,7 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import UploadedFile
 from .models import Profile,Post,Comment
+from .uploads import check_image_upload
+
+
+class LimitedImageField(forms.ImageField):
+    """ImageField that enforces the upload byte and pixel limits before Pillow verifies the file."""
+
+    def to_python(self, data):
+        if isinstance(data, UploadedFile):
+            check_image_upload(data)
+        return super().to_python(data)
+
 
 class SignUpForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -14,11 +26,13 @@ class ProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ("instrument", "location", "bio", "avatar")
+        field_classes = {"avatar": LimitedImageField}
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ["title", "description", "category","image"]
+        field_classes = {"image": LimitedImageField}
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -30,4 +44,5 @@ class CommentForm(forms.ModelForm):
 class EditProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['avatar', 'bio']
\ No newline at end of file
+        fields = ['avatar', 'bio']
+        field_classes = {'avatar': LimitedImageField}
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Version numbers for cached template fragments.
+
+Post cards and profile headers are cached with ``{% cache %}`` under keys
+that include a version read from the cache itself, bumped after the
+transaction that changes what a fragment shows commits. There are three
+kinds:
+
+- ``post``: a post's content and its like and comment counts.
+- ``author``: what a post card shows of its author (username and avatar).
+  Only profile and user edits bump it, so follows and new posts leave
+  every card by that author alone.
+- ``profile``: a profile page header, which also shows follower, following
+  and post counts.
+
+After a bump the next render misses and stores a fresh fragment, while
+the old one simply ages out. A version that has been evicted is recreated
+with a new value, so an evicted version can never resurrect a stale
+fragment.
+
+Fragments are kept for ``FRAGMENT_CACHE_TIMEOUT`` seconds (templates get it
+as ``fragment_cache_timeout``). A bump only reaches the processes that share
+its cache: with the local-memory backend every other worker keeps serving
+its own copy until it expires, which is why the timeout is short unless a
+shared cache is configured.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Post, Profile
+
+
+def get_timeout():
+    """Seconds a cached fragment is kept."""
+    return getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 60)
+
+
+def fragment_cache(request):
+    """Context processor making ``FRAGMENT_CACHE_TIMEOUT`` available to ``{% cache %}`` tags."""
+    return {"fragment_cache_timeout": get_timeout()}
+
+
+def _key(kind, pk):
+    return f"fragment-version:{kind}:{pk}"
+
+
+def versions(kind, pks):
+    """Return ``{pk: version}``, creating versions for any that are missing."""
+    keys = {_key(kind, pk): pk for pk in set(pks)}
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def post_versions(posts):
+    """``{post_id: (post version, author version)}`` for each post card."""
+    own = versions("post", [post.id for post in posts])
+    authors = versions("author", [post.author_id for post in posts if post.author_id])
+    return {post.id: (own[post.id], authors.get(post.author_id, 0)) for post in posts}
+
+
+def profile_version(user_id):
+    return versions("profile", [user_id])[user_id]
+
+
+# The cache's own aget_many() and aset_many() take a trip to a thread per
+# key, so the async versions run the sync ones in a single trip.
+apost_versions = sync_to_async(post_versions)
+aprofile_version = sync_to_async(profile_version)
+
+
+def bump(kind, pk):
+    """Invalidate fragments for one object once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(_key(kind, pk), time.time_ns(), None))
+
+
+def bump_post(post_id):
+    bump("post", post_id)
+
+
+def bump_profile(user_id):
+    """Invalidate ``user_id``'s profile header, e.g. when their counts change."""
+    bump("profile", user_id)
+
+
+def bump_author(user_id):
+    """Invalidate ``user_id``'s profile header and every post card they appear on."""
+    bump("profile", user_id)
+    bump("author", user_id)
+
+
+def bump_rows(model, pks):
+    """
+    Invalidate fragments for ``Post`` or ``Profile`` rows changed by a queryset ``update()``.
+
+    Such an update may have changed a profile's avatar as well as its
+    counts, so profiles are bumped as authors too.
+    """
+    if model is Post:
+        for pk in pks:
+            bump_post(pk)
+    elif model is Profile:
+        for user_id in Profile.objects.filter(pk__in=pks).values_list("user_id", flat=True):
+            bump_author(user_id)
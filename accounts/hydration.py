@@ -0,0 +1,113 @@
+"""
+Attach viewer-specific and related data to a page of posts in a fixed number
+of queries, however many posts the page holds.
+
+``ahydrate_posts`` is the async version for async views; it gathers the likes
+query, the comments query and the cache lookup.
+"""
+import asyncio
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import likebuffer
+from .fragments import apost_versions, post_versions
+from .models import Comment, Like
+
+
+def get_comments_per_post():
+    return getattr(settings, "COMMENTS_PER_POST", 3)
+
+
+def liked_post_ids(viewer, post_ids):
+    if not viewer.is_authenticated or not post_ids:
+        return set()
+    return likebuffer.overlay(viewer.pk, set(liked_post_ids_queryset(viewer, post_ids)), post_ids)
+
+
+def liked_post_ids_queryset(viewer, post_ids):
+    return Like.objects.filter(user=viewer, post_id__in=post_ids).values_list("post_id", flat=True)
+
+
+async def aliked_post_ids(viewer, post_ids):
+    if not viewer.is_authenticated or not post_ids:
+        return set()
+    liked = {post_id async for post_id in liked_post_ids_queryset(viewer, post_ids)}
+    return likebuffer.overlay(viewer.pk, liked, post_ids)
+
+
+def latest_comments_queryset(post_ids, per_post):
+    return (
+        Comment.objects.filter(post_id__in=post_ids)
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=F("post_id"),
+            order_by=[F("created_at").desc(), F("id").desc()],
+        ))
+        .filter(rank__lte=per_post)
+        .select_related("user", "user__profile")
+        .order_by("post_id", "rank")
+    )
+
+
+def latest_comments(post_ids, per_post):
+    """Return ``{post_id: [comment, ...]}`` with the newest ``per_post`` comments of each post."""
+    if not post_ids or per_post <= 0:
+        return {}
+    comments_by_post = defaultdict(list)
+    for comment in latest_comments_queryset(post_ids, per_post):
+        comments_by_post[comment.post_id].append(comment)
+    return comments_by_post
+
+
+async def alatest_comments(post_ids, per_post):
+    if not post_ids or per_post <= 0:
+        return {}
+    comments_by_post = defaultdict(list)
+    async for comment in latest_comments_queryset(post_ids, per_post):
+        comments_by_post[comment.post_id].append(comment)
+    return comments_by_post
+
+
+def hydrate_posts(posts, viewer, comments_per_post=None):
+    """
+    Set ``is_liked_by_user``, ``recent_comments``, ``fragment_version`` and ``author_version`` on every post.
+
+    Costs at most two queries: one for the viewer's likes and one for the
+    latest comments (with their authors and profiles) across the whole page.
+    The fragment versions come from the cache. Returns the posts as a list.
+    """
+    posts = list(posts)
+    post_ids = [post.id for post in posts]
+    if comments_per_post is None:
+        comments_per_post = get_comments_per_post()
+
+    liked = liked_post_ids(viewer, post_ids)
+    comments_by_post = latest_comments(post_ids, comments_per_post)
+    versions = post_versions(posts)
+    return attach(posts, liked, comments_by_post, versions)
+
+
+async def ahydrate_posts(posts, viewer, comments_per_post=None):
+    """Async ``hydrate_posts``."""
+    posts = list(posts)
+    post_ids = [post.id for post in posts]
+    if comments_per_post is None:
+        comments_per_post = get_comments_per_post()
+
+    liked, comments_by_post, versions = await asyncio.gather(
+        aliked_post_ids(viewer, post_ids),
+        alatest_comments(post_ids, comments_per_post),
+        apost_versions(posts),
+    )
+    return attach(posts, liked, comments_by_post, versions)
+
+
+def attach(posts, liked, comments_by_post, versions):
+    for post in posts:
+        post.is_liked_by_user = post.id in liked
+        post.recent_comments = comments_by_post.get(post.id, [])
+        post.fragment_version, post.author_version = versions[post.id]
+    return posts
@@ -0,0 +1,266 @@
+"""
+Post-upload image processing.
+
+When a profile avatar or post image changes, the file is handed to a small
+thread pool once the saving transaction commits, so the request returns
+without waiting on Pillow. The worker strips EXIF metadata from the
+original (applying its orientation first) and downscales it to fit
+``IMAGE_MAX_DIMENSION``. It then writes fixed-width renditions next to it:
+one in the original's web format for the ``<img>`` fallback and one per
+``IMAGE_RENDITION_FORMATS`` entry (WebP, AVIF).
+
+What was produced is recorded in the model's ``<field>_variants`` JSON
+column, which the ``{% picture %}`` tag turns into ``srcset`` attributes.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .fragments import bump_rows
+from .models import Post, Profile
+from .uploads import get_max_dimension
+
+logger = logging.getLogger(__name__)
+
+# Image fields that get renditions.
+IMAGE_FIELDS = ((Profile, "avatar"), (Post, "image"))
+
+# Rendition widths per image field; avatars are square crops.
+RENDITIONS = {
+    "avatar": {"widths": (64, 128, 256, 384), "crop": True},
+    "image": {"widths": (320, 640, 1280), "crop": False},
+}
+
+MIME_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp", "avif": "image/avif"}
+EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp", "avif": "avif"}
+# Originals in these formats are re-encoded without their metadata.
+ORIGINAL_FORMATS = {"JPEG": "jpeg", "MPO": "jpeg", "PNG": "png", "WEBP": "webp"}
+SAVE_OPTIONS = {
+    "jpeg": {"quality": 85, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+}
+
+
+def get_worker_count():
+    """Size of the processing pool; 0 processes images inline (used in tests)."""
+    return getattr(settings, "IMAGE_WORKERS", 2)
+
+
+def get_formats():
+    """The modern formats to render, minus any this Pillow build cannot encode."""
+    formats = getattr(settings, "IMAGE_RENDITION_FORMATS", ("webp", "avif"))
+    return [fmt for fmt in formats if fmt in MIME_TYPES and features.check(fmt)]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_worker_count(), thread_name_prefix="images")
+        return _executor
+
+
+def _run(fn, *args):
+    try:
+        return fn(*args)
+    finally:
+        # Worker threads keep their own connection; don't let it go stale.
+        close_old_connections()
+
+
+def submit(fn, *args):
+    """Run ``fn(*args)`` on the image pool and return its ``Future``."""
+    if get_worker_count() > 0:
+        return _get_executor().submit(_run, fn, *args)
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+
+def needs_processing(instance, field_name):
+    name = getattr(instance, field_name).name
+    default = instance._meta.get_field(field_name).default
+    variants = getattr(instance, f"{field_name}_variants") or {}
+    return bool(name) and name != default and variants.get("source") != name
+
+
+def schedule(instance, field_name):
+    """Queue renditions for ``instance.<field_name>`` once the current transaction commits."""
+    if not needs_processing(instance, field_name):
+        return
+    model, pk, name = type(instance), instance.pk, getattr(instance, field_name).name
+    transaction.on_commit(lambda: submit(_process_logged, model, pk, field_name, name))
+
+
+def backfill(force=False):
+    """Process every stored image missing current renditions (all of them with ``force``); returns the count."""
+    futures = []
+    for model, field_name in IMAGE_FIELDS:
+        rows = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+        for instance in rows.only("pk", field_name, f"{field_name}_variants").iterator():
+            if force or needs_processing(instance, field_name):
+                name = getattr(instance, field_name).name
+                futures.append(submit(_process_logged, model, instance.pk, field_name, name))
+    return sum(1 for future in futures if future.result() is not None)
+
+
+def _process_logged(model, pk, field_name, name):
+    try:
+        return process(model, pk, field_name, name)
+    except Exception:
+        logger.exception("Processing %s %s failed", field_name, name)
+        raise
+
+
+def process(model, pk, field_name, name):
+    """Strip the original, write its renditions and record them on the row."""
+    storage = model._meta.get_field(field_name).storage
+    if not storage.exists(name):
+        return None
+
+    max_dimension = get_max_dimension()
+    try:
+        with storage.open(name, "rb") as source:
+            image = Image.open(source)
+            original_format = ORIGINAL_FORMATS.get(image.format)
+            oversized = max(image.size) > max_dimension
+            if oversized:
+                # JPEGs can be decoded at a reduced scale, so the full-size
+                # pixels never have to be held in memory.
+                image.draft("RGB", (max_dimension, max_dimension))
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        logger.warning("Skipping unreadable image %s", name)
+        return None
+
+    fallback = "png" if original_format == "png" or _has_alpha(image) else "jpeg"
+    has_metadata = bool(image.getexif()) or "exif" in image.info
+    image = ImageOps.exif_transpose(image)
+    if oversized:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    source = name
+    saved = []
+    try:
+        if (has_metadata or oversized) and original_format:
+            source = storage.save(name, ContentFile(encode(image, original_format)))
+            saved.append(source)
+
+        spec = RENDITIONS[field_name]
+        root, _ = os.path.splitext(name)
+        sources = {}
+        for fmt in [fallback, *get_formats()]:
+            sources[fmt] = []
+            for width in _widths(spec["widths"], image.width):
+                rendition = resize(image, width, spec["crop"])
+                rendition_name = storage.save(
+                    f"{root}.{width}w.{EXTENSIONS[fmt]}", ContentFile(encode(rendition, fmt))
+                )
+                saved.append(rendition_name)
+                sources[fmt].append([width, rendition_name])
+
+        variants = {
+            "source": source,
+            "width": image.width,
+            "height": image.height,
+            "fallback": fallback,
+            "sources": sources,
+        }
+        variants_field = f"{field_name}_variants"
+        previous = model.objects.filter(pk=pk).values_list(variants_field, flat=True).first()
+        updated = model.objects.filter(pk=pk, **{field_name: name}).update(
+            **{field_name: source, variants_field: variants}
+        )
+    except Exception:
+        # Nothing points at what this run wrote yet; release it.
+        for saved_name in saved:
+            storage.delete(saved_name)
+        raise
+    if updated:
+        bump_rows(model, [pk])
+        stale = list(variant_names(previous)) + ([name] if source != name else [])
+    else:
+        # The row was deleted or given another file while this one was processed.
+        stale = saved
+    for stale_name in stale:
+        storage.delete(stale_name)
+    return variants if updated else None
+
+
+def variant_names(variants):
+    for entries in (variants or {}).get("sources", {}).values():
+        for _, name in entries:
+            yield name
+
+
+def replaced(instance, field_name):
+    """After a save, release the file the row pointed at before, if it changed."""
+    field = instance._meta.get_field(field_name)
+    loaded = instance.__dict__.setdefault("_loaded_files", {})
+    old, new = loaded.get(field_name), getattr(instance, field_name).name
+    loaded[field_name] = new
+    if old and old != new and old != field.default:
+        field.storage.delete(old)
+
+    variants_field = f"{field_name}_variants"
+    variants = getattr(instance, variants_field)
+    if not new and variants:
+        # Cleared: nothing will be processed to supersede the old renditions.
+        for name in variant_names(variants):
+            field.storage.delete(name)
+        type(instance).objects.filter(pk=instance.pk).update(**{variants_field: None})
+        setattr(instance, variants_field, None)
+
+
+def discard(instance, field_name):
+    """Release the file and renditions of a deleted row."""
+    field = instance._meta.get_field(field_name)
+    names = list(variant_names(getattr(instance, f"{field_name}_variants")))
+    name = getattr(instance, field_name).name
+    if name and name != field.default:
+        names.append(name)
+    for name in names:
+        field.storage.delete(name)
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def _widths(widths, source_width):
+    """Rendition widths that don't upscale; at least one, capped at the source width."""
+    kept = [width for width in widths if width <= source_width]
+    return kept or [min(widths[0], source_width)]
+
+
+def resize(image, width, crop):
+    if crop:
+        return ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def encode(image, fmt):
+    """Encode ``image`` as ``fmt`` with no metadata attached."""
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
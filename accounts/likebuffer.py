@@ -0,0 +1,372 @@
+"""
+Write-behind likes.
+
+With ``LIKE_WRITE_BEHIND`` on, ``like_toggle`` doesn't write to the
+database. It records the like or unlike in this process's ``LikeBuffer``
+and answers straight away. A flusher thread then applies the net changes
+with ``toggles.set_likes`` every ``LIKE_FLUSH_INTERVAL_MS`` milliseconds,
+or sooner once ``LIKE_FLUSH_BATCH_SIZE`` are waiting. It is one transaction
+per batch, however many likes a popular post got. A like followed by an
+unlike in the same interval never reaches the database.
+
+Until then the buffer answers for its own process. The liker's response
+and the post page they load next show their new state and count, and
+``hydration`` overlays it on their feed. Other workers and other viewers
+catch up at the next flush.
+
+Every intent is appended to a journal segment in ``LIKE_JOURNAL_DIR`` (and
+fsynced unless ``LIKE_JOURNAL_FSYNC`` is off) before it is acknowledged.
+Each flush starts a new segment and deletes the old ones once the batch
+commits. Segments left behind by a process that died are replayed by the
+next buffer to start, or by the ``replay_likes`` command. States are
+absolute ("liked" or "not liked"), so replaying an intent twice is
+harmless. Each intent is journaled and written with the time it was made,
+and ``toggles.set_likes`` skips any that are older than the like or unlike
+already stored for the same user and post. A replay therefore never undoes
+a newer like or unlike made through another process meanwhile.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef
+
+from . import toggles
+from .models import Like, Post
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".journal"
+
+
+def is_enabled():
+    return getattr(settings, "LIKE_WRITE_BEHIND", False)
+
+
+def get_flush_interval():
+    """Seconds between flushes; 0 means no flusher thread (used in tests)."""
+    return getattr(settings, "LIKE_FLUSH_INTERVAL_MS", 1000) / 1000
+
+
+def get_batch_size():
+    return getattr(settings, "LIKE_FLUSH_BATCH_SIZE", 500)
+
+
+def get_journal_dir():
+    return Path(getattr(settings, "LIKE_JOURNAL_DIR", settings.BASE_DIR / "like-journal"))
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Journal:
+    """Append-only segments of ``user_id post_id liked time_ns`` lines, one set per process."""
+
+    def __init__(self, directory, fsync=True):
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self.file = None
+        self.closed = []
+
+    def new_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}-{time.time_ns()}{SUFFIX}"
+        return open(path, "a", encoding="ascii")
+
+    def append(self, user_id, post_id, liked, at):
+        if self.file is None:
+            self.file = self.new_segment()
+        self.file.write(f"{user_id} {post_id} {int(liked)} {at}\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        """Close the current segment; returns every segment not yet discarded."""
+        if self.file is not None:
+            self.file.close()
+            self.closed.append(Path(self.file.name))
+            self.file = None
+        return list(self.closed)
+
+    def discard(self, paths):
+        for path in paths:
+            path.unlink(missing_ok=True)
+            self.closed.remove(path)
+
+    def owns(self, path):
+        return path in self.closed or (self.file is not None and Path(self.file.name) == path)
+
+
+def as_datetime(at):
+    """A ``time.time_ns()`` value as an aware datetime."""
+    return datetime.fromtimestamp(at / 1e9, tz=timezone.utc)
+
+
+def read_segment(path, states):
+    """Add the intents in the segment at ``path`` to ``states`` as ``{key: (liked, time_ns)}``, later ones winning."""
+    # Lines written before intents carried a time are dated by their segment.
+    opened = int(Path(path).stem.split("-", 1)[1])
+    with open(path, encoding="ascii") as f:
+        for line in f:
+            values = line.split()
+            try:
+                user_id, post_id, liked = (int(value) for value in values[:3])
+                at = int(values[3]) if len(values) > 3 else opened
+            except ValueError:
+                # A line cut short by a crash; it was never acknowledged.
+                continue
+            key = (user_id, post_id)
+            if key not in states or states[key][1] <= at:
+                states[key] = (bool(liked), at)
+
+
+def replay(directory=None, everything=False, skip=None):
+    """
+    Apply and delete the journal segments left by processes that have exited.
+
+    With ``everything``, segments of running processes are replayed too,
+    which is only safe once they have stopped taking likes. ``skip`` is a
+    ``Journal`` whose own segments are left alone. Returns the number of
+    intents applied.
+    """
+    directory = Path(directory or get_journal_dir())
+    segments = []
+    for path in sorted(directory.glob(f"*{SUFFIX}"), key=lambda path: path.stat().st_mtime_ns):
+        pid = int(path.name.split("-", 1)[0])
+        if skip is not None and skip.owns(path):
+            continue
+        if not everything and pid != os.getpid() and process_alive(pid):
+            continue
+        segments.append(path)
+
+    states = {}
+    for path in segments:
+        read_segment(path, states)
+    if states:
+        toggles.set_likes(
+            {key: liked for key, (liked, _) in states.items()},
+            {key: as_datetime(at) for key, (_, at) in states.items()},
+        )
+    for path in segments:
+        path.unlink(missing_ok=True)
+    return len(states)
+
+
+class LikeBuffer:
+    def __init__(self, directory=None, flush_interval=None, batch_size=None, fsync=None):
+        if flush_interval is None:
+            flush_interval = get_flush_interval()
+        if fsync is None:
+            fsync = getattr(settings, "LIKE_JOURNAL_FSYNC", True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size or get_batch_size()
+        self.journal = Journal(directory or get_journal_dir(), fsync)
+        # (user_id, post_id) -> [liked in the database, liked now, when (time_ns)]
+        self.pending = {}
+        # post_id -> net change the pending intents make to its like count
+        self.deltas = Counter()
+        # The batch being written, and its changes, until it commits.
+        self.flushing = {}
+        self.flushing_deltas = Counter()
+        # Counts finished flushes, so set_like can tell when its read went stale.
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Replay what crashed processes left behind, then flush in the background."""
+        try:
+            replay(self.journal.directory, skip=self.journal)
+        except Exception:
+            logger.exception("Replaying the like journal failed")
+        if self.flush_interval > 0:
+            self.thread = threading.Thread(target=self.run, name="like-flusher", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+            # This thread keeps its own connection; don't let it go stale.
+            close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def set_like(self, user_id, post_id, liked):
+        """
+        Record that ``user_id`` does or doesn't like ``post_id``; returns ``(changed, like_count)``.
+
+        The count includes this process's pending changes. Raises
+        ``Post.DoesNotExist`` if there is no such post.
+        """
+        key = (user_id, post_id)
+        while True:
+            with self.lock:
+                generation = self.generation
+            row = (
+                Post.objects.filter(id=post_id)
+                .annotate(liked=Exists(Like.objects.filter(post=OuterRef("pk"), user=user_id)))
+                .values_list("like_count", "liked")
+                .first()
+            )
+            if row is None:
+                raise Post.DoesNotExist("No such post.")
+            stored_count, stored = row
+
+            with self.lock:
+                if self.generation != generation:
+                    # A flush finished since the read and may have changed the row.
+                    continue
+                if key in self.flushing:
+                    stored = self.flushing[key][1]
+                entry = self.pending.setdefault(key, [stored, stored, None])
+                if entry[1] == liked:
+                    changed = False
+                else:
+                    entry[2] = time.time_ns()
+                    self.journal.append(user_id, post_id, liked, entry[2])
+                    entry[1] = liked
+                    self.deltas[post_id] += 1 if liked else -1
+                    changed = True
+                if entry[0] == entry[1]:
+                    # Back where the database will be; nothing to write.
+                    del self.pending[key]
+                count = stored_count + self.flushing_deltas[post_id] + self.deltas[post_id]
+                full = len(self.pending) >= self.batch_size
+            break
+
+        if full:
+            if self.thread is not None:
+                self.wake.set()
+            else:
+                self.flush()
+        return changed, count
+
+    def state(self, key):
+        # Caller holds the lock.
+        entry = self.pending.get(key) or self.flushing.get(key)
+        return None if entry is None else entry[1]
+
+    def liked(self, user_id, post_id):
+        """The pending state of ``user_id``'s like of ``post_id``, or None."""
+        with self.lock:
+            return self.state((user_id, post_id))
+
+    def overlay(self, user_id, liked_ids, post_ids):
+        """``liked_ids`` (a set of post IDs) with ``user_id``'s pending likes and unlikes applied."""
+        with self.lock:
+            states = {post_id: self.state((user_id, post_id)) for post_id in post_ids}
+        liked_ids = set(liked_ids)
+        for post_id, liked in states.items():
+            if liked is True:
+                liked_ids.add(post_id)
+            elif liked is False:
+                liked_ids.discard(post_id)
+        return liked_ids
+
+    def pending_change(self, post_id):
+        with self.lock:
+            return self.flushing_deltas[post_id] + self.deltas[post_id]
+
+    def flush(self):
+        """Write the pending intents in one batch; returns how many were written."""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                self.flushing_deltas, self.deltas = self.deltas, Counter()
+                self.flushing = batch
+                segments = self.journal.rotate()
+            try:
+                if batch:
+                    toggles.set_likes(
+                        {key: liked for key, (_, liked, _) in batch.items()},
+                        {key: as_datetime(at) for key, (_, _, at) in batch.items()},
+                    )
+            except Exception:
+                logger.exception("Flushing %d likes failed; keeping them for the next flush", len(batch))
+                written = 0
+            else:
+                written = len(batch)
+            with self.lock:
+                if written or not batch:
+                    self.journal.discard(segments)
+                else:
+                    self.restore(batch)
+                self.flushing = {}
+                self.flushing_deltas = Counter()
+                self.generation += 1
+            return written
+
+    def restore(self, batch):
+        # Caller holds the lock. Intents recorded since the batch was taken are newer and win.
+        for key, entry in batch.items():
+            if key not in self.pending:
+                self.pending[key] = entry
+                self.deltas[key[1]] += int(entry[1]) - int(entry[0])
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """This process's ``LikeBuffer``, started on first use."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = LikeBuffer()
+            _buffer.start()
+            atexit.register(_buffer.stop)
+        return _buffer
+
+
+def stop():
+    """Flush and drop this process's buffer, if it has one."""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        atexit.unregister(buffer.stop)
+        buffer.stop()
+
+
+def liked(user_id, post_id, stored):
+    """Whether ``user_id`` likes ``post_id``, given ``stored``, the database's answer."""
+    if _buffer is None:
+        return stored
+    state = _buffer.liked(user_id, post_id)
+    return stored if state is None else state
+
+
+def overlay(user_id, liked_ids, post_ids):
+    if _buffer is None:
+        return liked_ids
+    return _buffer.overlay(user_id, liked_ids, post_ids)
+
+
+def pending_change(post_id):
+    return 0 if _buffer is None else _buffer.pending_change(post_id)
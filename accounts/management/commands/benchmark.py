@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from resonate import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles and queries per request for the hot pages, optionally against a saved "
+        "baseline. Latency baselines are machine-specific: query counts compare anywhere, but save your own "
+        "baseline on the machine that runs the comparison. To produce one like benchmarks/sqlite-1000.json, "
+        "on an empty database run `seed_data --seed 0` then `benchmark --save baseline.json`; after a change, "
+        "`benchmark --baseline baseline.json`. Differences in machine or dataset are reported as warnings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios", nargs="*", default=benchmark.SCENARIOS,
+            help=f"Scenarios to run (default: all of {', '.join(benchmark.SCENARIOS)}).",
+        )
+        parser.add_argument("--iterations", type=int, default=50, help="Recorded requests per scenario (default: 50).")
+        parser.add_argument(
+            "--concurrency", type=int, default=0,
+            help="Send this many requests at once through the ASGI handler and report requests/s "
+                 "(default: 0, one at a time through the test client).",
+        )
+        parser.add_argument("--warmup", type=int, default=5, help="Unrecorded requests per scenario first (default: 5).")
+        parser.add_argument("--viewers", type=int, default=10, help="Distinct logged-in users to cycle through (default: 10).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for picking viewers.")
+        parser.add_argument("--cold", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument("--save", metavar="PATH", help="Write the results to PATH as a JSON baseline.")
+        parser.add_argument("--baseline", metavar="PATH", help="Fail if the results regress against this baseline.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="Allowed p95 slowdown against the baseline, as a fraction (default: 0.25).",
+        )
+        parser.add_argument(
+            "--min-delta-ms", type=float, default=1.0,
+            help="Ignore p95 slowdowns smaller than this many milliseconds (default: 1).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options["concurrency"]:
+                report = benchmark.run_concurrent(
+                    scenarios=options["scenarios"],
+                    iterations=options["iterations"],
+                    concurrency=options["concurrency"],
+                    viewers=options["viewers"],
+                    seed=options["seed"],
+                )
+            else:
+                report = benchmark.run(
+                    scenarios=options["scenarios"],
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    viewers=options["viewers"],
+                    seed=options["seed"],
+                    cold=options["cold"],
+                )
+        except benchmark.BenchmarkError as e:
+            raise CommandError(e)
+
+        last = "rps" if options["concurrency"] else "queries"
+        self.stdout.write(f"{'scenario':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{last:>9}")
+        for name, result in report["results"].items():
+            self.stdout.write(
+                f"{name:<18}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}{result[last]:>9}"
+            )
+
+        if options["save"]:
+            benchmark.save(report, options["save"])
+            self.stdout.write(f"Saved baseline to {options['save']}.")
+
+        if options["baseline"]:
+            baseline = benchmark.load(options["baseline"])
+            for difference in benchmark.mismatches(report, baseline):
+                self.stderr.write(self.style.WARNING(f"Not comparable: {difference}"))
+            regressions = benchmark.compare(
+                report, baseline,
+                tolerance=options["tolerance"], min_delta_ms=options["min_delta_ms"],
+            )
+            if regressions:
+                raise CommandError("Regressed against baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from accounts.trending import decay, get_decay_interval, rebuild
+
+
+class Command(BaseCommand):
+    help = "Decay trending scores by one interval, or rebuild them from likes and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=float,
+            help=f"Time since the last decay (default: TRENDING_DECAY_INTERVAL, {get_decay_interval()}).",
+        )
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Recompute every score from the likes and comments tables instead.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            scored = rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores for {scored} posts."))
+        else:
+            decayed = decay(options["minutes"])
+            self.stdout.write(self.style.SUCCESS(f"Decayed {decayed} trending scores."))
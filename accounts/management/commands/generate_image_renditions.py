@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts import images
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and WebP/AVIF renditions for avatars and post images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Regenerate renditions for every image, not just new ones.",
+        )
+
+    def handle(self, *args, **options):
+        total = images.backfill(force=options["force"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} images."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts import facets
+
+
+class Command(BaseCommand):
+    help = "Recompute instrument and location facet counts from the profiles table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} facets."))
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's materialized home timeline from the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild the timeline of this username.")
+        parser.add_argument(
+            "--depth", type=int, default=500,
+            help="Number of most recent posts to keep per timeline (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        rebuilt = entries = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                entries += rebuild_timeline(user, options["depth"])
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines ({entries} entries)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized follower, post, like and comment counters and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report how many rows have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options["dry_run"])
+        for counter, rows in drift.items():
+            self.stdout.write(f"{counter}: {rows} row{'s' if rows != 1 else ''} drifted")
+
+        total = sum(drift.values())
+        if options["dry_run"]:
+            self.stdout.write(f"Dry run: {total} rows would be fixed.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {total} rows."))
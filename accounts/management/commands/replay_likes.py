@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from accounts.counters import reconcile
+from accounts.likebuffer import get_journal_dir, replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply write-behind like intents left in the journal by processes that exited "
+        "without flushing, then fix any drift in post like counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Also replay segments of processes that are still running; only once they have stopped.",
+        )
+        parser.add_argument("--journal-dir", help=f"Journal directory (default: {get_journal_dir()}).")
+        parser.add_argument(
+            "--no-reconcile", action="store_false", dest="reconcile",
+            help="Skip recomputing like counts afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        intents = replay(options["journal_dir"], everything=options["all"])
+        self.stdout.write(f"Replayed {intents} like intent{'s' if intents != 1 else ''}.")
+
+        if options["reconcile"]:
+            rows = sum(reconcile(only=["Post.like_count"]).values())
+            self.stdout.write(f"Post.like_count: {rows} row{'s' if rows != 1 else ''} drifted")
+        self.stdout.write(self.style.SUCCESS("Done."))
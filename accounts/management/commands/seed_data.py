@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from resonate import synthetic
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, follows, posts, likes, comments and chats for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Number of users to create (default: 1000).")
+        parser.add_argument("--follows", type=float, default=30, help="Mean follows per user (default: 30).")
+        parser.add_argument("--posts", type=float, default=5, help="Mean posts per user (default: 5).")
+        parser.add_argument("--likes", type=float, default=8, help="Mean likes per post (default: 8).")
+        parser.add_argument("--comments", type=float, default=3, help="Mean comments per post (default: 3).")
+        parser.add_argument("--threads", type=float, default=3, help="Mean chat threads started per user (default: 3).")
+        parser.add_argument("--messages", type=float, default=20, help="Mean messages per thread (default: 20).")
+        parser.add_argument("--days", type=int, default=90, help="Spread activity over this many days (default: 90).")
+        parser.add_argument("--prefix", default="synth", help="Username prefix (default: synth).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; equal seeds give equal data.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT (default: 1000).")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options["prefix"]).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pick another --prefix.")
+
+        counts = synthetic.generate(
+            users=options["users"],
+            follows=options["follows"],
+            posts=options["posts"],
+            likes=options["likes"],
+            comments=options["comments"],
+            threads=options["threads"],
+            messages=options["messages"],
+            days=options["days"],
+            prefix=options["prefix"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        for table, rows in counts.items():
+            self.stdout.write(f"{table}: {rows}")
+        self.stdout.write(self.style.SUCCESS(
+            "Done. Run rebuild_timelines if FEED_FANOUT is on."
+        ))
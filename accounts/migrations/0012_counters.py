@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:23
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field, outer):
+    counts = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    Post = apps.get_model('accounts', 'Post')
+    Follow = apps.get_model('accounts', 'Follow')
+    Like = apps.get_model('accounts', 'Like')
+    Comment = apps.get_model('accounts', 'Comment')
+
+    Profile.objects.update(
+        follower_count=count_of(Follow, 'following', 'user'),
+        following_count=count_of(Follow, 'follower', 'user'),
+        post_count=count_of(Post, 'author', 'user'),
+    )
+    Post.objects.update(
+        like_count=count_of(Like, 'post', 'pk'),
+        comment_count=count_of(Comment, 'post', 'pk'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
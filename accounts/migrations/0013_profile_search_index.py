@@ -0,0 +1,141 @@
+from django.db import migrations
+
+# Full-text index over username, instrument, location and bio. PostgreSQL gets
+# a weighted tsvector column plus a trigram index on usernames; SQLite gets an
+# FTS5 table. Both are kept current by triggers so no application code has to
+# remember to reindex a profile. Other backends fall back to a LIKE scan.
+#
+# A later migration that makes Django rebuild accounts_profile on SQLite must
+# run SQLITE_DROP_TRIGGERS before the rebuild and SQLITE_TRIGGERS after it.
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE accounts_profile ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION accounts_profile_search_vector(profile accounts_profile) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(u.username, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(profile.instrument, '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(profile.location, '')), 'C')
+            || setweight(to_tsvector('simple', coalesce(profile.bio, '')), 'D')
+        FROM auth_user u WHERE u.id = profile.user_id
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION accounts_profile_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := accounts_profile_search_vector(NEW);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER accounts_profile_search_trigger
+        BEFORE INSERT OR UPDATE OF instrument, location, bio, user_id ON accounts_profile
+        FOR EACH ROW EXECUTE FUNCTION accounts_profile_search_update()
+    """,
+    """
+    CREATE FUNCTION accounts_user_search_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE accounts_profile SET search_vector = accounts_profile_search_vector(accounts_profile)
+        WHERE user_id = NEW.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER accounts_user_search_trigger
+        AFTER UPDATE OF username ON auth_user
+        FOR EACH ROW EXECUTE FUNCTION accounts_user_search_update()
+    """,
+    "UPDATE accounts_profile SET search_vector = accounts_profile_search_vector(accounts_profile)",
+    "CREATE INDEX accounts_profile_search_idx ON accounts_profile USING gin (search_vector)",
+    "CREATE INDEX accounts_user_username_trgm_idx ON auth_user USING gin (username gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS accounts_user_username_trgm_idx",
+    "DROP TRIGGER IF EXISTS accounts_user_search_trigger ON auth_user",
+    "DROP FUNCTION IF EXISTS accounts_user_search_update()",
+    "DROP TRIGGER IF EXISTS accounts_profile_search_trigger ON accounts_profile",
+    "DROP FUNCTION IF EXISTS accounts_profile_search_update()",
+    "DROP FUNCTION IF EXISTS accounts_profile_search_vector(accounts_profile)",
+    "ALTER TABLE accounts_profile DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER accounts_profile_fts_insert AFTER INSERT ON accounts_profile BEGIN
+        INSERT INTO accounts_profile_fts (rowid, username, instrument, location, bio)
+        SELECT NEW.id, username, NEW.instrument, NEW.location, NEW.bio FROM auth_user WHERE id = NEW.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_profile_fts_update AFTER UPDATE OF instrument, location, bio, user_id ON accounts_profile BEGIN
+        DELETE FROM accounts_profile_fts WHERE rowid = OLD.id;
+        INSERT INTO accounts_profile_fts (rowid, username, instrument, location, bio)
+        SELECT NEW.id, username, NEW.instrument, NEW.location, NEW.bio FROM auth_user WHERE id = NEW.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_profile_fts_delete AFTER DELETE ON accounts_profile BEGIN
+        DELETE FROM accounts_profile_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_user_fts_update AFTER UPDATE OF username ON auth_user BEGIN
+        UPDATE accounts_profile_fts SET username = NEW.username
+        WHERE rowid IN (SELECT id FROM accounts_profile WHERE user_id = NEW.id);
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS accounts_user_fts_update",
+    "DROP TRIGGER IF EXISTS accounts_profile_fts_delete",
+    "DROP TRIGGER IF EXISTS accounts_profile_fts_update",
+    "DROP TRIGGER IF EXISTS accounts_profile_fts_insert",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE accounts_profile_fts USING fts5(
+        username, instrument, location, bio,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    """
+    INSERT INTO accounts_profile_fts (rowid, username, instrument, location, bio)
+    SELECT p.id, u.username, p.instrument, p.location, p.bio
+    FROM accounts_profile p JOIN auth_user u ON u.id = p.user_id
+    """,
+]
+
+SQLITE_BACKWARD = [
+    *SQLITE_DROP_TRIGGERS,
+    "DROP TABLE IF EXISTS accounts_profile_fts",
+]
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {"postgresql": postgres, "sqlite": sqlite}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_counters'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:25
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import slugify
+
+search_index = import_module('accounts.migrations.0013_profile_search_index')
+
+
+def sqlite_statements(statements):
+    # Adding the key columns rebuilds accounts_profile on SQLite, which the
+    # full-text triggers from 0013 would not survive.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+drop_search_triggers = sqlite_statements(search_index.SQLITE_DROP_TRIGGERS)
+create_search_triggers = sqlite_statements(search_index.SQLITE_TRIGGERS)
+
+
+def populate_facets(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    Facet = apps.get_model('accounts', 'Facet')
+
+    counts = {}
+    for profile in Profile.objects.only('id', 'instrument', 'location').iterator():
+        instrument_key = slugify(profile.instrument or '')[:100]
+        location_key = slugify(profile.location or '')[:100]
+        Profile.objects.filter(pk=profile.pk).update(instrument_key=instrument_key, location_key=location_key)
+        for kind, key, label in (('instrument', instrument_key, profile.instrument), ('location', location_key, profile.location)):
+            if key:
+                entry = counts.setdefault((kind, key), [label.strip()[:100], 0])
+                entry[1] += 1
+
+    Facet.objects.bulk_create([
+        Facet(kind=kind, key=key, label=label, profile_count=count)
+        for (kind, key), (label, count) in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_profile_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.CreateModel(
+            name='Facet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('instrument', 'Instrument'), ('location', 'Location')], max_length=20)),
+                ('key', models.CharField(max_length=100)),
+                ('label', models.CharField(max_length=100)),
+                ('profile_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='instrument_key',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='location_key',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['instrument_key', 'location_key'], name='profile_instr_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['location_key'], name='profile_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facet',
+            index=models.Index(fields=['kind', '-profile_count'], name='facet_kind_count_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facet',
+            unique_together={('kind', 'key')},
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:41
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def variant_names(variants):
+    for entries in (variants or {}).get("sources", {}).values():
+        for _, name in entries:
+            yield name
+
+
+def count_references(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    Post = apps.get_model('accounts', 'Post')
+    StoredFile = apps.get_model('accounts', 'StoredFile')
+
+    refs = Counter()
+    default_avatar = Profile._meta.get_field('avatar').default
+    for avatar, variants in Profile.objects.values_list('avatar', 'avatar_variants'):
+        if avatar and avatar != default_avatar:
+            refs[avatar] += 1
+        refs.update(variant_names(variants))
+    for image, variants in Post.objects.values_list('image', 'image_variants'):
+        if image:
+            refs[image] += 1
+        refs.update(variant_names(variants))
+
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, refs=count) for name, count in refs.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:24
+
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_scores(apps, schema_editor):
+    # The scoring of accounts.trending.rebuild as of this migration: each like
+    # or comment counts its weight halved once per half-life since it happened.
+    Post = apps.get_model('accounts', 'Post')
+    Like = apps.get_model('accounts', 'Like')
+    Comment = apps.get_model('accounts', 'Comment')
+
+    now = timezone.now()
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 6.0) * 3600
+    min_score = getattr(settings, 'TRENDING_MIN_SCORE', 0.05)
+    weights = (
+        (Like, getattr(settings, 'TRENDING_LIKE_WEIGHT', 1.0)),
+        (Comment, getattr(settings, 'TRENDING_COMMENT_WEIGHT', 3.0)),
+    )
+    halvings = math.log2(max(weight for _, weight in weights) / min_score)
+    horizon = now - timedelta(seconds=half_life * max(halvings, 0))
+
+    scores = defaultdict(float)
+    for model, weight in weights:
+        events = model.objects.filter(created_at__gte=horizon).values_list('post_id', 'created_at')
+        for post_id, created_at in events.iterator():
+            scores[post_id] += weight * 0.5 ** ((now - created_at).total_seconds() / half_life)
+
+    posts = [Post(pk=post_id, trending_score=score) for post_id, score in scores.items() if score >= min_score]
+    Post.objects.bulk_update(posts, ['trending_score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', '-trending_score', '-id'], name='post_category_trending_idx'),
+        ),
+    ]
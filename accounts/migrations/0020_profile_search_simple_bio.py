@@ -0,0 +1,36 @@
+from importlib import import_module
+
+from django.db import migrations
+
+search_index = import_module('accounts.migrations.0013_profile_search_index')
+
+# 0013 first indexed bios with the 'english' config, whose stemmed lexemes
+# ("play") never match the unstemmed 'simple' prefix queries of
+# PostgresSearchBackend ("playing:*"). Redefine the vector with 'simple'
+# throughout, as 0013 now does, and reindex what is already there.
+POSTGRES_FORWARD = [
+    """
+    CREATE OR REPLACE FUNCTION accounts_profile_search_vector(profile accounts_profile) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(u.username, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(profile.instrument, '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(profile.location, '')), 'C')
+            || setweight(to_tsvector('simple', coalesce(profile.bio, '')), 'D')
+        FROM auth_user u WHERE u.id = profile.user_id
+    $$ LANGUAGE sql STABLE
+    """,
+    "UPDATE accounts_profile SET search_vector = accounts_profile_search_vector(accounts_profile)",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_unlike'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            search_index.run_for_vendor(POSTGRES_FORWARD, []),
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -1,5 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.text import slugify
+
+
+def normalize_facet(value):
+    """Normalized key for a free-text instrument or location ("  Electric Guitar" -> "electric-guitar")."""
+    return slugify(value or "")[:100]
+
+
+def _fields_without_counters(instance):
+    """Concrete fields to write on a plain save(), leaving F()-maintained counters alone."""
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.COUNTER_FIELDS
+    ]
 
 
 class Profile(models.Model):
@@ -14,9 +29,49 @@ class Profile(models.Model):
         blank=True, 
         null=True
     )
+    # Renditions written by accounts.images after upload.
+    avatar_variants = models.JSONField(null=True, blank=True, editable=False)
+
+    # Denormalized counters, kept in sync by accounts.signals.
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = ("follower_count", "following_count", "post_count")
+
+    # Normalized facet keys derived from instrument and location on save.
+    instrument_key = models.CharField(max_length=100, blank=True, editable=False)
+    location_key = models.CharField(max_length=100, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["instrument_key", "location_key"], name="profile_instr_location_idx"),
+            models.Index(fields=["location_key"], name="profile_location_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s profile"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored facet keys so signals can move facet counts on change.
+        instance._loaded_facet_keys = (instance.__dict__.get("instrument_key"), instance.__dict__.get("location_key"))
+        # Likewise the stored avatar, so a replaced upload can be released.
+        instance._loaded_files = {"avatar": instance.__dict__.get("avatar")}
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_facet_keys = (self.instrument_key, self.location_key)
+        self._loaded_files = {"avatar": self.avatar.name}
+
+    def save(self, *args, **kwargs):
+        self.instrument_key = normalize_facet(self.instrument)
+        self.location_key = normalize_facet(self.location)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = _fields_without_counters(self)
+        super().save(*args, **kwargs)
     
 class Follow(models.Model):
     follower = models.ForeignKey(User, related_name="following", on_delete=models.CASCADE)
@@ -48,10 +103,46 @@ class Post(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
     image = models.ImageField(upload_to='post_images/', blank=True, null=True) 
+    # Renditions written by accounts.images after upload.
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
+
+    # Denormalized counters, kept in sync by accounts.signals.
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Time-decayed engagement, kept up by accounts.trending.
+    trending_score = models.FloatField(default=0)
+
+    COUNTER_FIELDS = ("like_count", "comment_count", "trending_score")
+
+    class Meta:
+        indexes = [
+            # Profile grids and the home feed, newest first.
+            models.Index(fields=["author", "-created_at", "-id"], name="post_author_recent_idx"),
+            models.Index(fields=["-created_at", "-id"], name="post_recent_idx"),
+            # Trending pages, overall and per category.
+            models.Index(fields=["-trending_score", "-id"], name="post_trending_idx"),
+            models.Index(fields=["category", "-trending_score", "-id"], name="post_category_trending_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username if self.author else 'Deleted User'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file so a replaced image can be released.
+        instance._loaded_files = {"image": instance.__dict__.get("image")}
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_files = {"image": self.image.name}
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = _fields_without_counters(self)
+        super().save(*args, **kwargs)
+
 
 class Like(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
@@ -64,12 +155,83 @@ class Like(models.Model):
     def __str__(self):
         return f"{self.user.username} liked {self.post.title}"
 
+
+class Unlike(models.Model):
+    """
+    When a user last took back a like through ``accounts.toggles``.
+
+    With ``Like.created_at`` it dates the latest write of each like, so a
+    replayed write-behind intent that is older can be skipped.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('post', 'user')
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "created_at", "id"], name="comment_post_time_idx"),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on {self.post.title}"
 
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into one follower's home timeline (fan-out on write)."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("owner", "post")
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-post"], name="timeline_owner_recent_idx"),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
+
+
+class Facet(models.Model):
+    """Precomputed number of profiles sharing a normalized instrument or location."""
+    INSTRUMENT = "instrument"
+    LOCATION = "location"
+    KIND_CHOICES = [
+        (INSTRUMENT, "Instrument"),
+        (LOCATION, "Location"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100)
+    label = models.CharField(max_length=100)
+    profile_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("kind", "key")
+        indexes = [
+            models.Index(fields=["kind", "-profile_count"], name="facet_kind_count_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.label} ({self.profile_count})"
+
+
+class StoredFile(models.Model):
+    """How many rows reference a media file; the file is deleted when this drops to zero."""
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
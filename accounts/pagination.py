@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(timestamp, pk):
+    """Encode a (timestamp, id) pair into an opaque, URL-safe cursor."""
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return the (timestamp, id) pair for a cursor, or None if it is malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, pk = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def seek(queryset, cursor, field="created_at", pk_field="id"):
+    """Order ``queryset`` newest first on (field, pk_field) and skip past ``cursor``."""
+    queryset = queryset.order_by(f"-{field}", f"-{pk_field}")
+    if cursor:
+        timestamp, pk = cursor
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": timestamp}) | Q(**{field: timestamp, f"{pk_field}__lt": pk})
+        )
+    return queryset
+
+
+def seek_after(queryset, cursor, field="created_at", pk_field="id"):
+    """Order ``queryset`` oldest first on (field, pk_field) and keep rows newer than ``cursor``."""
+    queryset = queryset.order_by(field, pk_field)
+    if cursor:
+        timestamp, pk = cursor
+        queryset = queryset.filter(
+            Q(**{f"{field}__gt": timestamp}) | Q(**{field: timestamp, f"{pk_field}__gt": pk})
+        )
+    return queryset
+
+
+def keyset_page(queryset, cursor, limit, field="created_at", pk_field="id"):
+    """
+    Fetch one page of ``queryset`` ordered newest first on (field, pk_field).
+
+    ``cursor`` is a decoded (timestamp, id) pair or None for the first page.
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    items = list(seek(queryset, cursor, field, pk_field)[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), getattr(last, pk_field))
+    return items, next_cursor
+
+
+async def akeyset_page(queryset, cursor, limit, field="created_at", pk_field="id"):
+    """Async ``keyset_page``."""
+    items = [item async for item in seek(queryset, cursor, field, pk_field)[:limit + 1]]
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), getattr(last, pk_field))
+    return items, next_cursor
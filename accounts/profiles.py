@@ -0,0 +1,117 @@
+"""
+Everything a profile page shows, in two queries.
+
+``load_profile`` fetches the user with their profile and whether the viewer
+follows them in one query, via ``select_related`` and an ``Exists``
+annotation. It fetches the first page of their posts in a second query
+that doesn't depend on the first. The follower, following and post counts
+are the profile's denormalized counters (see ``accounts.counters``), so
+they cost nothing extra. Fragment versions come from the cache.
+``aload_profile`` gathers the two queries for async views.
+
+``profile_view`` and ``musician_detail`` both render from a ``ProfilePage``.
+"""
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef, Value
+from django.http import Http404
+
+from .fragments import apost_versions, aprofile_version, post_versions, profile_version
+from .models import Follow, Post, Profile
+from .pagination import akeyset_page, keyset_page
+
+
+def get_page_size():
+    return getattr(settings, "PROFILE_PAGE_SIZE", 24)
+
+
+class ProfilePage:
+    def __init__(self, user, posts, next_cursor, header_version):
+        self.user = user
+        self.profile = user.profile
+        self.is_following = user.viewer_follows
+        self.posts = posts
+        self.next_cursor = next_cursor
+        self.header_version = header_version
+
+    @property
+    def follower_count(self):
+        return self.profile.follower_count
+
+    @property
+    def following_count(self):
+        return self.profile.following_count
+
+    @property
+    def post_count(self):
+        return self.profile.post_count
+
+
+def user_queryset(viewer):
+    """Users with their profile and ``viewer_follows`` annotated."""
+    if viewer.is_authenticated:
+        viewer_follows = Exists(Follow.objects.filter(follower=viewer.pk, following=OuterRef("pk")))
+    else:
+        viewer_follows = Value(False)
+    return User.objects.select_related("profile").annotate(viewer_follows=viewer_follows)
+
+
+def posts_queryset(lookup):
+    """Posts by the user matching ``lookup``, e.g. ``{"username": "ann"}``."""
+    return Post.objects.filter(**{f"author__{field}": value for field, value in lookup.items()})
+
+
+def has_profile(user):
+    # select_related caches a missing profile too, so this never queries.
+    try:
+        user.profile
+    except Profile.DoesNotExist:
+        return False
+    return True
+
+
+def build_page(viewer, user, posts, next_cursor, versions, header_version):
+    if user.pk == viewer.pk:
+        user.viewer_follows = False
+    for post in posts:
+        post.author = user
+        post.fragment_version, post.author_version = versions[post.id]
+    return ProfilePage(user, posts, next_cursor, header_version)
+
+
+def load_profile(viewer, cursor=None, limit=None, **lookup):
+    """
+    Return the ``ProfilePage`` of the user matching ``lookup`` (``username=`` or ``id=``).
+
+    ``cursor`` is a decoded ``(created_at, id)`` pair for older pages of
+    posts. Raises ``Http404`` if there is no such user.
+    """
+    try:
+        user = user_queryset(viewer).get(**lookup)
+    except User.DoesNotExist:
+        raise Http404("No such user.")
+    posts, next_cursor = keyset_page(posts_queryset(lookup), cursor, limit or get_page_size())
+    if not has_profile(user):
+        # Profiles are created along with their user; this only covers old rows.
+        user.profile, _ = Profile.objects.get_or_create(user=user)
+    return build_page(viewer, user, posts, next_cursor, post_versions(posts), profile_version(user.pk))
+
+
+async def aload_profile(viewer, cursor=None, limit=None, **lookup):
+    """Async ``load_profile``, gathering the user and posts queries."""
+    async def get_user():
+        try:
+            return await user_queryset(viewer).aget(**lookup)
+        except User.DoesNotExist:
+            raise Http404("No such user.")
+
+    user, (posts, next_cursor) = await asyncio.gather(
+        get_user(),
+        akeyset_page(posts_queryset(lookup), cursor, limit or get_page_size()),
+    )
+    if not has_profile(user):
+        user.profile, _ = await Profile.objects.aget_or_create(user=user)
+    versions, header_version = await asyncio.gather(apost_versions(posts), aprofile_version(user.pk))
+    return build_page(viewer, user, posts, next_cursor, versions, header_version)
@@ -0,0 +1,165 @@
+"""
+Musician search backends.
+
+``get_search_backend()`` picks the backend named by ``MUSICIAN_SEARCH_BACKEND``
+or, by default, the one matching the database: a tsvector/trigram index on
+PostgreSQL, FTS5 on SQLite and a plain ``icontains`` scan anywhere else. The
+indexes themselves are created and kept current by migration 0013.
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .facets import profile_filters
+from .models import Profile
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TOKENS = 8
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TOKENS]
+
+
+def get_page_size():
+    return getattr(settings, "SEARCH_PAGE_SIZE", 20)
+
+
+@dataclass
+class SearchPage:
+    query: str
+    number: int
+    results: list = field(default_factory=list)
+    has_next: bool = False
+    filters: dict = field(default_factory=dict)
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class BaseSearchBackend:
+    def search(self, query, page=1, page_size=None, filters=None):
+        """
+        Return one ranked ``SearchPage`` of profiles matching ``query``.
+
+        ``filters`` maps facet kinds to selected keys, e.g.
+        ``{"instrument": "guitar", "location": "berlin"}``.
+        """
+        page_size = page_size or get_page_size()
+        filters = {kind: key for kind, key in (filters or {}).items() if key}
+        columns = profile_filters(filters)
+        tokens = tokenize(query)
+        if not tokens and not columns:
+            return SearchPage(query=query, number=page)
+
+        offset = (page - 1) * page_size
+        if tokens:
+            ids = self.ranked_ids(tokens, query, offset, page_size + 1, columns)
+        else:
+            ids = self.filtered_ids(offset, page_size + 1, columns)
+        profiles = Profile.objects.select_related("user").in_bulk(ids[:page_size])
+        return SearchPage(
+            query=query,
+            number=page,
+            results=[profiles[pk] for pk in ids[:page_size] if pk in profiles],
+            has_next=len(ids) > page_size,
+            filters=filters,
+        )
+
+    def ranked_ids(self, tokens, query, offset, limit, columns):
+        """Return up to ``limit`` profile IDs matching ``tokens`` and ``columns``, best match first."""
+        raise NotImplementedError
+
+    def filtered_ids(self, offset, limit, columns):
+        """Facet-only lookup, served by the (instrument_key, location_key) indexes."""
+        ids = Profile.objects.filter(**columns).order_by("id").values_list("id", flat=True)
+        return list(ids[offset:offset + limit])
+
+
+def _column_sql(columns, alias="p"):
+    """``AND p.col = %s`` clauses for facet filters; ``columns`` keys come from facets.KEY_FIELDS."""
+    sql = "".join(f" AND {alias}.{column} = %s" for column in columns)
+    return sql, list(columns.values())
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector match with prefix terms, plus trigram similarity on usernames."""
+
+    SQL = """
+        SELECT p.id
+        FROM accounts_profile p
+        JOIN auth_user u ON u.id = p.user_id,
+        to_tsquery('simple', %s) q
+        WHERE (p.search_vector @@ q OR u.username %% %s){filters}
+        ORDER BY ts_rank(p.search_vector, q) + similarity(u.username, %s) DESC, p.id
+        LIMIT %s OFFSET %s
+    """
+
+    def ranked_ids(self, tokens, query, offset, limit, columns):
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        filters, params = _column_sql(columns)
+        with connection.cursor() as cursor:
+            cursor.execute(self.SQL.format(filters=filters), [tsquery, query, *params, query, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 prefix match ranked by bm25, weighting username over instrument, location and bio."""
+
+    SQL = """
+        SELECT accounts_profile_fts.rowid
+        FROM accounts_profile_fts
+        JOIN accounts_profile p ON p.id = accounts_profile_fts.rowid
+        WHERE accounts_profile_fts MATCH %s{filters}
+        ORDER BY bm25(accounts_profile_fts, 10.0, 5.0, 3.0, 1.0), accounts_profile_fts.rowid
+        LIMIT %s OFFSET %s
+    """
+
+    def ranked_ids(self, tokens, query, offset, limit, columns):
+        match = " ".join(f'"{token}"*' for token in tokens)
+        filters, params = _column_sql(columns)
+        with connection.cursor() as cursor:
+            cursor.execute(self.SQL.format(filters=filters), [match, *params, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Unindexed fallback for databases without a full-text backend."""
+
+    def ranked_ids(self, tokens, query, offset, limit, columns):
+        matches = Q(**columns)
+        for token in tokens:
+            matches &= (
+                Q(user__username__icontains=token)
+                | Q(instrument__icontains=token)
+                | Q(location__icontains=token)
+                | Q(bio__icontains=token)
+            )
+        ids = Profile.objects.filter(matches).order_by("user__username").values_list("id", flat=True)
+        return list(ids[offset:offset + limit])
+
+
+VENDOR_BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    path = getattr(settings, "MUSICIAN_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
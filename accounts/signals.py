@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile 
+from . import auth, facets, follows, fragments, images
+from .counters import adjust_post, adjust_profile
+from .models import Comment, Facet, Follow, Like, Post, Profile
+from .trending import rescore, score_change
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -11,6 +14,138 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     try:
-        instance.profile.save()
+        instance.profile
     except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+
+# counters
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_profile(instance.follower_id, following_count=1)
+        adjust_profile(instance.following_id, follower_count=1)
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    adjust_profile(instance.follower_id, following_count=-1)
+    adjust_profile(instance.following_id, follower_count=-1)
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created and instance.author_id:
+        adjust_profile(instance.author_id, post_count=1)
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if instance.author_id:
+        adjust_profile(instance.author_id, post_count=-1)
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_post(instance.post_id, like_count=1, trending_score=score_change(likes=1))
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, origin=None, **kwargs):
+    # Likes removed along with their post need no counter update.
+    if not isinstance(origin, Post):
+        adjust_post(instance.post_id, like_count=-1)
+        rescore([instance.post_id])
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_post(instance.post_id, comment_count=1, trending_score=score_change(comments=1))
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Post):
+        adjust_post(instance.post_id, comment_count=-1)
+        rescore([instance.post_id])
+
+
+# facets
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, **kwargs):
+    old_keys = ("", "") if created else getattr(instance, "_loaded_facet_keys", ("", ""))
+    facets.profile_changed(old_keys, instance)
+    instance._loaded_facet_keys = (instance.instrument_key, instance.location_key)
+
+@receiver(post_delete, sender=Profile)
+def profile_deleted(sender, instance, **kwargs):
+    facets.adjust(Facet.INSTRUMENT, instance.instrument_key, "", -1)
+    facets.adjust(Facet.LOCATION, instance.location_key, "", -1)
+
+
+# image renditions and stored files
+
+@receiver(post_save, sender=Profile)
+def avatar_saved(sender, instance, **kwargs):
+    images.replaced(instance, "avatar")
+    images.schedule(instance, "avatar")
+
+@receiver(post_delete, sender=Profile)
+def avatar_deleted(sender, instance, **kwargs):
+    images.discard(instance, "avatar")
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, **kwargs):
+    images.replaced(instance, "image")
+    images.schedule(instance, "image")
+
+@receiver(post_delete, sender=Post)
+def post_image_deleted(sender, instance, **kwargs):
+    images.discard(instance, "image")
+
+
+# fragment cache
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    fragments.bump_post(instance.pk)
+    # The author's post count is in their header, not on their cards.
+    if instance.author_id:
+        fragments.bump_profile(instance.author_id)
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def post_counts_changed(sender, instance, **kwargs):
+    fragments.bump_post(instance.post_id)
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    fragments.bump_profile(instance.follower_id)
+    fragments.bump_profile(instance.following_id)
+
+@receiver(post_save, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    fragments.bump_author(instance.user_id)
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which no fragment shows.
+    if update_fields != frozenset({"last_login"}):
+        fragments.bump_author(instance.pk)
+
+
+# cached users
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_cache_changed(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
+
+
+# follow sets
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_set_changed(sender, instance, **kwargs):
+    follows.forget(instance.follower_id)
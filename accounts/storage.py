@@ -0,0 +1,125 @@
+"""
+Content-addressed media storage.
+
+Uploads are stored under the SHA-256 of their bytes
+(``avatars/3f/3fa9...c1.jpg``), so saving the same file twice stores it
+once and a name never points at different content. That makes every media
+URL safe to cache forever.
+
+Because one stored file can back several rows, ``save()`` and ``delete()``
+maintain a reference count in ``StoredFile``. ``save()`` takes a reference
+and ``delete()`` drops one. The file itself is removed only after the
+deleting transaction commits and nothing references it any more.
+
+``ContentAddressedStorage`` stores on the local filesystem. With the
+optional ``django-storages`` dependency installed,
+``ContentAddressedS3Storage`` stores in any S3-compatible bucket, such as
+the local stand-in in ``resonate.s3server``.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+SHARD = re.compile(r"[0-9a-f]{2}")
+HASHED_NAME = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.[^/]*)?$")
+
+# Far-future caching for content-addressed names.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def is_content_addressed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def retain(name):
+    updated = StoredFile.objects.filter(name=name).update(refs=F("refs") + 1)
+    if not updated:
+        _, created = StoredFile.objects.get_or_create(name=name, defaults={"refs": 1})
+        if not created:
+            StoredFile.objects.filter(name=name).update(refs=F("refs") + 1)
+
+
+def release(name):
+    StoredFile.objects.filter(name=name, refs__gt=0).update(refs=F("refs") - 1)
+    StoredFile.objects.filter(name=name, refs=0).delete()
+
+
+def is_referenced(name):
+    return StoredFile.objects.filter(name=name).exists()
+
+
+class ContentAddressedMixin:
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        parent, shard = os.path.split(directory)
+        if SHARD.fullmatch(shard) and filename.startswith(shard):
+            # Derived from a stored name (e.g. a rendition); keep the upload directory.
+            directory = parent
+        ext = os.path.splitext(filename)[1].lower()
+        digest = content_hash(content)
+        return os.path.join(directory, digest[:2], f"{digest}{ext}").replace("\\", "/")
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal bytes, so an existing file is simply reused.
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        hashed = self.hashed_name(name, content)
+        if not self.exists(hashed):
+            hashed = super().save(hashed, content, max_length=max_length)
+        retain(hashed)
+        return hashed
+
+    def delete(self, name):
+        if not name:
+            return
+        release(name)
+        if is_referenced(name):
+            return
+        remove = super().delete
+
+        def remove_if_orphaned():
+            # A concurrent upload of the same bytes may have re-referenced it.
+            if not is_referenced(name):
+                remove(name)
+
+        transaction.on_commit(remove_if_orphaned)
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    def __init__(self, **kwargs):
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+
+try:
+    from storages.backends.s3 import S3Storage
+except ImportError:  # django-storages is optional
+    S3Storage = None
+
+if S3Storage is not None:
+    class ContentAddressedS3Storage(ContentAddressedMixin, S3Storage):
+        def get_default_settings(self):
+            defaults = super().get_default_settings()
+            defaults["object_parameters"] = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+            defaults["file_overwrite"] = True
+            return defaults
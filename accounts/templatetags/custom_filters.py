@@ -1,5 +1,5 @@
 from django import template
-from accounts.models import Follow
+from accounts import follows
 
 register = template.Library()
 
@@ -9,7 +9,5 @@ def get_item(dictionary, key):
 
 @register.filter
 def is_following(user, target_user):
-    """Return True if the user follows the target_user."""
-    if not user.is_authenticated:
-        return False
-    return Follow.objects.filter(follower=user, following=target_user).exists()
\ No newline at end of file
+    """Return True if the user follows the target_user (a user or a user ID)."""
+    return follows.is_following(user, target_user)
@@ -0,0 +1,50 @@
+from django import template
+
+from accounts.images import MIME_TYPES
+
+register = template.Library()
+
+# Preferred first: browsers take the first <source> they can decode.
+SOURCE_ORDER = ("avif", "webp")
+
+
+def variants_for(fieldfile):
+    """The renditions recorded for ``fieldfile``, or None if there are none for its current file."""
+    if not fieldfile:
+        return None
+    variants = getattr(fieldfile.instance, f"{fieldfile.field.name}_variants", None)
+    if not variants or variants.get("source") != fieldfile.name:
+        return None
+    return variants
+
+
+@register.simple_tag
+def srcset(fieldfile, fmt=None):
+    """A ``srcset`` value for the renditions of ``fieldfile`` in ``fmt`` (default: the fallback format)."""
+    variants = variants_for(fieldfile)
+    if variants is None:
+        return ""
+    entries = variants["sources"].get(fmt or variants["fallback"], [])
+    return ", ".join(f"{fieldfile.storage.url(name)} {width}w" for width, name in entries)
+
+
+@register.inclusion_tag("accounts/_picture.html")
+def picture(fieldfile, alt="", sizes="100vw", **attrs):
+    """
+    Render ``fieldfile`` as a ``<picture>`` with AVIF/WebP sources when its
+    renditions exist, falling back to the original upload otherwise.
+    """
+    variants = variants_for(fieldfile)
+    sources = []
+    if variants:
+        for fmt in SOURCE_ORDER:
+            if fmt in variants["sources"]:
+                sources.append({"type": MIME_TYPES[fmt], "srcset": srcset(fieldfile, fmt)})
+    return {
+        "src": fieldfile.url if fieldfile else "",
+        "srcset": srcset(fieldfile),
+        "sources": sources,
+        "sizes": sizes,
+        "alt": alt,
+        "css_class": attrs.get("class", ""),
+    }
@@ -1,3 +1,1614 @@
-from django.test import TestCase
+import contextlib
+import copy
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.db.models import F, Q
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from resonate import benchmark, s3server
+from resonate.middleware import QueryBudgetExceeded, QueryBudgetMiddleware, query_budget
+from resonate.profiling import fingerprint
+from resonate.respserver import run_in_thread
+from resonate.urls import media_view
+
+from chat.models import ChatThread, Message
+
+from . import async_views, follows, images, likebuffer, toggles, trending, views
+from .counters import reconcile
+from .hydration import hydrate_posts
+from .models import Comment, Facet, Follow, Like, Post, Profile, StoredFile, TimelineEntry, Unlike
+from .search import PostgresSearchBackend, SQLiteSearchBackend
+from .storage import IMMUTABLE_CACHE_CONTROL, ContentAddressedS3Storage, ContentAddressedStorage
+from .pagination import decode_cursor, encode_cursor
+from .profiles import aload_profile, load_profile
+from .uploads import SizeLimitedUploadHandler
+
+# The committed manifest in staticfiles/ lags behind static/, so render
+# templates against plain static storage in tests.
+plain_static = override_settings(STORAGES={
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+
+
+@plain_static
+@override_settings(FEED_PAGE_SIZE=3)
+class FeedTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer")
+        self.followed = User.objects.create_user("followed")
+        self.stranger = User.objects.create_user("stranger")
+        Follow.objects.create(follower=self.viewer, following=self.followed)
+        self.client.force_login(self.viewer)
+
+    def make_posts(self, author, count):
+        return [
+            Post.objects.create(author=author, title=f"{author.username} {i}", description="", category="Band")
+            for i in range(count)
+        ]
+
+    def test_feed_only_contains_followed_and_own_posts(self):
+        own = self.make_posts(self.viewer, 1)
+        followed = self.make_posts(self.followed, 1)
+        self.make_posts(self.stranger, 2)
+
+        response = self.client.get(reverse("accounts:feed"))
+
+        self.assertEqual(
+            {post.id for post in response.context["posts"]},
+            {own[0].id, followed[0].id},
+        )
+
+    def test_load_more_walks_every_post_exactly_once(self):
+        posts = self.make_posts(self.followed, 7)
+
+        response = self.client.get(reverse("accounts:feed"))
+        seen = [post.id for post in response.context["posts"]]
+        cursor = response.context["next_cursor"]
+        while cursor:
+            data = self.client.get(reverse("accounts:feed_more"), {"cursor": cursor}).json()
+            seen.extend(int(pk) for pk in _post_ids(data["html"]))
+            cursor = data["next_cursor"]
+
+        self.assertEqual(seen, [post.id for post in reversed(posts)])
+
+    def test_load_more_rejects_malformed_cursor(self):
+        response = self.client.get(reverse("accounts:feed_more"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_round_trip(self):
+        post = self.make_posts(self.viewer, 1)[0]
+        self.assertEqual(decode_cursor(encode_cursor(post.created_at, post.id)), (post.created_at, post.id))
+
+
+@plain_static
+@override_settings(FEED_PAGE_SIZE=3, FEED_FANOUT=True, FEED_FANOUT_FOLLOWER_LIMIT=1)
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer")
+        self.author = User.objects.create_user("author")
+        self.celebrity = User.objects.create_user("celebrity")
+        self.fan = User.objects.create_user("fan")
+        Follow.objects.create(follower=self.viewer, following=self.celebrity)
+        Follow.objects.create(follower=self.fan, following=self.celebrity)
+        self.client.force_login(self.viewer)
+
+    def create_post(self, username, title):
+        self.client.force_login(User.objects.get(username=username))
+        self.client.post(reverse("accounts:post_create"), {"title": title, "description": "text", "category": "Band"})
+        self.client.force_login(self.viewer)
+        return Post.objects.get(title=title)
+
+    def feed_titles(self):
+        response = self.client.get(reverse("accounts:feed"))
+        titles = [post.title for post in response.context["posts"]]
+        cursor = response.context["next_cursor"]
+        while cursor:
+            data = self.client.get(reverse("accounts:feed_more"), {"cursor": cursor}).json()
+            titles.extend(Post.objects.get(id=pk).title for pk in _post_ids(data["html"]))
+            cursor = data["next_cursor"]
+        return titles
+
+    def test_follow_fans_out_and_unfollow_cleans_up(self):
+        self.client.post(reverse("accounts:follow_toggle", args=["author"]))
+        post = self.create_post("author", "fresh")
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, post=post).exists())
+
+        self.client.post(reverse("accounts:follow_toggle", args=["author"]))
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer, author=self.author).exists())
+
+    def test_high_fanout_authors_are_merged_at_read_time(self):
+        self.client.post(reverse("accounts:follow_toggle", args=["author"]))
+        self.create_post("author", "a1")
+        self.create_post("celebrity", "c1")
+        self.create_post("author", "a2")
+        self.create_post("celebrity", "c2")
+        self.create_post("viewer", "own")
+
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer, author=self.celebrity).exists())
+        self.assertEqual(self.feed_titles(), ["own", "c2", "a2", "c1", "a1"])
+
+    def test_dropping_back_to_the_limit_backfills_followers(self):
+        self.create_post("celebrity", "c1")
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer, author=self.celebrity).exists())
+
+        self.client.force_login(self.fan)
+        self.client.post(reverse("accounts:follow_toggle", args=["celebrity"]))
+        self.client.force_login(self.viewer)
+
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, author=self.celebrity).exists())
+        self.assertEqual(self.feed_titles(), ["c1"])
+
+    def test_delete_post_removes_entries(self):
+        post = self.create_post("viewer", "gone")
+        self.client.post(reverse("accounts:delete_post", args=[post.id]))
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_rebuild_matches_read_time_feed(self):
+        with self.settings(FEED_FANOUT=False):
+            Follow.objects.create(follower=self.viewer, following=self.author)
+            for i in range(4):
+                Post.objects.create(author=self.author, title=f"a{i}", description="", category="Band")
+            expected = self.feed_titles()
+
+        call_command("rebuild_timelines", stdout=open("/dev/null", "w"))
+        self.assertEqual(self.feed_titles(), expected)
+
+
+@plain_static
+class CounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.client.force_login(self.alice)
+
+    def profile(self, user):
+        return Profile.objects.get(user=user)
+
+    def test_follow_toggle_keeps_counters_in_sync(self):
+        data = self.client.post(reverse("accounts:follow_toggle", args=["bob"])).json()
+        self.assertEqual(data["follower_count"], 1)
+        self.assertEqual(self.profile(self.alice).following_count, 1)
+
+        data = self.client.post(reverse("accounts:follow_toggle", args=["bob"])).json()
+        self.assertEqual(data["follower_count"], 0)
+        self.assertEqual(self.profile(self.alice).following_count, 0)
+
+    def test_post_like_and_comment_counters(self):
+        post = Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        like = Like.objects.create(post=post, user=self.alice)
+        Comment.objects.create(post=post, user=self.alice, text="nice")
+        post.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (1, 1))
+        self.assertEqual(self.profile(self.bob).post_count, 1)
+
+        like.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 0)
+
+        post.delete()
+        self.assertEqual(self.profile(self.bob).post_count, 0)
+
+    def test_saving_a_stale_instance_does_not_clobber_counters(self):
+        profile = self.profile(self.bob)
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        profile.bio = "updated"
+        profile.save()
+        self.assertEqual(self.profile(self.bob).follower_count, 1)
+
+    def test_deletes_still_work_once_counters_have_drifted_to_zero(self):
+        post = Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        like = Like.objects.create(post=post, user=self.alice)
+        Comment.objects.create(post=post, user=self.alice, text="nice")
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        Post.objects.update(like_count=0, comment_count=0)
+        Profile.objects.update(follower_count=0, following_count=0, post_count=0)
+
+        like.delete()
+        Comment.objects.get().delete()
+        self.client.post(reverse("accounts:follow_toggle", args=["bob"]))
+        post.delete()
+
+        self.assertFalse(Profile.objects.filter(Q(follower_count__gt=0) | Q(post_count__gt=0)).exists())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_toggles_clamp_drifted_counters(self):
+        post = Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        toggles.set_like(self.alice.id, post.id, True)
+        Post.objects.update(like_count=0)
+        self.assertEqual(toggles.set_like(self.alice.id, post.id, False), (True, 0))
+
+    def test_reconcile_fixes_drift(self):
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        Profile.objects.filter(user=self.bob).update(follower_count=42)
+
+        call_command("reconcile_counters", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(self.profile(self.bob).follower_count, 1)
+
+    def test_profile_pages_issue_no_count_queries(self):
+        Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        for url in (reverse("accounts:profile", args=["bob"]), reverse("accounts:musician_detail", args=[self.bob.id])):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            self.assertFalse([q for q in queries if "COUNT(" in q["sql"].upper()], url)
+
+
+@plain_static
+class ToggleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.post = Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        self.client.force_login(self.alice)
+
+    def like(self, **data):
+        return self.client.post(
+            reverse("accounts:like_toggle", args=[self.post.id]), data, content_type="application/json",
+        )
+
+    def follow(self, **data):
+        return self.client.post(reverse("accounts:follow_toggle", args=["bob"]), data, content_type="application/json")
+
+    def test_like_returns_state_and_count(self):
+        data = self.like(like=True).json()
+        self.assertEqual((data["liked"], data["like_count"]), (True, 1))
+        data = self.like(like=False).json()
+        self.assertEqual((data["liked"], data["like_count"]), (False, 0))
+
+    def test_explicit_state_is_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(self.like(like=True).json()["like_count"], 1)
+            self.assertEqual(self.follow(follow=True).json()["follower_count"], 1)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(Follow.objects.filter(following=self.bob).count(), 1)
+        self.assertEqual(Profile.objects.get(user=self.alice).following_count, 1)
+
+    def test_without_a_state_it_flips(self):
+        url = reverse("accounts:like_toggle", args=[self.post.id])
+        self.assertTrue(self.client.post(url).json()["liked"])
+        self.assertFalse(self.client.post(url).json()["liked"])
+        self.assertFalse(Like.objects.exists())
+
+    def test_like_rejects_get_and_missing_posts(self):
+        self.assertEqual(self.client.get(reverse("accounts:like_toggle", args=[self.post.id])).status_code, 405)
+        self.assertEqual(self.client.post(reverse("accounts:like_toggle", args=[self.post.id + 1])).status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+    def test_toggles_do_not_count_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.like(like=True)
+            self.follow(follow=True)
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"].upper()])
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+    def journal(self, *lines):
+        """A journal directory holding ``lines`` in a segment of this process."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.journal"), "w") as f:
+            f.writelines(f"{line}\n" for line in lines)
+        return directory
+
+    def test_a_replayed_like_older_than_an_unlike_stays_undone(self):
+        before = time.time_ns()
+        self.like(like=True)
+        self.like(like=False)
+        self.assertTrue(Unlike.objects.filter(post=self.post, user=self.alice).exists())
+
+        likebuffer.replay(self.journal(f"{self.alice.id} {self.post.id} 1 {before}"))
+        self.assertFalse(Like.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_like_bumps_the_post_fragment(self):
+        self.client.get(reverse("accounts:view_post", args=[self.post.id]))
+        response = self.client.get(reverse("accounts:profile", args=["bob"]))
+        self.like(like=True)
+        self.assertNotEqual(self.client.get(reverse("accounts:profile", args=["bob"])).content, response.content)
+
+
+class PortableToggleTests(ToggleTests):
+    """The same toggles on the path used where ``ON CONFLICT`` and ``RETURNING`` aren't available."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(toggles, "native", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replayed_unlikes_are_recorded(self):
+        Like.objects.create(post=self.post, user=self.alice)
+        first = time.time_ns()
+        likebuffer.replay(self.journal(f"{self.alice.id} {self.post.id} 0 {first}"))
+        self.assertFalse(Like.objects.exists())
+        unlike = Unlike.objects.get(post=self.post, user=self.alice)
+        self.assertEqual(unlike.created_at, likebuffer.as_datetime(first))
+
+        second = first + 10 ** 9
+        likebuffer.replay(self.journal(f"{self.alice.id} {self.post.id} 0 {second}"))
+        unlike.refresh_from_db()
+        self.assertEqual(unlike.created_at, likebuffer.as_datetime(second))
+        self.assertEqual(Unlike.objects.count(), 1)
+
+    def test_batches_skip_rows_already_in_place(self):
+        carol = User.objects.create_user("carol")
+        Like.objects.create(post=self.post, user=self.alice)
+        with CaptureQueriesContext(connection) as queries:
+            changes = toggles.set_likes({
+                (self.alice.id, self.post.id): True,
+                (carol.id, self.post.id): True,
+                (self.bob.id, self.post.id): False,
+            })
+        self.assertFalse([q for q in queries if "ON CONFLICT DO NOTHING" in q["sql"]])
+        self.assertEqual(changes, {self.post.id: 1})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+
+class ConcurrentToggleTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f"user{i}") for i in range(8)]
+        self.author = self.users[0]
+        self.post = Post.objects.create(author=self.author, title="t", description="d", category="Band")
+
+    def in_parallel(self, calls):
+        start = threading.Barrier(len(calls))
+
+        def run(call):
+            try:
+                start.wait()
+                while True:
+                    try:
+                        return call()
+                    except OperationalError as e:
+                        # SQLite's shared-cache test database reports a lock at
+                        # once instead of waiting; each call is atomic, so retry.
+                        if "locked" not in str(e):
+                            raise
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(calls)) as pool:
+            return list(pool.map(run, calls))
+
+    def test_parallel_likes_and_follows_keep_counts_exact(self):
+        calls = []
+        for user in self.users[1:]:
+            # Each user sends the same request twice at once, as a double-click would.
+            calls += [partial(toggles.set_like, user.id, self.post.id, True)] * 2
+            calls += [partial(toggles.set_follow, user.id, self.author.id, True)] * 2
+        results = self.in_parallel(calls)
+
+        self.assertEqual(sum(changed for changed, _ in results), 2 * (len(self.users) - 1))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, Like.objects.count())
+        self.assertEqual(self.post.like_count, len(self.users) - 1)
+        self.assertEqual(Profile.objects.get(user=self.author).follower_count, len(self.users) - 1)
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+        calls = [partial(toggles.set_like, user.id, self.post.id, False) for user in self.users[1:]] * 2
+        self.in_parallel(calls)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, Like.objects.count()), (0, 0))
+
+
+@plain_static
+@override_settings(LIKE_WRITE_BEHIND=True, LIKE_FLUSH_INTERVAL_MS=0, LIKE_FLUSH_BATCH_SIZE=100)
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+        journal_settings = self.settings(LIKE_JOURNAL_DIR=self.journal_dir)
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+        self.addCleanup(likebuffer.stop)
+
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.post = Post.objects.create(author=self.bob, title="t", description="d", category="Band")
+        self.client.force_login(self.alice)
+
+    def like(self, liked):
+        return self.client.post(
+            reverse("accounts:like_toggle", args=[self.post.id]), {"like": liked}, content_type="application/json",
+        ).json()
+
+    def segments(self):
+        return sorted(os.listdir(self.journal_dir))
+
+    def test_likes_are_visible_at_once_and_written_on_flush(self):
+        data = self.like(True)
+        self.assertEqual((data["liked"], data["like_count"]), (True, 1))
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(len(self.segments()), 1)
+
+        response = self.client.get(reverse("accounts:view_post", args=[self.post.id]))
+        self.assertContains(response, "Unlike")
+        self.assertContains(response, "1 like<")
+        self.assertEqual(likebuffer.overlay(self.alice.id, set(), [self.post.id]), {self.post.id})
+
+        self.assertEqual(likebuffer.get_buffer().flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertTrue(Like.objects.filter(post=self.post, user=self.alice).exists())
+        self.assertEqual(self.segments(), [])
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+    def test_like_then_unlike_never_reaches_the_database(self):
+        self.like(True)
+        self.assertEqual(self.like(False)["like_count"], 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(likebuffer.get_buffer().flush(), 0)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.segments(), [])
+
+    def test_a_full_batch_flushes_inline(self):
+        with self.settings(LIKE_FLUSH_BATCH_SIZE=2):
+            likebuffer.stop()
+            posts = [self.post, Post.objects.create(author=self.bob, title="u", description="d", category="Band")]
+            buffer = likebuffer.get_buffer()
+            for post in posts:
+                buffer.set_like(self.alice.id, post.id, True)
+        self.assertEqual(Like.objects.filter(user=self.alice).count(), 2)
+        self.assertEqual(buffer.pending, {})
+
+    def test_replay_applies_what_a_crashed_process_left(self):
+        buffer = likebuffer.LikeBuffer(directory=self.journal_dir)
+        buffer.set_like(self.alice.id, self.post.id, True)
+        buffer.set_like(self.bob.id, self.post.id, True)
+        buffer.set_like(self.bob.id, self.post.id, False)
+        # The process dies mid-write, leaving half a line behind.
+        buffer.journal.file.write("12 3")
+        buffer.journal.file.close()
+
+        out = io.StringIO()
+        call_command("replay_likes", journal_dir=self.journal_dir, stdout=out)
+
+        self.assertIn("Replayed 2 like intents.", out.getvalue())
+        self.assertEqual(list(Like.objects.values_list("user", flat=True)), [self.alice.id])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.segments(), [])
+
+    def test_replay_never_undoes_a_newer_write(self):
+        Like.objects.create(post=self.post, user=self.bob)
+        live = likebuffer.get_buffer()
+        crashed = likebuffer.LikeBuffer(directory=self.journal_dir)
+        crashed.set_like(self.alice.id, self.post.id, True)
+        crashed.set_like(self.bob.id, self.post.id, False)
+        crashed.journal.file.close()
+
+        # Meanwhile another process sees neither: alice likes and unlikes, bob unlikes and likes again.
+        for liked in (True, False):
+            live.set_like(self.alice.id, self.post.id, liked)
+            live.set_like(self.bob.id, self.post.id, not liked)
+            live.flush()
+
+        self.assertEqual(likebuffer.replay(self.journal_dir, skip=live.journal), 2)
+        self.assertEqual(list(Like.objects.values_list("user", flat=True)), [self.bob.id])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.segments(), [])
+
+    def test_replaying_twice_is_harmless(self):
+        for name in ("1", "2"):
+            with open(os.path.join(self.journal_dir, f"{os.getpid()}-{name}.journal"), "w") as f:
+                f.write(f"{self.alice.id} {self.post.id} 1\n")
+        self.assertEqual(likebuffer.replay(self.journal_dir), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, Like.objects.count()), (1, 1))
+
+
+@plain_static
+@override_settings(
+    TRENDING_LIKE_WEIGHT=1.0, TRENDING_COMMENT_WEIGHT=3.0, TRENDING_HALF_LIFE_HOURS=6.0, TRENDING_MIN_SCORE=0.05,
+)
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.band = Post.objects.create(author=self.bob, title="band", description="d", category="Band")
+        self.lesson = Post.objects.create(author=self.bob, title="lesson", description="d", category="Teacher")
+        self.client.force_login(self.alice)
+
+    def score(self, post):
+        return Post.objects.values_list("trending_score", flat=True).get(pk=post.pk)
+
+    def test_likes_and_comments_move_the_score(self):
+        like = Like.objects.create(post=self.band, user=self.alice)
+        Comment.objects.create(post=self.band, user=self.bob, text="nice")
+        self.assertEqual(self.score(self.band), 4.0)
+
+        like.delete()
+        self.assertAlmostEqual(self.score(self.band), 3.0, places=3)
+        Post.objects.filter(pk=self.band.pk).update(trending_score=0.5)
+        Comment.objects.get().delete()
+        self.assertEqual(self.score(self.band), 0.0)
+
+    def test_like_toggle_moves_the_score(self):
+        url = reverse("accounts:like_toggle", args=[self.band.id])
+        self.client.post(url, {"like": True}, content_type="application/json")
+        self.assertEqual(self.score(self.band), 1.0)
+        self.client.post(url, {"like": False}, content_type="application/json")
+        self.assertEqual(self.score(self.band), 0.0)
+
+        toggles.set_likes({(self.alice.id, self.band.id): True, (self.bob.id, self.band.id): True})
+        self.assertEqual(self.score(self.band), 2.0)
+
+    def test_removing_an_old_like_takes_back_only_what_is_left_of_it(self):
+        like = Like.objects.create(post=self.band, user=self.alice)
+        Like.objects.create(post=self.band, user=self.bob)
+        Like.objects.update(created_at=timezone.now() - timedelta(hours=6))
+        trending.rebuild()
+        Comment.objects.create(post=self.band, user=self.bob, text="nice")
+        self.assertAlmostEqual(self.score(self.band), 4.0, places=3)
+
+        like.delete()
+        self.assertAlmostEqual(self.score(self.band), 3.5, places=3)
+        toggles.set_like(self.bob.id, self.band.id, False)
+        self.assertAlmostEqual(self.score(self.band), 3.0, places=3)
+
+        Like.objects.create(post=self.band, user=self.alice)
+        Like.objects.update(created_at=timezone.now() - timedelta(hours=6))
+        trending.rebuild()
+        toggles.set_likes({(self.alice.id, self.band.id): False, (self.bob.id, self.band.id): True})
+        self.assertAlmostEqual(self.score(self.band), 4.0, places=3)
+
+    def test_rescore_locks_the_posts_before_reading_their_events(self):
+        Like.objects.create(post=self.band, user=self.alice)
+        Post.objects.update(trending_score=7.0)
+        with mock.patch.object(Post.objects, "select_for_update", wraps=Post.objects.select_for_update) as lock:
+            trending.rescore([self.band.id, self.lesson.id])
+        lock.assert_called_once_with()
+        self.assertAlmostEqual(self.score(self.band), 1.0, places=3)
+        self.assertEqual(self.score(self.lesson), 0.0)
+
+    def test_migration_backfills_scores(self):
+        Like.objects.create(post=self.band, user=self.alice)
+        Post.objects.update(trending_score=0)
+        import_module("accounts.migrations.0018_post_trending_score").backfill_scores(django_apps, None)
+        self.assertAlmostEqual(self.score(self.band), 1.0, places=3)
+
+    def test_decay_halves_scores_each_half_life_and_drops_stale_ones(self):
+        Post.objects.filter(pk=self.band.pk).update(trending_score=8.0)
+        Post.objects.filter(pk=self.lesson.pk).update(trending_score=0.08)
+
+        out = io.StringIO()
+        call_command("decay_trending", minutes=360, stdout=out)
+
+        self.assertIn("Decayed 2 trending scores.", out.getvalue())
+        self.assertAlmostEqual(self.score(self.band), 4.0)
+        self.assertEqual(self.score(self.lesson), 0.0)
+        self.assertEqual(trending.decay(), 1)
+
+    def test_rebuild_weighs_events_by_age(self):
+        Like.objects.create(post=self.band, user=self.alice)
+        Comment.objects.create(post=self.lesson, user=self.alice, text="old")
+        Comment.objects.update(created_at=timezone.now() - timedelta(hours=6))
+        Post.objects.update(trending_score=100)
+
+        self.assertEqual(trending.rebuild(), 2)
+        self.assertAlmostEqual(self.score(self.band), 1.0, places=3)
+        self.assertAlmostEqual(self.score(self.lesson), 1.5, places=3)
+
+    def test_trending_page_ranks_posts_per_category(self):
+        Post.objects.filter(pk=self.band.pk).update(trending_score=2.0)
+        Post.objects.filter(pk=self.lesson.pk).update(trending_score=5.0)
+        quiet = Post.objects.create(author=self.bob, title="quiet", description="d", category="Band")
+
+        response = self.client.get(reverse("accounts:trending"))
+        self.assertEqual([post.id for post in response.context["posts"]], [self.lesson.id, self.band.id])
+
+        response = self.client.get(reverse("accounts:trending"), {"category": "Band"})
+        self.assertEqual([post.id for post in response.context["posts"]], [self.band.id])
+        self.assertNotIn(quiet, response.context["posts"])
+
+        response = self.client.get(reverse("accounts:trending"), {"category": "nonsense"})
+        self.assertEqual(len(response.context["posts"]), 2)
+
+    def test_trending_page_aggregates_nothing(self):
+        Like.objects.create(post=self.band, user=self.alice)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("accounts:trending"))
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"].upper() or "SUM(" in q["sql"].upper()])
+
+
+@plain_static
+class HydrationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer")
+        self.author = User.objects.create_user("author")
+        self.commenter = User.objects.create_user("commenter")
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.client.force_login(self.viewer)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.author, title=f"p{i}", description="d", category="Band")
+            Like.objects.create(post=post, user=self.viewer)
+            for j in range(4):
+                Comment.objects.create(post=post, user=self.commenter, text=f"c{j}")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_number_of_posts(self):
+        urls = [
+            reverse("accounts:feed"),
+            reverse("accounts:profile", args=["author"]),
+            reverse("accounts:musician_detail", args=[self.author.id]),
+        ]
+        self.add_posts(2)
+        for url in urls:
+            self.count_queries(url)  # warms the session, user and follow-set caches
+        few = [self.count_queries(url) for url in urls]
+        self.add_posts(6)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_feed_posts_carry_like_state_without_loading_comments(self):
+        self.add_posts(1)
+        with CaptureQueriesContext(connection) as queries:
+            post = self.client.get(reverse("accounts:feed")).context["posts"][0]
+        self.assertTrue(post.is_liked_by_user)
+        self.assertEqual(post.recent_comments, [])
+        self.assertFalse([q for q in queries if "ROW_NUMBER" in q["sql"].upper()])
+
+    @override_settings(COMMENTS_PER_POST=2)
+    def test_hydrated_posts_carry_latest_comments(self):
+        self.add_posts(1)
+        [post] = hydrate_posts(Post.objects.all(), self.viewer)
+        self.assertEqual([c.text for c in post.recent_comments], ["c3", "c2"])
+
+
+@plain_static
+class SearchTests(TestCase):
+    def setUp(self):
+        self.make("drumfan", instrument="Guitar", bio="I love drums")
+        self.make("guitarhero", instrument="Bass", location="Berlin")
+        self.make("pianist", instrument="Piano", bio="Classical guitar on weekends")
+
+    def make(self, username, **fields):
+        user = User.objects.create_user(username)
+        Profile.objects.filter(user=user).update(**fields)
+        return user
+
+    def usernames(self, page):
+        return [profile.user.username for profile in page.results]
+
+    def test_results_are_ranked_with_username_matches_first(self):
+        page = SQLiteSearchBackend().search("guitar")
+        self.assertEqual(self.usernames(page), ["guitarhero", "drumfan", "pianist"])
+
+    def test_prefix_and_multi_term_queries(self):
+        self.assertEqual(self.usernames(SQLiteSearchBackend().search("pian")), ["pianist"])
+        self.assertEqual(self.usernames(SQLiteSearchBackend().search("bass berl")), ["guitarhero"])
+
+    def test_index_follows_profile_and_username_changes(self):
+        user = User.objects.get(username="pianist")
+        profile = user.profile
+        profile.instrument = "Cello"
+        profile.save()
+        user.username = "cellist"
+        user.save()
+
+        self.assertEqual(self.usernames(SQLiteSearchBackend().search("cello")), ["cellist"])
+        self.assertEqual(self.usernames(SQLiteSearchBackend().search("piano")), [])
+
+    def test_postgres_index_uses_the_query_config(self):
+        # Stemmed 'english' lexemes would never match the 'simple' prefix terms queried.
+        self.assertIn("to_tsquery('simple'", PostgresSearchBackend.SQL)
+        for name in ("0013_profile_search_index", "0020_profile_search_simple_bio"):
+            sql = " ".join(import_module(f"accounts.migrations.{name}").POSTGRES_FORWARD)
+            self.assertEqual(re.findall(r"to_tsvector\('(\w+)'", sql), ["simple"] * 4)
+
+    def test_paginates(self):
+        first = SQLiteSearchBackend().search("guitar", page=1, page_size=2)
+        second = SQLiteSearchBackend().search("guitar", page=2, page_size=2)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(self.usernames(first) + self.usernames(second), ["guitarhero", "drumfan", "pianist"])
+
+    def test_empty_query_returns_nothing(self):
+        response = self.client.get(reverse("accounts:search"), {"q": "  "})
+        self.assertEqual(response.context["results"], [])
+
+    def test_query_syntax_is_not_passed_through(self):
+        response = self.client.get(reverse("accounts:search"), {"q": 'guitar" OR NEAR(*'})
+        self.assertEqual(response.status_code, 200)
+
+
+@plain_static
+class FacetTests(TestCase):
+    def setUp(self):
+        self.make("ana", "Guitar", "Berlin")
+        self.make("ben", " guitar ", "berlin")
+        self.make("cy", "Guitar", "Paris")
+        self.make("dee", "Drums", "Berlin")
+
+    def make(self, username, instrument, location):
+        profile = User.objects.create_user(username).profile
+        profile.instrument = instrument
+        profile.location = location
+        profile.save()
+        return profile
+
+    def counts(self, kind):
+        return dict(Facet.objects.filter(kind=kind).values_list("key", "profile_count"))
+
+    def test_counts_are_maintained_on_save_and_delete(self):
+        self.assertEqual(self.counts(Facet.INSTRUMENT), {"guitar": 3, "drums": 1})
+        self.assertEqual(self.counts(Facet.LOCATION), {"berlin": 3, "paris": 1})
+
+        profile = Profile.objects.get(user__username="cy")
+        profile.location = "Berlin"
+        profile.save()
+        User.objects.get(username="dee").delete()
+
+        self.assertEqual(self.counts(Facet.INSTRUMENT), {"guitar": 3, "drums": 0})
+        self.assertEqual(self.counts(Facet.LOCATION), {"berlin": 3, "paris": 0})
+
+    def test_rebuild_matches_incremental_counts(self):
+        before = (self.counts(Facet.INSTRUMENT), self.counts(Facet.LOCATION))
+        call_command("rebuild_facets", stdout=open("/dev/null", "w"))
+        self.assertEqual((self.counts(Facet.INSTRUMENT), self.counts(Facet.LOCATION)), before)
+
+    def test_search_by_facets(self):
+        response = self.client.get(reverse("accounts:search"), {"instrument": "Guitar", "location": "berlin"})
+        self.assertEqual(
+            sorted(profile.user.username for profile in response.context["results"]),
+            ["ana", "ben"],
+        )
+        self.assertEqual(
+            {facet.key: facet.profile_count for facet in response.context["location_facets"]},
+            {"berlin": 2, "paris": 1},
+        )
+
+    def test_facets_combine_with_text_search(self):
+        response = self.client.get(reverse("accounts:search"), {"q": "ana", "location": "berlin"})
+        self.assertEqual([profile.user.username for profile in response.context["results"]], ["ana"])
+
+        response = self.client.get(reverse("accounts:search"), {"q": "ana", "location": "paris"})
+        self.assertEqual(response.context["results"], [])
+
+
+def _jpeg(name, size, orientation=None):
+    image = Image.new("RGB", size, "red")
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+@plain_static
+@override_settings(IMAGE_WORKERS=0, IMAGE_RENDITION_FORMATS=["webp", "avif"])
+class ImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = self.settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = User.objects.create_user("ann")
+        self.client.force_login(self.user)
+
+    def test_post_image_gets_renditions_and_loses_exif(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:post_create"), {
+                "title": "t", "description": "text", "category": "Band",
+                "image": _jpeg("photo.jpg", (1000, 700), orientation=6),
+            })
+
+        post = Post.objects.get()
+        variants = post.image_variants
+        self.assertEqual(variants["source"], post.image.name)
+        self.assertEqual((variants["width"], variants["height"]), (700, 1000))
+        self.assertEqual(
+            {fmt: [width for width, _ in entries] for fmt, entries in variants["sources"].items()},
+            {"jpeg": [320, 640], "webp": [320, 640], "avif": [320, 640]},
+        )
+
+        with Image.open(post.image.path) as original:
+            self.assertEqual(original.size, (700, 1000))
+            self.assertFalse(original.getexif())
+        _, name = variants["sources"]["webp"][0]
+        with post.image.storage.open(name) as rendition, Image.open(rendition) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (320, 457)))
+            self.assertFalse(image.getexif())
+
+    def test_avatar_renditions_are_square_and_rendered_with_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:edit_profile"), {
+                "instrument": "", "location": "", "bio": "",
+                "avatar": _jpeg("me.jpg", (300, 200)),
+            })
+
+        profile = Profile.objects.get(user=self.user)
+        widths = [width for width, _ in profile.avatar_variants["sources"]["webp"]]
+        self.assertEqual(widths, [64, 128, 256])
+        _, name = profile.avatar_variants["sources"]["jpeg"][-1]
+        with profile.avatar.storage.open(name) as rendition, Image.open(rendition) as image:
+            self.assertEqual(image.size, (256, 256))
+
+        response = self.client.get(reverse("accounts:profile", args=["ann"]))
+        self.assertContains(response, '<source type="image/avif"')
+        self.assertContains(response, f"{profile.avatar.storage.url(name)} 256w")
+
+    def test_changed_image_is_reprocessed_and_stale_renditions_ignored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.user, title="t", description="d", category="Band",
+                                       image=_jpeg("a.jpg", (400, 400)))
+        post.refresh_from_db()
+        post.image = _jpeg("b.jpg", (400, 400))
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            post.save()
+
+        response = self.client.get(reverse("accounts:view_post", args=[post.id]))
+        self.assertNotContains(response, "image/webp")
+
+        for callback in callbacks:
+            callback()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants["source"], post.image.name)
+
+    def create_post(self, upload):
+        return self.client.post(reverse("accounts:post_create"), {
+            "title": "t", "description": "text", "category": "Band", "image": upload,
+        })
+
+    def test_upload_over_byte_limit_is_rejected(self):
+        noise = Image.frombytes("RGB", (200, 200), os.urandom(200 * 200 * 3))
+        buffer = io.BytesIO()
+        noise.save(buffer, "JPEG")
+        with self.settings(IMAGE_UPLOAD_MAX_BYTES=4096):
+            response = self.create_post(SimpleUploadedFile("big.jpg", buffer.getvalue()))
+
+        self.assertContains(response, "Images must be 4.0\xa0KB or smaller.")
+        self.assertFalse(Post.objects.exists())
+
+    def test_upload_over_pixel_limit_is_rejected_from_the_header(self):
+        with self.settings(IMAGE_MAX_PIXELS=10_000):
+            response = self.create_post(_jpeg("wide.jpg", (200, 200)))
+
+        self.assertContains(response, "Images can be at most 0.01 megapixels.")
+        self.assertFalse(Post.objects.exists())
+
+    def test_handler_stops_writing_past_the_limit(self):
+        handler = SizeLimitedUploadHandler()
+        handler.new_file("image", "big.jpg", "image/jpeg", None)
+        chunk = b"x" * 1000
+        with self.settings(IMAGE_UPLOAD_MAX_BYTES=2500):
+            for start in range(0, 10_000, len(chunk)):
+                handler.receive_data_chunk(chunk, start)
+        upload = handler.file_complete(10_000)
+        self.addCleanup(upload.close)
+
+        self.assertEqual(upload.size, 10_000)
+        self.assertEqual(os.path.getsize(upload.temporary_file_path()), 2000)
+
+    def test_oversized_original_is_downscaled(self):
+        with self.settings(IMAGE_MAX_DIMENSION=500), self.captureOnCommitCallbacks(execute=True):
+            self.create_post(_jpeg("huge.jpg", (1000, 700)))
+
+        post = Post.objects.get()
+        with Image.open(post.image.path) as original:
+            self.assertEqual(original.size, (500, 350))
+        self.assertEqual((post.image_variants["width"], post.image_variants["height"]), (500, 350))
+
+    def test_processing_runs_on_the_worker_pool(self):
+        with self.settings(IMAGE_WORKERS=2):
+            worker = images.submit(threading.get_ident).result(timeout=5)
+        self.assertNotEqual(worker, threading.get_ident())
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_RENDITION_FORMATS=["webp"])
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = self.settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.storage = ContentAddressedStorage()
+        self.user = User.objects.create_user("ann")
+
+    def refs(self, name):
+        return StoredFile.objects.filter(name=name).values_list("refs", flat=True).first()
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.storage.save("avatars/repeat.jpg", ContentFile(b"same bytes"))
+        second = self.storage.save("avatars/repeat_e3SQ5Vq.jpg", ContentFile(b"same bytes"))
+
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^avatars/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(self.refs(first), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertIsNone(self.refs(first))
+
+    def test_deleting_posts_cleans_up_orphaned_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            posts = [
+                Post.objects.create(author=self.user, title="t", description="d", category="Band",
+                                    image=_jpeg("a.jpg", (400, 300)))
+                for _ in range(2)
+            ]
+        for post in posts:
+            post.refresh_from_db()
+        image = posts[0].image.name
+        (_, rendition), = posts[0].image_variants["sources"]["webp"]
+        self.assertEqual(posts[1].image.name, image)
+        self.assertEqual((self.refs(image), self.refs(rendition)), (2, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[0].delete()
+        self.assertTrue(self.storage.exists(image))
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[1].delete()
+        self.assertFalse(self.storage.exists(image))
+        self.assertFalse(self.storage.exists(rendition))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_replacing_an_avatar_releases_the_old_file(self):
+        profile = Profile.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.avatar = _jpeg("one.jpg", (100, 100))
+            profile.save()
+        profile.refresh_from_db()
+        old = profile.avatar.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.avatar = _jpeg("two.jpg", (120, 100))
+            profile.save()
+
+        profile.refresh_from_db()
+        self.assertFalse(self.storage.exists(old))
+        self.assertEqual(
+            set(StoredFile.objects.values_list("name", flat=True)),
+            {profile.avatar.name, *images.variant_names(profile.avatar_variants)},
+        )
+
+    def test_failed_processing_releases_what_it_wrote(self):
+        def encode(image, fmt):
+            if fmt == "webp":
+                raise OSError("encoder crashed")
+            return original_encode(image, fmt)
+
+        original_encode = images.encode
+        profile = Profile.objects.get(user=self.user)
+        with mock.patch.object(images, "encode", encode), self.assertLogs("accounts.images", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.avatar = _jpeg("one.jpg", (300, 300))
+                profile.save()
+
+        profile.refresh_from_db()
+        self.assertIsNone(profile.avatar_variants)
+        self.assertEqual(list(StoredFile.objects.values_list("name", flat=True)), [profile.avatar.name])
+        stored = {
+            os.path.relpath(os.path.join(root, name), settings.MEDIA_ROOT)
+            for root, _, names in os.walk(settings.MEDIA_ROOT) for name in names
+        }
+        self.assertEqual(stored, {profile.avatar.name})
+
+    def test_hashed_media_is_served_immutable(self):
+        name = self.storage.save("avatars/x.jpg", ContentFile(b"bytes"))
+        request = RequestFactory().get(f"/media/{name}")
+
+        response = media_view(request, name)
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+
+        with open(os.path.join(settings.MEDIA_ROOT, "legacy.jpg"), "wb") as legacy:
+            legacy.write(b"bytes")
+        self.assertNotIn("Cache-Control", media_view(RequestFactory().get("/media/legacy.jpg"), "legacy.jpg"))
+
+    def test_s3_backend_against_local_stand_in(self):
+        server = s3server.run_in_thread()
+        self.addCleanup(server.stop)
+        storage = ContentAddressedS3Storage(
+            bucket_name="media", endpoint_url=server.url, access_key="key", secret_key="secret",
+            addressing_style="path", querystring_auth=False,
+        )
+
+        first = storage.save("post_images/a.png", ContentFile(b"png bytes"))
+        second = storage.save("post_images/b.png", ContentFile(b"png bytes"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(list(server.store.buckets["media"]), [first])
+        body, headers = server.store.buckets["media"][first]
+        self.assertEqual((body, headers["Cache-Control"]), (b"png bytes", IMMUTABLE_CACHE_CONTROL))
+        self.assertEqual(storage.url(first), f"{server.url}/media/{first}")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.delete(first)
+            storage.delete(first)
+        self.assertFalse(storage.exists(first))
+
+
+@plain_static
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user("author")
+        self.viewer = User.objects.create_user("viewer")
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.post = Post.objects.create(author=self.author, title="first", description="d", category="Band")
+        self.client.force_login(self.viewer)
+
+    def feed(self):
+        return self.client.get(reverse("accounts:feed")).content.decode()
+
+    def test_post_card_is_cached_until_the_post_changes(self):
+        self.assertIn("first", self.feed())
+
+        Post.objects.filter(pk=self.post.pk).update(title="sneaky")
+        self.assertIn("first", self.feed())
+
+        self.post.title = "second"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        html = self.feed()
+        self.assertIn("second", html)
+        self.assertNotIn("first", html)
+
+    def test_like_refreshes_count_and_liked_state_is_per_viewer(self):
+        self.client.force_login(self.author)
+        self.assertIn("0 likes", self.client.get(reverse("accounts:feed")).content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.viewer)
+        viewer_html = self.client.get(reverse("accounts:feed")).content.decode()
+        self.assertIn("1 like<", viewer_html)
+        self.assertNotIn("liked-by-viewer", viewer_html)
+
+        self.client.force_login(self.viewer)
+        html = self.feed()
+        self.assertIn("1 like<", html)
+        self.assertIn("post-card liked-by-viewer", html)
+
+    def test_profile_header_refreshes_on_follow_but_actions_stay_per_viewer(self):
+        url = reverse("accounts:profile", args=["author"])
+        self.assertContains(self.client.get(url), '<strong id="follower-count">1</strong>')
+
+        other = User.objects.create_user("other")
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=other, following=self.author)
+        response = self.client.get(url)
+        self.assertContains(response, '<strong id="follower-count">2</strong>')
+        self.assertContains(response, 'id="follow-toggle-button"')
+
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertContains(response, "Edit Profile")
+        self.assertNotContains(response, 'id="follow-toggle-button"')
+
+    def test_fragments_are_kept_for_the_configured_timeout(self):
+        with self.settings(FRAGMENT_CACHE_TIMEOUT=0):
+            self.feed()
+            Post.objects.filter(pk=self.post.pk).update(title="sneaky")
+            self.assertIn("sneaky", self.feed())
+
+    def test_author_rename_refreshes_their_post_cards(self):
+        self.feed()
+        self.author.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        html = self.feed()
+        self.assertIn(reverse("accounts:profile", args=["renamed"]), html)
+        self.assertNotIn(reverse("accounts:profile", args=["author"]), html)
+
+    def test_follows_and_new_posts_leave_existing_cards_cached(self):
+        self.feed()
+        Post.objects.filter(pk=self.post.pk).update(title="sneaky")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=User.objects.create_user("other"), following=self.author)
+            Post.objects.create(author=self.author, title="another", description="d", category="Band")
+        html = self.feed()
+        self.assertIn("another", html)
+        self.assertIn("first", html)
+        self.assertNotIn("sneaky", html)
+
+    def test_relative_time_is_rendered_outside_the_cache(self):
+        self.feed()
+        Post.objects.filter(pk=self.post.pk).update(created_at=timezone.now() - timedelta(days=3))
+        self.assertIn("3\xa0days ago", self.feed())
+
+
+@plain_static
+class FollowSetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer")
+        self.client.force_login(self.viewer)
+
+    def follow_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in queries if "accounts_follow" in q["sql"]]
+
+    def test_search_results_check_follows_with_one_query(self):
+        for i in range(4):
+            user = User.objects.create_user(f"drummer{i}")
+            if i % 2:
+                Follow.objects.create(follower=self.viewer, following=user)
+
+        response, queries = self.follow_queries(reverse("accounts:search"), {"q": "drummer"})
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, "result-following", count=2)
+
+        _, queries = self.follow_queries(reverse("accounts:search"), {"q": "drummer"})
+        self.assertEqual(queries, [])
+
+    def test_follow_toggle_invalidates_the_cached_set(self):
+        target = User.objects.create_user("target")
+        self.assertFalse(follows.is_following(User.objects.get(pk=self.viewer.pk), target))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:follow_toggle", args=["target"]))
+        response, _ = self.follow_queries(reverse("accounts:profile", args=["target"]))
+        self.assertTrue(response.context["is_following"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:follow_toggle", args=["target"]))
+        response, _ = self.follow_queries(reverse("accounts:profile", args=["target"]))
+        self.assertFalse(response.context["is_following"])
+
+    def test_anonymous_users_follow_nobody(self):
+        self.client.logout()
+        response, queries = self.follow_queries(reverse("accounts:search"), {"q": "viewer"})
+        self.assertEqual(queries, [])
+        self.assertNotContains(response, "result-following")
+
+
+def _auth_queries(queries):
+    return [q["sql"] for q in queries if "django_session" in q["sql"] or "auth_user" in q["sql"]]
+
+
+@plain_static
+class SessionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("ann")
+        self.client.force_login(self.user)
+        self.url = reverse("accounts:search")
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return _auth_queries(queries)
+
+    def test_auth_and_session_queries_before_and_after(self):
+        database_only = override_settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.db",
+            MIDDLEWARE=[
+                "django.contrib.auth.middleware.AuthenticationMiddleware"
+                if name == "accounts.auth.CachedAuthenticationMiddleware" else name
+                for name in settings.MIDDLEWARE
+            ],
+        )
+        with database_only:
+            self.client.force_login(self.user)
+            self.auth_queries()
+            self.assertEqual(len(self.auth_queries()), 2)
+
+        # The client builds its middleware once, so start a fresh one.
+        self.client = self.client_class()
+        self.client.force_login(self.user)
+        self.auth_queries()
+        self.assertEqual(self.auth_queries(), [])
+
+    def test_saving_a_user_refreshes_the_cached_copy(self):
+        self.auth_queries()
+        self.user.username = "annie"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertContains(self.client.get(self.url), "annie")
+
+    def test_password_change_ends_other_sessions(self):
+        self.auth_queries()
+        self.user.set_password("a new password")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(reverse("accounts:feed")).status_code, 302)
+
+    def test_shared_redis_backend(self):
+        server = run_in_thread()
+        self.addCleanup(server.stop)
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": server.url}}
+        with self.settings(CACHES=redis):
+            self.client.force_login(self.user)
+            self.auth_queries()
+            self.assertEqual(self.auth_queries(), [])
+            self.assertTrue(any(key.endswith(b"auth-user:%d" % self.user.pk) for key in server.data))
+
+
+@contextlib.contextmanager
+def capture_selects():
+    """Collect ``(sql, params)`` for every SELECT run inside the block."""
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield statements
+
+
+def sequential_scans(statements):
+    """Return ``{sql: plan}`` for statements whose plan reads a whole table."""
+    found = {}
+    with connection.cursor() as cursor:
+        for sql, params in statements:
+            if connection.vendor == "postgresql":
+                # Tiny test tables favour seq scans; ask whether an index could be used at all.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql, params)
+                plan = [row[0] for row in cursor.fetchall()]
+                cursor.execute("RESET enable_seqscan")
+                scans = [line for line in plan if "Seq Scan" in line]
+            else:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                derived = {line.split()[-1] for line in plan if line.startswith("CO-ROUTINE")}
+                scans = [
+                    line for line in plan
+                    if (match := re.fullmatch(r"SCAN (\S+)", line))
+                    and not match[1].startswith("(") and match[1] not in derived
+                ]
+            if scans:
+                found[sql] = plan
+    return found
+
+
+@plain_static
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("viewer")
+        self.author = User.objects.create_user("author")
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.post = Post.objects.create(author=self.author, title="t", description="d", category="Band")
+        Comment.objects.create(post=self.post, user=self.viewer, text="c")
+        Like.objects.create(post=self.post, user=self.viewer)
+        self.client.force_login(self.viewer)
+
+    def test_hot_paths_use_indexes(self):
+        urls = [
+            reverse("accounts:feed"),
+            reverse("accounts:profile", args=["author"]),
+            reverse("accounts:musician_detail", args=[self.author.id]),
+            reverse("accounts:view_post", args=[self.post.id]),
+            reverse("accounts:trending"),
+            reverse("accounts:trending") + "?category=Band",
+        ]
+        with capture_selects() as statements:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertTrue(statements)
+        self.assertEqual(sequential_scans(statements), {})
+
+
+@query_budget(2)
+def _chatty_view(request):
+    for username in ("a", "b", "c"):
+        User.objects.filter(username=username).exists()
+    return HttpResponse("ok")
+
+
+def _call_through_middleware(view):
+    def get_response(request):
+        middleware.process_view(request, view, (), {})
+        return view(request)
+
+    middleware = QueryBudgetMiddleware(get_response)
+    return middleware(RequestFactory().get("/chatty/"))
+
+
+@plain_static
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("ann")
+        self.client.force_login(self.user)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_and_log_record(self):
+        with CaptureQueriesContext(connection) as queries, self.assertLogs("resonate.requests", "INFO") as logs:
+            response = self.client.get(reverse("accounts:feed"))
+
+        timing = response["Server-Timing"]
+        self.assertIn("sql;dur=", timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r"tpl;dur=(?!0\.00)")
+
+        stats = logs.records[-1].request_profile
+        self.assertEqual(stats["view"], "accounts.views.feed")
+        self.assertEqual(stats["queries"], len(queries))
+        self.assertEqual(stats["query_budget"], 7)
+        self.assertGreater(stats["template_ms"], 0)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("accounts:feed")))
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_view_over_budget_fails_with_its_repeated_queries(self):
+        with self.assertLogs("resonate.requests", "WARNING"):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "ran 3 queries, over its budget of 2") as raised:
+                _call_through_middleware(_chatty_view)
+        self.assertIn('3x SELECT %s AS "a" FROM "auth_user"', str(raised.exception))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_view_over_budget_is_logged_in_production(self):
+        with self.assertLogs("resonate.requests", "WARNING") as logs:
+            response = _call_through_middleware(_chatty_view)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(logs.records[0].request_profile["duplicate_queries"].values()), [3])
+
+    def test_fingerprint_ignores_in_list_length(self):
+        short, _ = fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s)')
+        long, normalized = fingerprint('SELECT * FROM "t"\n WHERE "id" IN (%s, %s, %s, %s)')
+        self.assertEqual(short, long)
+        self.assertEqual(normalized, 'SELECT * FROM "t" WHERE "id" IN (...)')
+
+
+
+
+CSRF_TOKEN = re.compile(r'(name="csrfmiddlewaretoken" value=|csrf_token = |X-CSRFToken": )"[^"]*"')
+
+
+@plain_static
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("ann")
+        self.musician = User.objects.create_user("bob")
+        Profile.objects.filter(user=self.musician).update(instrument="Cello")
+        Follow.objects.create(follower=self.viewer, following=self.musician)
+        self.post = Post.objects.create(author=self.musician, title="Suite", description="Bach", category="Band")
+        Like.objects.create(post=self.post, user=self.viewer)
+        Comment.objects.create(post=self.post, user=self.viewer, text="Lovely")
+        ChatThread.objects.create(user1=self.viewer, user2=self.musician)
+
+    def render_both(self, view_name, path, **kwargs):
+        """Render ``path`` with the sync and async view of the same name, from cold caches."""
+        pages = []
+        for view, factory in (
+            (getattr(views, view_name), RequestFactory()),
+            (async_to_sync(getattr(async_views, view_name)), AsyncRequestFactory()),
+        ):
+            cache.clear()
+            request = factory.get(path)
+            request.user = User.objects.get(pk=self.viewer.pk)
+
+            async def auser(user=request.user):
+                return user
+
+            request.auser = auser
+            response = view(request, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            pages.append(CSRF_TOKEN.sub(r"\1", response.content.decode()))
+        return pages
+
+    def test_async_views_render_the_same_pages(self):
+        pages = [
+            ("feed", "/feed/", {}, "Suite"),
+            ("profile_view", "/profile/", {}, "<strong>1</strong> Following"),
+            ("profile_view", "/profile/bob/", {"username": "bob"}, "Suite"),
+            ("musician_detail", "/musician/", {"user_id": self.musician.id}, "Suite"),
+            ("view_post", "/view_post/", {"post_id": self.post.id}, "Lovely"),
+            ("search_musicians", "/search/?q=cello", {}, "Cello"),
+            ("trending", "/trending/?category=Band", {}, "Suite"),
+        ]
+        for view_name, path, kwargs, expected in pages:
+            with self.subTest(view_name, path=path):
+                sync_page, async_page = self.render_both(view_name, path, **kwargs)
+                self.assertIn(expected, async_page)
+                self.assertEqual(async_page, sync_page)
+
+    def test_async_views_hand_posts_to_the_sync_views(self):
+        request = AsyncRequestFactory().post(
+            "/profile/bob/", {"comment": "1", "post_id": self.post.id, "comment_text": "Encore"},
+        )
+        request.user = User.objects.get(pk=self.viewer.pk)
+
+        async def auser(user=request.user):
+            return user
+
+        request.auser = auser
+        with mock.patch.object(views, "profile_view", wraps=views.profile_view) as sync_view:
+            response = async_to_sync(async_views.profile_view)(request, username="bob")
+        self.assertEqual(response.status_code, 302)
+        sync_view.assert_called_once_with(request, "bob")
+        self.assertTrue(Comment.objects.filter(post=self.post, text="Encore").exists())
+
+    @override_settings(SERVER_TIMING=True)
+    async def test_whole_stack_runs_async(self):
+        await self.async_client.aforce_login(self.viewer)
+        response = await self.async_client.get(reverse("accounts:feed"))
+
+        self.assertContains(response, "Suite")
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+        for name in settings.MIDDLEWARE:
+            with self.subTest(name):
+                self.assertTrue(import_string(name).async_capable)
+        static = await self.async_client.get("/static/style.css")
+        self.assertEqual(static.status_code, 200)
+
+
+
+@plain_static
+class ProfileLoadingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user("ann")
+        self.musician = User.objects.create_user("bob")
+        Follow.objects.create(follower=self.viewer, following=self.musician)
+        self.posts = [
+            Post.objects.create(author=self.musician, title=f"Take {i}", description="", category="Band")
+            for i in range(3)
+        ]
+
+    def test_loads_user_profile_follow_state_and_posts_in_two_queries(self):
+        with self.assertNumQueries(2):
+            page = load_profile(self.viewer, username="bob")
+        self.assertEqual(page.user, self.musician)
+        self.assertTrue(page.is_following)
+        self.assertEqual((page.follower_count, page.following_count, page.post_count), (1, 0, 3))
+        self.assertEqual([post.title for post in page.posts], ["Take 2", "Take 1", "Take 0"])
+        self.assertIsNone(page.next_cursor)
+
+        with self.assertNumQueries(2):
+            page = async_to_sync(aload_profile)(self.viewer, limit=2, id=self.musician.id)
+        self.assertTrue(page.is_following)
+        self.assertEqual([post.title for post in page.posts], ["Take 2", "Take 1"])
+
+        older = load_profile(self.viewer, decode_cursor(page.next_cursor), limit=2, id=self.musician.id)
+        self.assertEqual([post.title for post in older.posts], ["Take 0"])
+
+    def test_own_profile_missing_profile_and_unknown_user(self):
+        self.assertFalse(load_profile(self.viewer, id=self.viewer.id).is_following)
+        self.assertFalse(load_profile(self.musician, username="ann").is_following)
+
+        Profile.objects.filter(user=self.musician).delete()
+        self.assertEqual(load_profile(self.viewer, username="bob").profile.user, self.musician)
+        with self.assertRaises(Http404):
+            load_profile(self.viewer, username="nobody")
+
+    @override_settings(PROFILE_PAGE_SIZE=2)
+    def test_profile_pages_link_to_older_posts(self):
+        self.client.force_login(self.viewer)
+        for url in (reverse("accounts:profile", args=["bob"]), reverse("accounts:musician_detail", args=[self.musician.id])):
+            with self.subTest(url):
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(len(queries), 2)
+                self.assertContains(response, "Take 2")
+                self.assertNotContains(response, "Take 0")
+                older = self.client.get(url, {"before": response.context["next_cursor"]})
+                self.assertContains(older, "Take 0")
+                self.assertNotContains(older, "Older posts")
+
+
+@plain_static
+class SyntheticDataTests(TestCase):
+    def seed(self, **options):
+        call_command(
+            "seed_data", users=30, follows=4, posts=2, likes=3, comments=1, threads=1, messages=3,
+            stdout=io.StringIO(), **options,
+        )
+
+    def test_seed_data_fills_every_table_consistently(self):
+        self.seed()
+
+        self.assertEqual(User.objects.filter(username__startswith="synth").count(), 30)
+        self.assertEqual(Profile.objects.exclude(instrument="").count(), 30)
+        for model in (Follow, Post, Like, Comment, ChatThread, Message):
+            self.assertTrue(model.objects.exists(), model.__name__)
+        self.assertFalse(Follow.objects.filter(follower=F("following")).exists())
+        self.assertEqual(sum(reconcile(dry_run=True).values()), 0)
+        thread = ChatThread.objects.select_related("last_message").first()
+        self.assertEqual(thread.last_message, thread.messages.order_by("timestamp", "id").last())
+
+    def test_seed_data_is_repeatable_and_refuses_to_reuse_a_prefix(self):
+        self.seed()
+        posts = Post.objects.order_by("id").values_list("author__username", "title", "category")
+        first = list(posts)
+        User.objects.filter(username__startswith="synth").delete()
+
+        self.seed()
+        self.assertEqual(list(posts), first)
+        with self.assertRaisesMessage(CommandError, "already exist"):
+            self.seed()
+
+    def test_benchmark_saves_and_compares_baselines(self):
+        self.seed()
+        baseline = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(baseline))
+
+        out = io.StringIO()
+        call_command("benchmark", iterations=3, warmup=1, viewers=2, save=baseline, stdout=out)
+        report = benchmark.load(baseline)
+        self.assertEqual(set(report["results"]), set(benchmark.SCENARIOS))
+        self.assertEqual(report["results"]["inbox_view"]["requests"], 3)
+        self.assertIn("thread_view", out.getvalue())
+
+        worse = copy.deepcopy(report)
+        worse["results"]["feed"]["queries"] += 1
+        worse["results"]["profile_view"]["p95_ms"] = report["results"]["profile_view"]["p95_ms"] * 2 + 10
+        self.assertEqual(
+            [message.split(":")[0] for message in benchmark.compare(worse, report)], ["feed", "profile_view"],
+        )
+        self.assertEqual(benchmark.compare(report, report), [])
+
+        self.assertEqual(report["meta"]["dataset"]["users"], User.objects.count())
+        self.assertEqual(benchmark.mismatches(report, report), [])
+        elsewhere = copy.deepcopy(report)
+        elsewhere["meta"]["machine"]["cpus"] += 1
+        self.assertEqual(len(benchmark.mismatches(report, elsewhere)), 1)
+
+    def test_committed_baseline_loads(self):
+        path = os.path.join(settings.BASE_DIR, "benchmarks", "sqlite-1000.json")
+        baseline = benchmark.load(path)
+        self.assertEqual(set(baseline["results"]), set(benchmark.SCENARIOS))
+        self.assertEqual(baseline["meta"]["dataset"]["users"], 1000)
+
+
+def _post_ids(html):
+    chunks = html.split('data-post-id="')[1:]
+    return [chunk.split('"', 1)[0] for chunk in chunks]
@@ -0,0 +1,141 @@
+"""
+Fan-out-on-write home timelines.
+
+When ``FEED_FANOUT`` is enabled every new post is copied into a
+``TimelineEntry`` row for each follower, so reading a feed page is one range
+scan on ``(owner, created_at, post)``. Authors with more than
+``FEED_FANOUT_FOLLOWER_LIMIT`` followers are skipped at write time and their
+posts are merged in when the feed is read instead.
+
+An unfollow that brings an author back to the limit switches them to
+fan-out on write, so ``follower_count_changed`` copies their recent posts
+into their followers' timelines; the ones made above the limit never were.
+Follower counts changed any other way (the admin, ``reconcile_counters``)
+don't trigger this and need ``rebuild_timelines``.
+"""
+from django.conf import settings
+
+from .models import Follow, Post, Profile, TimelineEntry
+from .pagination import encode_cursor, seek
+
+BATCH_SIZE = 1000
+
+
+def is_enabled():
+    return getattr(settings, "FEED_FANOUT", False)
+
+
+def get_follower_limit():
+    return getattr(settings, "FEED_FANOUT_FOLLOWER_LIMIT", 10000)
+
+
+def get_backfill_size():
+    return getattr(settings, "FEED_FANOUT_BACKFILL", 100)
+
+
+def is_high_fanout(author):
+    return Profile.objects.filter(user=author, follower_count__gt=get_follower_limit()).exists()
+
+
+def _entry(owner_id, post):
+    return TimelineEntry(owner_id=owner_id, post=post, author_id=post.author_id, created_at=post.created_at)
+
+
+def fan_out_post(post):
+    """Write ``post`` into its author's timeline and, unless skipped, every follower's."""
+    TimelineEntry.objects.bulk_create([_entry(post.author_id, post)], ignore_conflicts=True)
+    if is_high_fanout(post.author):
+        return
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list("follower_id", flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(_entry(follower_id, post))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def add_author(owner, author):
+    """Backfill ``author``'s recent posts into ``owner``'s timeline after a follow."""
+    if is_high_fanout(author):
+        return
+    posts = Post.objects.filter(author=author).order_by("-created_at", "-id")[:get_backfill_size()]
+    TimelineEntry.objects.bulk_create([_entry(owner.id, post) for post in posts], ignore_conflicts=True)
+
+
+def backfill_followers(author):
+    """Copy ``author``'s recent posts into every follower's timeline."""
+    posts = list(Post.objects.filter(author=author).order_by("-created_at", "-id")[:get_backfill_size()])
+    if not posts:
+        return
+    follower_ids = Follow.objects.filter(following=author).values_list("follower_id", flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(_entry(follower_id, post) for post in posts)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def follower_count_changed(author, follower_count, following):
+    """Backfill ``author``'s followers if an unfollow just brought them back to the fan-out limit."""
+    if not following and follower_count == get_follower_limit():
+        backfill_followers(author)
+
+
+def remove_author(owner, author):
+    """Drop ``author``'s posts from ``owner``'s timeline after an unfollow."""
+    TimelineEntry.objects.filter(owner=owner, author=author).delete()
+
+
+def high_fanout_author_ids(user):
+    """IDs of followed authors whose posts are merged at read time."""
+    return list(
+        Follow.objects.filter(follower=user, following__profile__follower_count__gt=get_follower_limit())
+        .values_list("following_id", flat=True)
+    )
+
+
+def get_timeline_page(user, cursor, limit):
+    """Return ``(posts, next_cursor)`` from the materialized timeline, merged with high-fanout authors."""
+    entries = seek(TimelineEntry.objects.filter(owner=user), cursor, pk_field="post_id")
+    candidates = [
+        (entry.created_at, entry.post_id)
+        for entry in entries.only("created_at", "post_id")[:limit + 1]
+    ]
+
+    merged_ids = high_fanout_author_ids(user)
+    if merged_ids:
+        merged = seek(Post.objects.filter(author_id__in=merged_ids), cursor)
+        candidates.extend(merged.values_list("created_at", "id")[:limit + 1])
+        candidates = sorted(set(candidates), reverse=True)
+
+    page = candidates[:limit]
+    posts_by_id = Post.objects.select_related("author", "author__profile").in_bulk([pk for _, pk in page])
+    posts = [posts_by_id[pk] for _, pk in page if pk in posts_by_id]
+
+    next_cursor = None
+    if len(candidates) > limit:
+        next_cursor = encode_cursor(*page[-1])
+    return posts, next_cursor
+
+
+def rebuild_timeline(user, depth):
+    """Recreate ``user``'s timeline from the follow graph, keeping the newest ``depth`` posts."""
+    TimelineEntry.objects.filter(owner=user).delete()
+
+    skipped = set(high_fanout_author_ids(user))
+    author_ids = [
+        pk for pk in Follow.objects.filter(follower=user).values_list("following_id", flat=True)
+        if pk not in skipped
+    ]
+    author_ids.append(user.id)
+
+    posts = Post.objects.filter(author_id__in=author_ids).order_by("-created_at", "-id")[:depth]
+    TimelineEntry.objects.bulk_create([_entry(user.id, post) for post in posts], batch_size=BATCH_SIZE)
+    return len(posts)
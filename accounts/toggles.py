@@ -0,0 +1,329 @@
+"""
+Race-free likes and follows.
+
+Each change is one statement: ``INSERT ... ON CONFLICT DO NOTHING
+RETURNING`` to add the row, or ``DELETE ... RETURNING`` to remove it. Only
+a request whose statement actually changed a row moves the denormalized
+counter. It does that with ``UPDATE ... RETURNING``, which hands back the
+new count, so nothing is ever re-counted. A like's weight moves the post's
+``trending_score`` in the same statement; an unlike has the post rescored
+(see ``trending.rescore``). Two people liking the same post at
+once, or one person double-clicking, insert one row and add one to the
+count. ``set_likes`` applies a whole batch of like states the same way,
+for ``accounts.likebuffer``. Both record each unlike in ``Unlike``, so a
+replayed older like can't bring it back.
+
+These bypass ``save()`` and ``delete()``, so the ``post_save`` and
+``post_delete`` receivers don't run; the same cache invalidation is done
+here instead.
+
+Only PostgreSQL and SQLite 3.35+ support the ``ON CONFLICT`` and
+``RETURNING`` clauses used. On other databases, such as MySQL, each row
+goes in through ``bulk_create`` in its own savepoint, comes out through a
+plain ``DELETE`` whose row count says whether it was still there, and
+counters move with an ``F()`` update followed by a read. All of it runs in
+the caller's transaction, so the outcome is the same, at the cost of a few
+more statements per row.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import follows, fragments
+from .counters import adjusted
+from .models import Follow, Like, Post, Profile, Unlike
+from .trending import rescore, score_change
+
+
+# Rows per multi-row statement, well under SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+
+
+def _quote(model, *names):
+    return [
+        connection.ops.quote_name((model._meta.pk if name == "pk" else model._meta.get_field(name)).column)
+        for name in names
+    ]
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def native():
+    """Whether the database takes the ``ON CONFLICT`` and ``RETURNING`` clauses."""
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _attnames(model, names):
+    return [model._meta.pk.attname if name == "pk" else model._meta.get_field(name).attname for name in names]
+
+
+def insert_rows(model, names, rows, returning="pk"):
+    """
+    Insert ``rows`` (value lists for the fields ``names``), skipping any that
+    would violate a unique constraint.
+
+    Returns the ``returning`` field of each row actually inserted.
+    """
+    if not rows:
+        return []
+    if not native():
+        return _insert_rows_portably(model, names, rows, returning)
+    fields = [model._meta.get_field(name) for name in names]
+    placeholders = "({})".format(", ".join(["%s"] * len(names)))
+    sql = "INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}".format(
+        _table(model),
+        ", ".join(_quote(model, *names)),
+        ", ".join([placeholders] * len(rows)),
+        *_quote(model, returning),
+    )
+    params = [field.get_db_prep_save(value, connection) for row in rows for field, value in zip(fields, row)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_rows(model, names, rows, returning="pk"):
+    """Delete the rows whose fields ``names`` match one of ``rows``; returns their ``returning`` field."""
+    if not rows:
+        return []
+    if not native():
+        return _delete_rows_portably(model, names, rows, returning)
+    match = "({})".format(" AND ".join(f"{column} = %s" for column in _quote(model, *names)))
+    sql = "DELETE FROM {} WHERE {} RETURNING {}".format(
+        _table(model),
+        " OR ".join([match] * len(rows)),
+        *_quote(model, returning),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _insert_rows_portably(model, names, rows, returning):
+    # bulk_create() sends no signals. The pk can't be read back on MySQL, so
+    # returning "pk" gives None for each row inserted, which still counts.
+    attnames = _attnames(model, names)
+    [returned] = _attnames(model, [returning])
+    inserted = []
+    for row in rows:
+        instance = model(**dict(zip(attnames, row)))
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([instance])
+        except IntegrityError:
+            continue
+        inserted.append(getattr(instance, returned))
+    return inserted
+
+
+def _delete_rows_portably(model, names, rows, returning):
+    # Only the statement that actually removes a row reports it, as with RETURNING.
+    attnames = _attnames(model, names)
+    [returned] = _attnames(model, [returning])
+    [pk] = _quote(model, "pk")
+    deleted = []
+    for row in rows:
+        matching = model.objects.filter(**dict(zip(attnames, row))).values_list("pk", returned)
+        for key, value in matching:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {_table(model)} WHERE {pk} = %s", [key])
+                if cursor.rowcount:
+                    deleted.append(value)
+    return deleted
+
+
+def insert(model, **values):
+    """Insert a row unless it would violate a unique constraint; returns whether it did."""
+    values.setdefault("created_at", timezone.now())
+    return bool(insert_rows(model, list(values), [list(values.values())]))
+
+
+def delete(model, **values):
+    """Delete the rows matching ``values``; returns whether there were any."""
+    return bool(delete_rows(model, list(values), [list(values.values())]))
+
+
+def adjust(model, key, counter, delta, scores=None):
+    """
+    Add ``delta`` to ``counter`` on the row where ``key`` is ``(field, value)``.
+
+    Each ``{field: change}`` in ``scores`` is added too. Neither the counter
+    nor a score goes below zero. Returns the new counter value, or None if
+    there is no such row.
+    """
+    field, value = key
+    if not native():
+        return _adjust_portably(model, key, counter, delta, scores)
+    column, target = _quote(model, counter, field)
+    assignments = []
+    params = []
+    for name, change in {counter: delta, **(scores or {})}.items():
+        [quoted] = _quote(model, name)
+        assignments.append(f"{quoted} = CASE WHEN {quoted} + %s > 0 THEN {quoted} + %s ELSE 0 END")
+        params += [change, change]
+    sql = f"UPDATE {_table(model)} SET {', '.join(assignments)} WHERE {target} = %s RETURNING {column}"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, value])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _adjust_portably(model, key, counter, delta, scores):
+    # The UPDATE locks the row until the transaction ends, so the read sees this change.
+    field, value = key
+    changes = {name: adjusted(name, change) for name, change in {counter: delta, **(scores or {})}.items()}
+    rows = model.objects.filter(**{field: value})
+    with transaction.atomic():
+        if not rows.update(**changes):
+            return None
+        return rows.values_list(counter, flat=True).get()
+
+
+def current(model, key, counter):
+    field, value = key
+    return model.objects.filter(**{field: value}).values_list(counter, flat=True).first() or 0
+
+
+def set_like(user_id, post_id, liked):
+    """
+    Make ``user_id``'s like of ``post_id`` match ``liked``; returns ``(changed, like_count)``.
+
+    Raises ``Post.DoesNotExist`` if there is no such post.
+    """
+    key = ("id", post_id)
+    with transaction.atomic():
+        if liked:
+            changed = insert(Like, post_id=post_id, user_id=user_id)
+        else:
+            changed = delete(Like, post_id=post_id, user_id=user_id)
+        if not changed:
+            return False, current(Post, key, "like_count")
+        if liked:
+            count = adjust(Post, key, "like_count", 1, {"trending_score": score_change(likes=1)})
+        else:
+            count = adjust(Post, key, "like_count", -1)
+            rescore([post_id])
+            # Write-behind may be turned on later; its replays must see this unlike.
+            record_unlikes([(post_id, user_id, timezone.now())])
+        if count is None:
+            # Foreign keys are only checked at commit; roll the like back now.
+            raise Post.DoesNotExist("No such post.")
+        fragments.bump_post(post_id)
+    return True, count
+
+
+def set_follow(follower_id, following_id, following):
+    """Make ``follower_id`` follow ``following_id`` or not; returns ``(changed, follower_count)``."""
+    key = ("user_id", following_id)
+    with transaction.atomic():
+        if following:
+            changed = insert(Follow, follower_id=follower_id, following_id=following_id)
+        else:
+            changed = delete(Follow, follower_id=follower_id, following_id=following_id)
+        if not changed:
+            return False, current(Profile, key, "follower_count")
+        delta = 1 if following else -1
+        count = adjust(Profile, key, "follower_count", delta) or 0
+        adjust(Profile, ("user_id", follower_id), "following_count", delta)
+        fragments.bump_profile(follower_id)
+        fragments.bump_profile(following_id)
+        follows.forget(follower_id)
+    return True, count
+
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def record_unlikes(rows):
+    """Store the time of each ``(post_id, user_id, at)`` unlike, replacing any earlier one."""
+    unlikes = [Unlike(post_id=post_id, user_id=user_id, created_at=at) for post_id, user_id, at in rows]
+    if native():
+        Unlike.objects.bulk_create(
+            unlikes, batch_size=CHUNK_SIZE,
+            update_conflicts=True, unique_fields=["post", "user"], update_fields=["created_at"],
+        )
+        return
+    # MySQL can't name the conflicting fields; update, else insert, else a
+    # concurrent insert won and this updates its row.
+    for unlike in unlikes:
+        matching = Unlike.objects.filter(post_id=unlike.post_id, user_id=unlike.user_id)
+        if matching.update(created_at=unlike.created_at):
+            continue
+        try:
+            with transaction.atomic():
+                Unlike.objects.bulk_create([unlike])
+        except IntegrityError:
+            matching.update(created_at=unlike.created_at)
+
+
+def newer_writes(keys, times):
+    """The keys with a like or unlike written after the time ``times`` gives for them."""
+    post_ids = {post_id for _, post_id in keys}
+    user_ids = {user_id for user_id, _ in keys}
+    written = {}
+    for model in (Like, Unlike):
+        rows = model.objects.filter(post_id__in=post_ids, user_id__in=user_ids)
+        for user_id, post_id, created_at in rows.values_list("user_id", "post_id", "created_at"):
+            key = (user_id, post_id)
+            written[key] = max(created_at, written.get(key, created_at))
+    return {key for key in keys if key in written and written[key] > times[key]}
+
+
+def set_likes(states, times=None):
+    """
+    Apply many like states, ``{(user_id, post_id): liked}``, in one transaction.
+
+    Rows go in and out with multi-row ``INSERT``/``DELETE`` statements, and
+    each post's counter moves once by its net change. Likes of posts or by
+    users that no longer exist are dropped. ``times`` maps each key to
+    when its state was chosen; a state older than the latest like or
+    unlike already written for its key is dropped too, and the time is
+    stored with the like or unlike. Returns ``{post_id: change}`` for the
+    posts whose count changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if times:
+            stale = newer_writes(states, times)
+            states = {key: liked for key, liked in states.items() if key not in stale}
+        else:
+            times = {}
+        post_ids = {post_id for _, post_id in states}
+        user_ids = {user_id for user_id, _ in states}
+        posts = set(Post.objects.filter(id__in=post_ids).values_list("id", flat=True))
+        users = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True))
+        added = [
+            (post_id, user_id, times.get((user_id, post_id), now)) for (user_id, post_id), liked in states.items()
+            if liked and post_id in posts and user_id in users
+        ]
+        removed = [(post_id, user_id) for (user_id, post_id), liked in states.items() if not liked]
+
+        changes = Counter()
+        for rows in chunks(added):
+            changes.update(insert_rows(Like, ["post", "user", "created_at"], rows, returning="post"))
+        unliked = set()
+        for rows in chunks(removed):
+            deleted = delete_rows(Like, ["post", "user"], rows, returning="post")
+            changes.subtract(deleted)
+            unliked.update(deleted)
+        record_unlikes([
+            (post_id, user_id, times.get((user_id, post_id), now))
+            for post_id, user_id in removed if post_id in posts and user_id in users
+        ])
+
+        changes = {post_id: change for post_id, change in changes.items() if change}
+        for post_id, change in changes.items():
+            scores = None if post_id in unliked else {"trending_score": score_change(likes=change)}
+            adjust(Post, ("id", post_id), "like_count", change, scores)
+            fragments.bump_post(post_id)
+        # Unlikes take back what the like has decayed to, not its full weight.
+        rescore(unliked)
+    return changes
@@ -0,0 +1,167 @@
+"""
+Trending posts.
+
+Each post's ``trending_score`` is a time-decayed engagement score, kept up
+to date as events arrive. A like adds ``TRENDING_LIKE_WEIGHT`` and a
+comment ``TRENDING_COMMENT_WEIGHT``, in the same ``UPDATE`` that moves the
+post's counters (see ``accounts.signals`` and ``accounts.toggles``).
+Removing one ``rescore``s the post from its remaining likes and comments,
+as what the removed one still contributed depends on how far it decayed.
+
+The ``decay_trending`` command, run every ``TRENDING_DECAY_INTERVAL``
+minutes, multiplies every score by ``0.5 ** (interval / half-life)``, with
+the half-life set by ``TRENDING_HALF_LIFE_HOURS``. Scores that fall below
+``TRENDING_MIN_SCORE`` drop to zero, so each decay only touches posts with
+recent activity. ``rebuild`` recomputes every score from the likes and
+comments tables, for a fresh deployment or after a change of weights.
+
+Trending pages read the ``(category, -trending_score, -id)`` and
+``(-trending_score, -id)`` indexes on ``Post``; nothing is aggregated at
+request time.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Like, Post
+
+
+def get_like_weight():
+    return getattr(settings, "TRENDING_LIKE_WEIGHT", 1.0)
+
+
+def get_comment_weight():
+    return getattr(settings, "TRENDING_COMMENT_WEIGHT", 3.0)
+
+
+def get_half_life():
+    """The half-life of a score, in hours."""
+    return getattr(settings, "TRENDING_HALF_LIFE_HOURS", 6.0)
+
+
+def get_decay_interval():
+    """Minutes between ``decay_trending`` runs."""
+    return getattr(settings, "TRENDING_DECAY_INTERVAL", 15)
+
+
+def get_min_score():
+    return getattr(settings, "TRENDING_MIN_SCORE", 0.05)
+
+
+def get_page_size():
+    return getattr(settings, "TRENDING_PAGE_SIZE", 20)
+
+
+def score_change(likes=0, comments=0):
+    """How much ``likes`` and ``comments`` added move a score."""
+    return likes * get_like_weight() + comments * get_comment_weight()
+
+
+def adjusted_score(change):
+    """An update expression adding ``change`` to ``trending_score``, never going below zero."""
+    if change >= 0:
+        return F("trending_score") + change
+    return Greatest(F("trending_score") + change, Value(0.0))
+
+
+def decay_factor(minutes=None):
+    """What scores are multiplied by after ``minutes`` (default: one decay interval)."""
+    if minutes is None:
+        minutes = get_decay_interval()
+    return 0.5 ** (minutes / 60 / get_half_life())
+
+
+def decay(minutes=None):
+    """
+    Decay every score by ``minutes`` worth of half-life; returns the number of posts touched.
+
+    Scores that would fall below ``TRENDING_MIN_SCORE`` become zero.
+    """
+    factor = decay_factor(minutes)
+    return Post.objects.filter(trending_score__gt=0).update(
+        trending_score=Case(
+            When(trending_score__lt=get_min_score() / factor, then=Value(0.0)),
+            default=F("trending_score") * factor,
+        )
+    )
+
+
+def event_scores(now, post_ids=None):
+    """
+    ``{post_id: score}`` from the likes and comments, optionally only of ``post_ids``.
+
+    Each event counts its weight halved once per half-life since it
+    happened. Events old enough to be below ``TRENDING_MIN_SCORE`` on
+    their own are skipped, and so are totals below it.
+    """
+    half_life = get_half_life() * 3600
+    min_score = get_min_score()
+    weights = ((Like, get_like_weight()), (Comment, get_comment_weight()))
+    halvings = math.log2(max(weight for _, weight in weights) / min_score)
+    horizon = now - timedelta(seconds=half_life * max(halvings, 0))
+    scores = defaultdict(float)
+    for model, weight in weights:
+        events = model.objects.filter(created_at__gte=horizon)
+        if post_ids is not None:
+            events = events.filter(post_id__in=post_ids)
+        for post_id, created_at in events.values_list("post_id", "created_at").iterator():
+            scores[post_id] += weight * 0.5 ** ((now - created_at).total_seconds() / half_life)
+    return {post_id: score for post_id, score in scores.items() if score >= min_score}
+
+
+def rebuild(now=None):
+    """Recompute every score from the likes and comments tables; returns the number of posts scored."""
+    now = now or timezone.now()
+    scores = event_scores(now)
+    with transaction.atomic():
+        Post.objects.filter(trending_score__gt=0).update(trending_score=0)
+        posts = [Post(pk=post_id, trending_score=score) for post_id, score in scores.items()]
+        Post.objects.bulk_update(posts, ["trending_score"], batch_size=500)
+    return len(scores)
+
+
+def rescore(post_ids, now=None):
+    """
+    Recompute the scores of ``post_ids`` the way ``rebuild`` does.
+
+    Used when a like or comment goes away. Its weight has decayed since it
+    was added, so subtracting the full weight would take too much. The
+    posts are locked first, so a like or comment added meanwhile either
+    waits and adds its weight afterwards or is already counted here.
+    """
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    with transaction.atomic():
+        locked = list(Post.objects.select_for_update().filter(pk__in=post_ids).order_by("pk").values_list("pk", flat=True))
+        scores = event_scores(now or timezone.now(), locked)
+        posts = [Post(pk=post_id, trending_score=scores.get(post_id, 0.0)) for post_id in locked]
+        Post.objects.bulk_update(posts, ["trending_score"], batch_size=500)
+
+
+def parse_category(value):
+    """``value`` if it is one of ``Post.CATEGORY_CHOICES``, else None."""
+    return value if value in dict(Post.CATEGORY_CHOICES) else None
+
+
+def trending_queryset(category=None):
+    """Posts with a score, highest first, optionally in one ``category``."""
+    posts = Post.objects.filter(trending_score__gt=0)
+    if category:
+        posts = posts.filter(category=category)
+    return posts.select_related("author", "author__profile").order_by("-trending_score", "-id")
+
+
+def trending_posts(category=None, limit=None):
+    """The top ``limit`` trending posts, optionally in one ``category``."""
+    return list(trending_queryset(category)[:limit or get_page_size()])
+
+
+async def atrending_posts(category=None, limit=None):
+    return [post async for post in trending_queryset(category)[:limit or get_page_size()]]
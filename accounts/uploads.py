@@ -0,0 +1,70 @@
+"""
+Bounded handling of image uploads.
+
+``SizeLimitedUploadHandler`` replaces Django's default handlers, so
+uploads are always streamed to a temporary file in chunks and never
+buffered in memory. Once a file passes ``IMAGE_UPLOAD_MAX_BYTES`` its
+remaining chunks are dropped, but the parser still reports the full size,
+so ``check_image_upload`` can reject the file with a form error. It also
+reads just the image header to refuse anything over ``IMAGE_MAX_PIXELS``
+before Pillow decodes it. Originals larger than ``IMAGE_MAX_DIMENSION`` are
+downscaled by ``accounts.images`` after upload.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+
+def get_max_bytes():
+    return getattr(settings, "IMAGE_UPLOAD_MAX_BYTES", 10 * 1024 * 1024)
+
+
+def get_max_pixels():
+    return getattr(settings, "IMAGE_MAX_PIXELS", 40_000_000)
+
+
+def get_max_dimension():
+    return getattr(settings, "IMAGE_MAX_DIMENSION", 4096)
+
+
+class SizeLimitedUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to a temporary file, discarding everything past the byte limit."""
+
+    def receive_data_chunk(self, raw_data, start):
+        # The parser keeps counting dropped chunks, so the file's size stays
+        # the real upload size for check_image_upload to reject.
+        if start + len(raw_data) > get_max_bytes():
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+
+def check_image_upload(upload):
+    """Raise ``ValidationError`` if ``upload`` is too large in bytes or in decoded pixels."""
+    max_bytes = get_max_bytes()
+    if upload.size > max_bytes:
+        raise ValidationError(
+            "Images must be %(limit)s or smaller.",
+            code="file_too_large",
+            params={"limit": filesizeformat(max_bytes)},
+        )
+
+    try:
+        # Image.open only parses the header; pixel data is not decoded here.
+        with Image.open(upload) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = None
+    except Exception:
+        # Not an image at all; ImageField reports that.
+        return
+    finally:
+        upload.seek(0)
+
+    if width is None or width * height > get_max_pixels():
+        raise ValidationError(
+            "Images can be at most %(limit)s megapixels.",
+            code="too_many_pixels",
+            params={"limit": f"{get_max_pixels() / 1_000_000:g}"},
+        )
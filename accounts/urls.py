@@ -1,13 +1,19 @@
+from django.conf import settings
 from django.urls import path, include, reverse_lazy
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
 
 app_name = 'accounts'
 
+# Read-heavy pages have async versions for ASGI deployments.
+read_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.home_view, name='home'),
-    path('feed/', views.feed, name='feed'),
-    path("view_post/<int:post_id>/", views.view_post, name="view_post"),
+    path('feed/', read_views.feed, name='feed'),
+    path('feed/more/', views.feed_more, name='feed_more'),
+    path('trending/', read_views.trending, name='trending'),
+    path("view_post/<int:post_id>/", read_views.view_post, name="view_post"),
 
     # auth
     path("signup/", views.signup_view, name="signup"),
@@ -15,8 +21,8 @@ urlpatterns = [
     path("logout/", views.logout_view, name="logout"),
 
     # Profile Mgt 
-    path('profile/', views.profile_view, name='my_profile'), 
-    path('profile/<str:username>/', views.profile_view, name='profile'), 
+    path('profile/', read_views.profile_view, name='my_profile'), 
+    path('profile/<str:username>/', read_views.profile_view, name='profile'), 
     path('edit_profile/', views.edit_profile, name='edit_profile'),
 
     # password change
@@ -64,8 +70,8 @@ urlpatterns = [
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
 
 
-    path('search/', views.search_musicians, name='search'),
+    path('search/', read_views.search_musicians, name='search'),
     
 
-    path("musician/<int:user_id>/", views.musician_detail, name="musician_detail"),
+    path("musician/<int:user_id>/", read_views.musician_detail, name="musician_detail"),
 ]
\ No newline at end of file
@@ -1,14 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import login, authenticate, logout as auth_logout
 from django.contrib.auth.decorators import login_required
-from .forms import SignUpForm, ProfileForm, PostForm, CommentForm, EditProfileForm
-from .models import Profile, Follow, Post, Like, Comment
-from django.db.models import Q, Prefetch
+from .forms import SignUpForm, ProfileForm, PostForm, CommentForm
+from .models import Profile, Post, Like, Comment, Facet, normalize_facet
+from . import likebuffer, timeline, toggles
+from .feed import get_feed_page
+from .hydration import hydrate_posts
+from .facets import facet_counts_within
+from .profiles import load_profile
+from .search import get_search_backend
+from .pagination import decode_cursor
+from .trending import parse_category, trending_posts
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.contrib import messages
+import json
 import logging
+from functools import partial
+
+from resonate.middleware import query_budget
 
 # Initialize logger globally at the top of the module
 logger = logging.getLogger(__name__)
@@ -23,8 +35,8 @@ def signup_view(request):
     if request.method == "POST":
         form = SignUpForm(request.POST)
         if form.is_valid():
+            # The profile is created by the post_save signal on User.
             user = form.save()
-            Profile.objects.create(user=user)
             login(request, user)
             return redirect("accounts:my_profile") 
     else:
@@ -54,23 +66,8 @@ def logout_view(request):
 #profile
 
 @login_required
+@query_budget(4)
 def profile_view(request, username=None):
-    if username:
-        profile_user = get_object_or_404(Profile, user__username=username).user
-    else:
-        profile_user = request.user 
-
-    profile, created = Profile.objects.get_or_create(user=profile_user)
-    posts = Post.objects.filter(author=profile_user).order_by('-created_at')
-    follower_count = Follow.objects.filter(following=profile_user).count()
-    following_count = Follow.objects.filter(follower=profile_user).count()
-
-
-    is_following = False
-    if request.user.is_authenticated and request.user != profile_user:
-        is_following = Follow.objects.filter(follower=request.user, following=profile_user).exists()
-
-
     if request.method == "POST" and "comment" in request.POST:
         post_id = request.POST.get("post_id")
         comment_text = request.POST.get("comment_text")
@@ -83,28 +80,23 @@ def profile_view(request, username=None):
             else:
                 return redirect("accounts:my_profile") 
 
-    liked_posts = set(
-        Like.objects.filter(user=request.user, post__in=posts).values_list("post_id", flat=True)
-    )
-
-    comments_by_post = {
-        post.id: Comment.objects.filter(post=post).order_by('-created_at')
-        for post in posts
-    }
+    lookup = {"username": username} if username else {"id": request.user.id}
+    page = load_profile(request.user, decode_cursor(request.GET.get("before")), **lookup)
+    profile_user = page.user
 
-    form = ProfileForm(instance=profile) if request.user == profile_user else None
+    form = ProfileForm(instance=page.profile) if request.user == profile_user else None
 
     context = {
         "profile_user": profile_user,
-        "profile": profile,
-        "posts": posts,
-        "follower_count": follower_count,
-        "following_count": following_count,
-        "total_posts": posts.count(),
-        "liked_posts": liked_posts,
-        "comments_by_post": comments_by_post,
+        "profile": page.profile,
+        "posts": page.posts,
+        "next_cursor": page.next_cursor,
+        "follower_count": page.follower_count,
+        "following_count": page.following_count,
+        "total_posts": page.post_count,
         "form": form,
-        "is_following": is_following,
+        "is_following": page.is_following,
+        "header_version": page.header_version,
     }
 
     return render(request, "accounts/profile.html", context)
@@ -127,6 +119,42 @@ def edit_profile(request):
     })
 
 
+def requested_state(request, name):
+    """
+    The state a toggle asks for in its ``name`` field (JSON or form), or None to flip it.
+
+    Clients that send the state they want get idempotent requests: a retry
+    or double-click can't undo the first.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            data = {}
+    else:
+        data = request.POST
+    value = data.get(name) if hasattr(data, "get") else None
+    if value is None:
+        return None
+    return value in (True, 1, "1", "true", "on")
+
+
+def apply_toggle(set_state, requested):
+    """
+    Call ``set_state(state)`` for the ``requested`` state, or flip the current one if None.
+
+    Returns ``(state, changed, count)``.
+    """
+    if requested is not None:
+        changed, count = set_state(requested)
+        return requested, changed, count
+    changed, count = set_state(True)
+    if changed:
+        return True, True, count
+    changed, count = set_state(False)
+    return False, changed, count
+
+
 #follow
 @login_required
 def follow_toggle(request, username):
@@ -142,19 +170,17 @@ def follow_toggle(request, username):
         return JsonResponse({'error': 'Cannot follow yourself'}, status=400)
 
     follower = request.user
-    
-    follow_instance = Follow.objects.filter(follower=follower, following=target_user)
-    is_following = follow_instance.exists()
+    new_status, changed, new_follower_count = apply_toggle(
+        partial(toggles.set_follow, follower.id, target_user.id), requested_state(request, "follow")
+    )
+
+    if timeline.is_enabled() and changed:
+        if new_status:
+            timeline.add_author(follower, target_user)
+        else:
+            timeline.remove_author(follower, target_user)
+        timeline.follower_count_changed(target_user, new_follower_count, new_status)
 
-    if is_following:
-        follow_instance.delete()
-        new_status = False
-    else:
-        Follow.objects.create(follower=follower, following=target_user)
-        new_status = True
-        
-    new_follower_count = Follow.objects.filter(following=target_user).count()
-        
     return JsonResponse({
         'status': 'success',
         'is_following': new_status, 
@@ -171,6 +197,8 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            if timeline.is_enabled():
+                timeline.fan_out_post(post)
             return redirect("accounts:my_profile") 
     else:
         form = PostForm()
@@ -185,6 +213,7 @@ def delete_post(request, post_id):
         return redirect('accounts:my_profile')
 
     if request.method == 'POST':
+        # Timeline entries cascade with the post.
         post.delete()
         messages.success(request, "Post deleted successfully!")
         return redirect('accounts:my_profile')
@@ -195,39 +224,69 @@ def delete_post(request, post_id):
 #feed
 
 @login_required
+@query_budget(7)
 def feed(request):
-    posts = Post.objects.select_related(
-        'author', 
-        'author__profile' 
-    ).prefetch_related(
-        'likes', 
-        'comments' 
-    ).order_by('-created_at')
-
-    for post in posts:
-        post.is_liked_by_user = post.likes.filter(user=request.user).exists()
-        
-    comments_by_post = {post.id: Comment.objects.filter(post=post).order_by('-created_at') for post in posts} 
-
-    if request.method == "POST" and "comment" in request.POST:
-        pass
+    posts, next_cursor = get_feed_page(request.user)
+    # Cards don't show comments, so don't load any.
+    posts = hydrate_posts(posts, request.user, comments_per_post=0)
 
     return render(request, "accounts/feed.html", {
         "posts": posts,
-        "comments_by_post": comments_by_post,
+        "next_cursor": next_cursor,
     })
 
+
+@login_required
+@query_budget(7)
+def feed_more(request):
+    cursor = request.GET.get("cursor")
+    decoded = decode_cursor(cursor)
+    if cursor and decoded is None:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    posts, next_cursor = get_feed_page(request.user, decoded)
+    posts = hydrate_posts(posts, request.user, comments_per_post=0)
+    html = render_to_string("accounts/_feed_posts.html", {"posts": posts}, request=request)
+
+    return JsonResponse({
+        'status': 'success',
+        'html': html,
+        'count': len(posts),
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+@query_budget(7)
+def trending(request):
+    category = parse_category(request.GET.get("category"))
+    posts = hydrate_posts(trending_posts(category), request.user, comments_per_post=0)
+
+    return render(request, "accounts/trending.html", {
+        "posts": posts,
+        "category": category,
+        "categories": Post.CATEGORY_CHOICES,
+    })
+
+
 #like & comment
 @login_required
 def like_toggle(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    
-    like, created = Like.objects.get_or_create(post=post, user=request.user)
-    
-    if not created:
-        like.delete()
-        
-    return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/feed/')) 
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    set_like = likebuffer.get_buffer().set_like if likebuffer.is_enabled() else toggles.set_like
+    try:
+        liked, _, like_count = apply_toggle(
+            partial(set_like, request.user.id, post_id), requested_state(request, "like")
+        )
+    except Post.DoesNotExist:
+        raise Http404("No such post.")
+
+    return JsonResponse({
+        'status': 'success',
+        'liked': liked,
+        'like_count': like_count,
+    })
 
 @login_required
 def add_comment(request, post_id):
@@ -263,17 +322,8 @@ def delete_comment(request, comment_id):
 #musician detail
 
 @login_required
+@query_budget(4)
 def musician_detail(request, user_id):
-    musician = get_object_or_404(User, id=user_id)
-    profile, _ = Profile.objects.get_or_create(user=musician)
-    posts = Post.objects.filter(author=musician).order_by('-created_at')
-
-    for post in posts:
-        post.has_liked = post.likes.filter(user=request.user).exists()
-
-    is_following = Follow.objects.filter(follower=request.user, following=musician).exists()
-
-    
     if request.method == "POST":
         if "comment" in request.POST:
             post_id = request.POST.get("post_id")
@@ -281,39 +331,51 @@ def musician_detail(request, user_id):
             if text.strip():
                 post = get_object_or_404(Post, id=post_id)
                 Comment.objects.create(post=post, user=request.user, text=text)
-        return redirect("accounts:musician_detail", user_id=musician.id)
+        return redirect("accounts:musician_detail", user_id=user_id)
 
-    comments_by_post = {post.id: Comment.objects.filter(post=post).order_by("-created_at") for post in posts}
+    page = load_profile(request.user, decode_cursor(request.GET.get("before")), id=user_id)
 
     return render(request, "accounts/musician_detail.html", {
-        "musician": musician,
-        "profile": profile,
-        "posts": posts,
-        "is_following": is_following,
-        "total_posts": posts.count(),
-        "follower_count": Follow.objects.filter(following=musician).count(),
-        "following_count": Follow.objects.filter(follower=musician).count(),
-        "comments_by_post": comments_by_post,
+        "musician": page.user,
+        "profile": page.profile,
+        "posts": page.posts,
+        "next_cursor": page.next_cursor,
+        "is_following": page.is_following,
+        "total_posts": page.post_count,
+        "follower_count": page.follower_count,
+        "following_count": page.following_count,
+        "header_version": page.header_version,
     })
 
 
 #search
+@query_budget(7)
 def search_musicians(request):
-    query = request.GET.get("q", "")
-    if query:
-        results = Profile.objects.filter(
-            Q(user__username__icontains=query) |
-            Q(bio__icontains=query) |
-            Q(instrument__icontains=query)
-        )
-    else:
-        results = Profile.objects.all()
-    
-    return render(request, "accounts/search.html", {"query": query, "results": results})
+    query = request.GET.get("q", "").strip()
+    try:
+        page_number = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page_number = 1
+
+    filters = {
+        Facet.INSTRUMENT: normalize_facet(request.GET.get("instrument")),
+        Facet.LOCATION: normalize_facet(request.GET.get("location")),
+    }
+    page = get_search_backend().search(query, page=page_number, filters=filters)
+
+    return render(request, "accounts/search.html", {
+        "query": query,
+        "results": page.results,
+        "page": page,
+        "filters": filters,
+        "instrument_facets": facet_counts_within(Facet.INSTRUMENT, filters),
+        "location_facets": facet_counts_within(Facet.LOCATION, filters),
+    })
 
 
 # View for displaying a single post and handling its comments
 @login_required
+@query_budget(7)
 def view_post(request, post_id):
     # 1. Fetch Post and Comments
     post = get_object_or_404(Post, id=post_id)
@@ -346,7 +408,10 @@ def view_post(request, post_id):
     # 3. Prepare Context for Render (GET Request or POST Failure)
     
     # Check if the user has liked the post for template logic
-    post.is_liked_by_user = Like.objects.filter(post=post, user=request.user).exists()
+    post.is_liked_by_user = likebuffer.liked(
+        request.user.id, post.id, Like.objects.filter(post=post, user=request.user).exists()
+    )
+    post.like_count += likebuffer.pending_change(post.id)
     
     # Fetch comments, ensuring the user profile is pre-fetched for efficiency
     post_comments = Comment.objects.filter(post=post).select_related('user__profile').order_by('created_at')
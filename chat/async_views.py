@@ -0,0 +1,31 @@
+"""
+Async versions of the read-heavy chat pages, routed by ``chat.urls`` when
+``ASYNC_VIEWS`` is on. See ``accounts.async_views``.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.shortcuts import render
+
+from resonate.middleware import query_budget
+
+from .models import ChatThread
+
+
+@login_required
+@query_budget(3)
+async def inbox_view(request):
+    user = await request.auser()
+    threads = [thread async for thread in ChatThread.objects.filter(
+        Q(user1=user) | Q(user2=user)
+    ).select_related('user1__profile', 'user2__profile', 'last_message')]
+
+    for thread in threads:
+        thread.other_user = thread.other_participant(user)
+        thread.unread = thread.unread_for(user)
+
+    context = {
+        'threads': threads,
+        'page_title': 'Message Inbox'
+    }
+    return await sync_to_async(render)(request, 'chat/inbox.html', context)
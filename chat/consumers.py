@@ -1,10 +1,50 @@
 import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.pagination import decode_cursor
+
+from .history import message_cursor, messages_after
+from .models import ChatThread
+from .writer import get_writer
+
+MAX_MESSAGE_LENGTH = 5000
+
+
+def group_name(thread_id):
+    return f'chat_{thread_id}'
+
+
+def message_event(message, sender_username):
+    """The ``chat.message`` group event (and client frame) for a saved message."""
+    return {
+        'type': 'chat.message',
+        'id': message.id,
+        'message': message.content,
+        'sender': sender_username,
+        'sender_id': message.sender_id,
+        'timestamp': message.timestamp.isoformat(),
+        'cursor': message_cursor(message),
+    }
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = f'chat_{self.room_name}'
+        self.user = self.scope.get('user')
+        self.thread_id = int(self.scope['url_route']['kwargs']['thread_id'])
+
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+        if not await self.is_participant():
+            await self.close(code=4403)
+            return
+
+        self.room_group_name = group_name(self.thread_id)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
@@ -12,25 +52,61 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Replay anything the client missed since the newest message it has,
+        # e.g. between rendering the page and the socket opening.
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        cursor = decode_cursor(query.get('after', [''])[0])
+        if cursor:
+            await self.send_missed(cursor)
+
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+            # Whatever arrived while the thread was open has been seen.
+            await self.mark_read()
 
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        try:
+            text_data_json = json.loads(text_data)
+        except ValueError:
+            return
+        content = str(text_data_json.get('message', '')).strip()
+        if not content or len(content) > MAX_MESSAGE_LENGTH:
+            return
+
+        message = await get_writer().write(self.thread_id, self.user.id, content)
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'chat.message',
-                'message': message
-            }
+            message_event(message, self.user.username)
         )
 
     async def chat_message(self, event):
-        message = event['message']
         await self.send(text_data=json.dumps({
-            'message': message
-        }))
\ No newline at end of file
+            key: value for key, value in event.items() if key != 'type'
+        }))
+
+    async def send_missed(self, cursor):
+        while True:
+            messages = await database_sync_to_async(messages_after)(self.thread_id, cursor)
+            for message in messages:
+                await self.chat_message(message_event(message, message.sender.username))
+            if not messages:
+                return
+            cursor = (messages[-1].timestamp, messages[-1].id)
+
+    @database_sync_to_async
+    def is_participant(self):
+        return ChatThread.objects.filter(
+            Q(user1=self.user) | Q(user2=self.user), id=self.thread_id
+        ).exists()
+
+    @database_sync_to_async
+    def mark_read(self):
+        # Updates only, so a thread deleted or merged while the socket was open is a no-op.
+        now = timezone.now()
+        thread = ChatThread.objects.filter(id=self.thread_id)
+        thread.filter(user1=self.user).update(user1_unread=0, user1_last_read=now)
+        thread.filter(user2=self.user).update(user2_unread=0, user2_last_read=now)
@@ -0,0 +1,45 @@
+"""
+Keyset-paginated access to a thread's message history.
+
+The thread page renders only the newest ``CHAT_PAGE_SIZE`` messages. Older
+history is fetched a page at a time by walking backwards from a cursor, and
+a reconnecting socket catches up by walking forwards from the newest message
+it has already seen. Both walks seek on (timestamp, id), which the
+``message_thread_time_idx`` index covers.
+"""
+from django.conf import settings
+
+from accounts.pagination import encode_cursor, keyset_page, seek_after
+
+from .models import Message
+
+
+def get_page_size():
+    return getattr(settings, "CHAT_PAGE_SIZE", 50)
+
+
+def message_cursor(message):
+    return encode_cursor(message.timestamp, message.id)
+
+
+def thread_messages(thread_id):
+    return Message.objects.filter(thread_id=thread_id).select_related("sender")
+
+
+def history_page(thread_id, cursor=None, limit=None):
+    """
+    Return ``(messages, older_cursor)`` for the page before ``cursor``.
+
+    ``messages`` are oldest first, ready to render; ``older_cursor`` is None
+    once the start of the conversation has been reached.
+    """
+    messages, older_cursor = keyset_page(
+        thread_messages(thread_id), cursor, limit or get_page_size(), field="timestamp"
+    )
+    messages.reverse()
+    return messages, older_cursor
+
+
+def messages_after(thread_id, cursor, limit=None):
+    """The messages newer than ``cursor``, oldest first, at most ``limit`` of them."""
+    return list(seek_after(thread_messages(thread_id), cursor, field="timestamp")[:limit or get_page_size()])
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Send or receive a burst of group messages through the configured channel "
+        "layer. Run a receiver and a sender in separate processes to check "
+        "cross-worker delivery and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("role", choices=["send", "receive"])
+        parser.add_argument("--group", default="layer_check")
+        parser.add_argument("--count", type=int, default=1000)
+        parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for each message.")
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer()
+        if layer is None:
+            raise CommandError("No channel layer is configured.")
+
+        run = self.receive if options["role"] == "receive" else self.send
+        result = async_to_sync(run)(layer, options)
+        self.stdout.write(json.dumps(result))
+
+    async def send(self, layer, options):
+        started = time.perf_counter()
+        for seq in range(options["count"]):
+            await layer.group_send(options["group"], {"type": "layer.check", "seq": seq})
+        return {"role": "send", "count": options["count"], "seconds": time.perf_counter() - started}
+
+    async def receive(self, layer, options):
+        channel = await layer.new_channel()
+        await layer.group_add(options["group"], channel)
+        self.stdout.write("READY")
+        self.stdout.flush()
+
+        received = []
+        started = None
+        try:
+            while len(received) < options["count"]:
+                message = await asyncio.wait_for(layer.receive(channel), options["timeout"])
+                if started is None:
+                    started = time.perf_counter()
+                received.append(message["seq"])
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await layer.group_discard(options["group"], channel)
+
+        seconds = time.perf_counter() - started if started else 0.0
+        return {
+            "role": "receive",
+            "count": len(received),
+            "in_order": received == sorted(received),
+            "seconds": seconds,
+        }
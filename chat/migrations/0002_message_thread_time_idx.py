@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', 'timestamp', 'id'], name='message_thread_time_idx'),
+        ),
+    ]
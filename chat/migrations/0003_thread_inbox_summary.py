@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_message(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+
+    newest = Message.objects.filter(thread=OuterRef('pk')).order_by('-timestamp', '-id').values('id')[:1]
+    ChatThread.objects.update(last_message=Subquery(newest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_thread_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='user1_last_read',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='user1_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='user2_last_read',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='user2_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_threads(apps, schema_editor):
+    """
+    Fold every thread for the same pair of users into the oldest one and
+    store it as (low id, high id). Messages move to the surviving thread and
+    each participant keeps the sum of their unread counts.
+    """
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+
+    pairs = {}
+    for thread in ChatThread.objects.order_by('id'):
+        pairs.setdefault(tuple(sorted((thread.user1_id, thread.user2_id))), []).append(thread)
+
+    for (low, high), threads in pairs.items():
+        keeper, duplicates = threads[0], threads[1:]
+        if not duplicates and keeper.user1_id == low:
+            continue
+
+        unread = {low: 0, high: 0}
+        last_read = {low: None, high: None}
+        for thread in threads:
+            for user_id, count, read_at in (
+                (thread.user1_id, thread.user1_unread, thread.user1_last_read),
+                (thread.user2_id, thread.user2_unread, thread.user2_last_read),
+            ):
+                unread[user_id] += count
+                if read_at and (last_read[user_id] is None or read_at > last_read[user_id]):
+                    last_read[user_id] = read_at
+
+        if duplicates:
+            Message.objects.filter(thread__in=duplicates).update(thread=keeper)
+            ChatThread.objects.filter(id__in=[thread.id for thread in duplicates]).delete()
+
+        ChatThread.objects.filter(id=keeper.id).update(
+            user1_id=low,
+            user2_id=high,
+            user1_unread=unread[low],
+            user2_unread=unread[high],
+            user1_last_read=last_read[low],
+            user2_last_read=last_read[high],
+            updated=max(thread.updated for thread in threads),
+            last_message=Message.objects.filter(thread=keeper).order_by('-timestamp', '-id').first(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_thread_inbox_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_threads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatthread',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lt', models.F('user2'))), name='chatthread_ordered_pair'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_thread_ordered_pair'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatthread',
+            index=models.Index(fields=['user1', '-updated'], name='chatthread_user1_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatthread',
+            index=models.Index(fields=['user2', '-updated'], name='chatthread_user2_recent_idx'),
+        ),
+    ]
@@ -1,8 +1,26 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model() 
 
+
+class ChatThreadManager(models.Manager):
+    def for_pair(self, user_a, user_b):
+        low, high = sorted((user_a.id, user_b.id))
+        return self.filter(user1_id=low, user2_id=high)
+
+    def get_or_create_for_pair(self, user_a, user_b):
+        """
+        Return ``(thread, created)`` for the conversation between two users.
+
+        Threads are keyed on the ordered (low id, high id) pair, so concurrent
+        callers race on the unique constraint and the loser reads the winner's row.
+        """
+        low, high = sorted((user_a.id, user_b.id))
+        return self.get_or_create(user1_id=low, user2_id=high)
+
+
 class ChatThread(models.Model):
     user1 = models.ForeignKey(
         User, 
@@ -18,13 +36,61 @@ class ChatThread(models.Model):
     updated = models.DateTimeField(auto_now=True) 
     timestamp = models.DateTimeField(auto_now_add=True) 
 
+    # Denormalized so the inbox renders without touching chat_message.
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    user1_unread = models.PositiveIntegerField(default=0)
+    user2_unread = models.PositiveIntegerField(default=0)
+    user1_last_read = models.DateTimeField(null=True, blank=True)
+    user2_last_read = models.DateTimeField(null=True, blank=True)
+
+    objects = ChatThreadManager()
+
     class Meta:
         unique_together = ('user1', 'user2')
         ordering = ['-updated'] 
+        constraints = [
+            models.CheckConstraint(condition=models.Q(user1__lt=models.F('user2')), name='chatthread_ordered_pair'),
+        ]
+        # The inbox lists a user's threads from either side, most recent first.
+        indexes = [
+            models.Index(fields=['user1', '-updated'], name='chatthread_user1_recent_idx'),
+            models.Index(fields=['user2', '-updated'], name='chatthread_user2_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Thread between {self.user1.username} and {self.user2.username}"
 
+    def save(self, *args, **kwargs):
+        # user1 is always the participant with the lower id.
+        if self.user1_id and self.user2_id and self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
+            self.user1_unread, self.user2_unread = self.user2_unread, self.user1_unread
+            self.user1_last_read, self.user2_last_read = self.user2_last_read, self.user1_last_read
+        super().save(*args, **kwargs)
+
+    def _side(self, user):
+        return 'user1' if user.id == self.user1_id else 'user2'
+
+    def other_participant(self, user):
+        return self.user2 if user.id == self.user1_id else self.user1
+
+    def unread_for(self, user):
+        return getattr(self, f'{self._side(user)}_unread')
+
+    def mark_read(self, user):
+        """Clear ``user``'s unread count and move their last-read marker to now."""
+        side = self._side(user)
+        now = timezone.now()
+        ChatThread.objects.filter(id=self.id).update(**{f'{side}_unread': 0, f'{side}_last_read': now})
+        setattr(self, f'{side}_unread', 0)
+        setattr(self, f'{side}_last_read', now)
+
 class Message(models.Model):
     thread = models.ForeignKey(
         ChatThread, 
@@ -41,6 +107,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['thread', 'timestamp', 'id'], name='message_thread_time_idx'),
+        ]
 
     def __str__(self):
         return f"Message by {self.sender.username} in Thread {self.thread.id}"
\ No newline at end of file
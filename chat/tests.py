@@ -1,3 +1,328 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from accounts.tests import capture_selects, plain_static, sequential_scans
+from resonate.respserver import run_in_thread
+
+from .history import message_cursor
+from .models import ChatThread, Message
+from .routing import websocket_urlpatterns
+from .writer import persist
+
+
+class Socket:
+    """Minimal WebSocket client driving the consumer through the URL router."""
+
+    def __init__(self, user, thread_id, query_string=b""):
+        self.communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            "type": "websocket",
+            "path": f"/ws/chat/{thread_id}/",
+            "query_string": query_string,
+            "headers": [],
+            "subprotocols": [],
+            "user": user,
+        })
+
+    async def connect(self):
+        await self.communicator.send_input({"type": "websocket.connect"})
+        response = await self.communicator.receive_output(1)
+        return response["type"] == "websocket.accept"
+
+    async def send(self, message):
+        await self.communicator.send_input({"type": "websocket.receive", "text": json.dumps({"message": message})})
+
+    async def receive(self):
+        response = await self.communicator.receive_output(1)
+        return json.loads(response["text"])
+
+    async def close(self):
+        await self.communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await self.communicator.wait(1)
+
+
+class ChatConsumerTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.eve = User.objects.create_user("eve")
+        self.thread = ChatThread.objects.create(user1=self.alice, user2=self.bob)
+
+    async def test_message_is_persisted_and_broadcast(self):
+        alice = Socket(self.alice, self.thread.id)
+        bob = Socket(self.bob, self.thread.id)
+        self.assertTrue(await alice.connect())
+        self.assertTrue(await bob.connect())
+        before = self.thread.updated
+
+        await alice.send("hello bob")
+        received = await bob.receive()
+        echoed = await alice.receive()
+
+        self.assertEqual(received, echoed)
+        self.assertEqual((received["message"], received["sender"]), ("hello bob", "alice"))
+        message = await Message.objects.aget(id=received["id"])
+        self.assertEqual((message.thread_id, message.sender_id), (self.thread.id, self.alice.id))
+        thread = await ChatThread.objects.aget(id=self.thread.id)
+        self.assertGreater(thread.updated, before)
+
+        await alice.close()
+        await bob.close()
+
+    async def test_burst_is_written_in_order(self):
+        alice = Socket(self.alice, self.thread.id)
+        self.assertTrue(await alice.connect())
+
+        for i in range(5):
+            await alice.send(f"m{i}")
+        frames = [await alice.receive() for _ in range(5)]
+
+        self.assertEqual([frame["message"] for frame in frames], [f"m{i}" for i in range(5)])
+        contents = await database_sync_to_async(list)(
+            Message.objects.filter(thread=self.thread).order_by("id").values_list("content", flat=True)
+        )
+        self.assertEqual(contents, [f"m{i}" for i in range(5)])
+        await alice.close()
+
+    async def test_outsiders_and_anonymous_users_are_rejected(self):
+        self.assertFalse(await Socket(self.eve, self.thread.id).connect())
+        self.assertFalse(await Socket(AnonymousUser(), self.thread.id).connect())
+
+
+    async def test_reconnect_replays_messages_after_cursor(self):
+        messages = await database_sync_to_async(self.send_messages)(4)
+
+        alice = Socket(self.alice, self.thread.id, b"after=" + message_cursor(messages[1]).encode())
+        self.assertTrue(await alice.connect())
+        frames = [await alice.receive() for _ in range(2)]
+
+        self.assertEqual([frame["id"] for frame in frames], [message.id for message in messages[2:]])
+        self.assertTrue(await alice.communicator.receive_nothing())
+        await alice.close()
+
+    async def test_disconnect_after_the_thread_is_gone(self):
+        alice = Socket(self.alice, self.thread.id)
+        self.assertTrue(await alice.connect())
+        await ChatThread.objects.filter(id=self.thread.id).adelete()
+        await alice.close()
+
+    async def test_disconnect_marks_the_thread_read(self):
+        await ChatThread.objects.filter(id=self.thread.id).aupdate(user2_unread=3)
+        bob = Socket(self.bob, self.thread.id)
+        self.assertTrue(await bob.connect())
+        await bob.close()
+        thread = await ChatThread.objects.aget(id=self.thread.id)
+        self.assertEqual((thread.user1_unread, thread.user2_unread), (0, 0))
+        self.assertIsNotNone(thread.user2_last_read)
+
+    def send_messages(self, count):
+        return [
+            Message.objects.create(thread=self.thread, sender=self.bob, content=f"m{i}")
+            for i in range(count)
+        ]
+
+
+@plain_static
+@override_settings(CHAT_PAGE_SIZE=3)
+class ThreadHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.thread = ChatThread.objects.create(user1=self.alice, user2=self.bob)
+        self.messages = [
+            Message.objects.create(thread=self.thread, sender=self.bob, content=f"m{i}")
+            for i in range(7)
+        ]
+        self.client.force_login(self.alice)
+
+    def test_thread_renders_latest_page(self):
+        response = self.client.get(reverse("thread", args=[self.thread.id]))
+
+        self.assertEqual([m.content for m in response.context["messages"]], ["m4", "m5", "m6"])
+        self.assertEqual(response.context["latest_cursor"], message_cursor(self.messages[-1]))
+        self.assertContains(response, "chat-load-older")
+
+    def test_history_pages_back_to_the_first_message(self):
+        url = reverse("thread_history", args=[self.thread.id])
+        cursor = self.client.get(reverse("thread", args=[self.thread.id])).context["older_cursor"]
+
+        pages = []
+        while cursor:
+            # The session and user come from the cache.
+            with self.assertNumQueries(2):
+                data = self.client.get(url, {"before": cursor}).json()
+            pages.append([message["message"] for message in data["messages"]])
+            cursor = data["next_cursor"]
+
+        self.assertEqual(pages, [["m1", "m2", "m3"], ["m0"]])
+
+    def test_inbox_and_history_use_indexes(self):
+        with capture_selects() as statements:
+            for url in (reverse("inbox"), reverse("thread", args=[self.thread.id]), reverse("thread_history", args=[self.thread.id])):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertTrue(statements)
+        self.assertEqual(sequential_scans(statements), {})
+
+    def test_history_rejects_outsiders_and_bad_cursors(self):
+        url = reverse("thread_history", args=[self.thread.id])
+        self.assertEqual(self.client.get(url, {"before": "garbage"}).status_code, 400)
+
+        self.client.force_login(User.objects.create_user("eve"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+@plain_static
+class InboxTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.client.force_login(self.alice)
+
+    def start_thread(self, name, messages=2):
+        other = User.objects.create_user(name)
+        thread = ChatThread.objects.create(user1=self.alice, user2=other)
+        persist([Message(thread=thread, sender=other, content=f"{name} {i}") for i in range(messages)])
+        return thread
+
+    def test_inbox_query_count_does_not_grow_with_threads(self):
+        for name in ("bob", "carol"):
+            self.start_thread(name)
+        self.client.get(reverse("inbox"))  # caches the session and user
+        with self.assertNumQueries(1):
+            self.client.get(reverse("inbox"))
+
+        for name in ("dave", "erin", "frank"):
+            self.start_thread(name)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("inbox"))
+
+        self.assertContains(response, "frank 1")
+        self.assertContains(response, "inbox-unread-badge", count=5)
+
+    def test_writes_update_last_message_and_recipient_unread(self):
+        thread = self.start_thread("bob", messages=3)
+        reply = persist([Message(thread=thread, sender=self.alice, content="hi")])[0]
+
+        thread.refresh_from_db()
+        self.assertEqual(thread.last_message, reply)
+        self.assertEqual((thread.user1_unread, thread.user2_unread), (3, 1))
+
+    def test_opening_thread_marks_it_read(self):
+        thread = self.start_thread("bob")
+        self.client.get(reverse("thread", args=[thread.id]))
+
+        thread.refresh_from_db()
+        self.assertEqual(thread.unread_for(self.alice), 0)
+        self.assertIsNotNone(thread.user1_last_read)
+        self.assertNotContains(self.client.get(reverse("inbox")), "inbox-unread-badge")
+
+
+class ThreadPairTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+
+    def test_pair_lookup_is_order_independent(self):
+        thread, created = ChatThread.objects.get_or_create_for_pair(self.bob, self.alice)
+        again, created_again = ChatThread.objects.get_or_create_for_pair(self.alice, self.bob)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(thread, again)
+        self.assertEqual((thread.user1, thread.user2), (self.alice, self.bob))
+
+    def test_starting_a_thread_from_either_side_reuses_it(self):
+        self.client.force_login(self.bob)
+        first = self.client.get(reverse("start_thread", args=["alice"]))
+        self.client.force_login(self.alice)
+        second = self.client.get(reverse("start_thread", args=["bob"]))
+
+        self.assertEqual(first.url, second.url)
+        self.assertEqual(ChatThread.objects.count(), 1)
+
+    def test_save_stores_the_canonical_order(self):
+        thread = ChatThread.objects.create(user1=self.bob, user2=self.alice)
+        self.assertEqual((thread.user1_id, thread.user2_id), (self.alice.id, self.bob.id))
+
+    def test_reversed_pair_is_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError):
+            ChatThread.objects.bulk_create([ChatThread(user1=self.bob, user2=self.alice)])
+
+
+class ThreadPairMigrationTests(TransactionTestCase):
+    before = [("chat", "0003_thread_inbox_summary")]
+    after = [("chat", "0004_thread_ordered_pair")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicate_threads_are_merged(self):
+        apps = self.migrate(self.before)
+        ChatThread = apps.get_model("chat", "ChatThread")
+        Message = apps.get_model("chat", "Message")
+        alice = apps.get_model("auth", "User").objects.create(username="alice")
+        bob = apps.get_model("auth", "User").objects.create(username="bob")
+
+        first = ChatThread.objects.create(user1=bob, user2=alice, user1_unread=1)
+        second = ChatThread.objects.create(user1=alice, user2=bob, user1_unread=2, user2_unread=3)
+        Message.objects.create(thread=first, sender=alice, content="one")
+        latest = Message.objects.create(thread=second, sender=bob, content="two")
+
+        apps = self.migrate(self.after)
+        ChatThread = apps.get_model("chat", "ChatThread")
+
+        thread = ChatThread.objects.get()
+        self.assertEqual((thread.id, thread.user1_id, thread.user2_id), (first.id, alice.id, bob.id))
+        self.assertEqual((thread.user1_unread, thread.user2_unread), (2, 4))
+        self.assertEqual(thread.last_message_id, latest.id)
+        self.assertEqual(apps.get_model("chat", "Message").objects.filter(thread=thread).count(), 2)
+
+
+class CrossProcessChannelLayerTests(SimpleTestCase):
+    """Two worker processes share the Redis pub/sub layer through the local stand-in."""
+
+    COUNT = 500
+
+    def setUp(self):
+        self.server = run_in_thread()
+        self.addCleanup(self.server.stop)
+        self.env = {**os.environ, "CHANNEL_LAYER_URL": self.server.url}
+
+    def worker(self, role):
+        return subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / "manage.py"), "check_channel_layer", role,
+             "--count", str(self.COUNT), "--timeout", "5"],
+            env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+
+    def test_group_messages_reach_another_process(self):
+        receiver = self.worker("receive")
+        self.addCleanup(receiver.kill)
+        self.assertEqual(receiver.stdout.readline().strip(), "READY")
+
+        sender = self.worker("send")
+        sent = json.loads(sender.communicate(timeout=60)[0])
+        out, err = receiver.communicate(timeout=60)
+        received = json.loads(out)
+
+        self.assertEqual(sent["count"], self.COUNT)
+        self.assertEqual(received["count"], self.COUNT, err)
+        self.assertTrue(received["in_order"])
+        throughput = received["count"] / max(received["seconds"], 1e-6)
+        self.assertGreater(throughput, 100, f"{throughput:.0f} msg/s")
@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.inbox_view, name='inbox'),
+    path('', read_views.inbox_view, name='inbox'),
     path('<int:thread_id>/', views.thread_view, name='thread'),
+    path('<int:thread_id>/messages/', views.thread_history_view, name='thread_history'),
     path('start/<str:username>/', views.start_thread_view, name='start_thread'),
 ]
\ No newline at end of file
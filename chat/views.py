@@ -1,18 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
 from django.db.models import Q
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 
-from .models import ChatThread, Message
+from accounts.pagination import decode_cursor
+from resonate.middleware import query_budget
+
+from .consumers import group_name, message_event
+from .history import history_page, message_cursor
+from .models import ChatThread
+from .writer import persist
 from .forms import MessageForm 
 
 User = get_user_model()
 
 @login_required
+@query_budget(3)
 def inbox_view(request):
-    threads = ChatThread.objects.filter(
+    threads = list(ChatThread.objects.filter(
         Q(user1=request.user) | Q(user2=request.user)
-    ).distinct()
+    ).select_related('user1__profile', 'user2__profile', 'last_message'))
+
+    for thread in threads:
+        thread.other_user = thread.other_participant(request.user)
+        thread.unread = thread.unread_for(request.user)
 
     context = {
         'threads': threads,
@@ -30,19 +44,14 @@ def start_thread_view(request, username):
     if other_user == current_user:
         return redirect('inbox') 
 
-    thread = ChatThread.objects.filter(
-        Q(user1=current_user, user2=other_user) | 
-        Q(user1=other_user, user2=current_user)
-    ).first()
+    thread, _ = ChatThread.objects.get_or_create_for_pair(current_user, other_user)
 
-    if not thread:
-        thread = ChatThread.objects.create(user1=current_user, user2=other_user)
-    
     return redirect('thread', thread_id=thread.id)
 
 
 
 @login_required
+@query_budget(6)
 def thread_view(request, thread_id):
     
     thread = get_object_or_404(ChatThread, id=thread_id)
@@ -51,7 +60,6 @@ def thread_view(request, thread_id):
     if request.user not in [thread.user1, thread.user2]:
         return redirect('inbox') 
 
-    messages = thread.messages.all()
     form = MessageForm()
 
     if request.method == 'POST':
@@ -60,20 +68,53 @@ def thread_view(request, thread_id):
             message = form.save(commit=False)
             message.thread = thread
             message.sender = request.user
-            message.save()
-            
-            
-            thread.save()
+            persist([message])
+
+            # Deliver to any open sockets on this thread, as if sent over the WebSocket.
+            channel_layer = get_channel_layer()
+            if channel_layer is not None:
+                async_to_sync(channel_layer.group_send)(
+                    group_name(thread.id), message_event(message, request.user.username)
+                )
             return redirect('thread', thread_id=thread.id) 
 
 
-    other_user = thread.user1 if thread.user2 == request.user else thread.user2
+    other_user = thread.other_participant(request.user)
+    if thread.unread_for(request.user):
+        thread.mark_read(request.user)
+    messages, older_cursor = history_page(thread.id)
 
     context = {
         'thread': thread,
         'messages': messages,
+        'older_cursor': older_cursor,
+        'latest_cursor': message_cursor(messages[-1]) if messages else '',
         'form': form,
         'other_user': other_user, 
         'page_title': f'Chat with {other_user.username}'
     }
-    return render(request, 'chat/thread.html', context)
\ No newline at end of file
+    return render(request, 'chat/thread.html', context)
+
+
+@login_required
+@query_budget(4)
+def thread_history_view(request, thread_id):
+    thread = get_object_or_404(ChatThread, id=thread_id)
+    if request.user.id not in (thread.user1_id, thread.user2_id):
+        return JsonResponse({'error': 'Not a participant'}, status=403)
+
+    before = request.GET.get('before')
+    cursor = decode_cursor(before)
+    if before and cursor is None:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    messages, older_cursor = history_page(thread.id, cursor)
+    return JsonResponse({
+        'status': 'success',
+        'messages': [
+            {key: value for key, value in message_event(message, message.sender.username).items() if key != 'type'}
+            for message in messages
+        ],
+        'count': len(messages),
+        'next_cursor': older_cursor,
+    })
@@ -0,0 +1,108 @@
+"""
+Batched, asynchronous persistence for chat messages.
+
+Consumers hand each incoming message to the writer for their event loop and
+await the result. Messages are buffered and written with one ``bulk_create``
+every ``CHAT_FLUSH_INTERVAL_MS`` milliseconds, or sooner once
+``CHAT_FLUSH_BATCH_SIZE`` are waiting. Each flush also updates every thread
+it touched once: ``updated``, ``last_message`` and the recipient's unread
+count, which is what the inbox renders from.
+"""
+import asyncio
+import weakref
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import ChatThread, Message
+
+
+class MessageWriter:
+    def __init__(self, flush_interval=None, batch_size=None):
+        if flush_interval is None:
+            flush_interval = getattr(settings, "CHAT_FLUSH_INTERVAL_MS", 10) / 1000
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size or getattr(settings, "CHAT_FLUSH_BATCH_SIZE", 50)
+        self.pending = []
+        self._timer = None
+
+    async def write(self, thread_id, sender_id, content):
+        """Queue a message and return the saved ``Message`` once its batch is flushed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((Message(thread_id=thread_id, sender_id=sender_id, content=content), future))
+
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, lambda: asyncio.ensure_future(self.flush()))
+        return await future
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        try:
+            saved = await database_sync_to_async(persist)([message for message, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for message, (_, future) in zip(saved, batch):
+            if not future.done():
+                future.set_result(message)
+
+
+def persist(messages):
+    """Insert ``messages`` in one statement and touch each affected thread once."""
+    with transaction.atomic():
+        saved = Message.objects.bulk_create(messages)
+        record_messages(saved)
+    return saved
+
+
+def _sent_by(senders, field):
+    """How many of the messages were sent by the participant in ``field``."""
+    return Case(
+        *[When(**{field: sender_id}, then=Value(count)) for sender_id, count in senders.items()],
+        default=Value(0),
+    )
+
+
+def record_messages(messages):
+    """Point each thread at its newest message and count it unread for the recipient."""
+    now = timezone.now()
+    by_thread = {}
+    for message in messages:
+        by_thread.setdefault(message.thread_id, []).append(message)
+
+    for thread_id, thread_messages in by_thread.items():
+        senders = Counter(message.sender_id for message in thread_messages)
+        ChatThread.objects.filter(id=thread_id).update(
+            updated=now,
+            last_message=thread_messages[-1],
+            user1_unread=F('user1_unread') + _sent_by(senders, 'user2_id'),
+            user2_unread=F('user2_unread') + _sent_by(senders, 'user1_id'),
+        )
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_writer():
+    """The ``MessageWriter`` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter()
+    return writer
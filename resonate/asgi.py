@@ -1,15 +1,23 @@
 import os
+from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
-from chat import routing 
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'resonate.settings')
 
+# Set up Django before importing consumers, which use the ORM.
+django_asgi_app = get_asgi_application()
+
+from chat import routing  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": URLRouter(
-       
-        routing.websocket_urlpatterns 
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(
+                routing.websocket_urlpatterns
+            )
+        )
     ),
-})
\ No newline at end of file
+})
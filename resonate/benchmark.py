@@ -0,0 +1,331 @@
+"""
+In-process benchmarks for the hot pages.
+
+``run`` logs in a sample of users who have chat threads and requests each
+scenario's page through the test client, recording wall-clock latency and
+the number of queries per request. Results are summarized as percentiles
+and can be saved as a JSON baseline; ``compare`` reports scenarios whose
+query count went up or whose p95 latency got worse than the tolerance
+allows.
+
+``run_concurrent`` instead sends the requests straight to Django's ASGI
+handler, many at a time on one event loop, the way a single ASGI worker
+serves them. It reports throughput alongside latency, so running it with
+``ASYNC_VIEWS`` off and on compares sync and async views per worker.
+
+Latencies are only comparable on the same machine and dataset, e.g. one
+filled by ``seed_data`` with a fixed seed. Each report records both in its
+``meta`` (``machine`` and ``dataset``, the row counts of the main tables),
+and ``mismatches`` lists where a baseline differs. Query counts depend only
+on the code and the dataset. ``benchmarks/`` holds a committed baseline and
+the commands that produced it.
+"""
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Comment, Follow, Like, Post
+from chat.models import ChatThread, Message
+
+SCENARIOS = ["feed", "profile_view", "search_musicians", "inbox_view", "thread_view"]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize_latency(latencies):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+def summarize(samples):
+    queries = [count for _, count in samples]
+    return {
+        **summarize_latency([ms for ms, _ in samples]),
+        "queries": round(statistics.fmean(queries), 2),
+        "max_queries": max(queries),
+    }
+
+
+def viewer_urls(thread, user):
+    """The URL each scenario requests as ``user``, a participant of ``thread``."""
+    partner = thread.user2 if thread.user1_id == user.id else thread.user1
+    return {
+        "feed": reverse("accounts:feed"),
+        "profile_view": reverse("accounts:profile", args=[partner.username]),
+        "search_musicians": reverse("accounts:search") + "?" + urlencode({"q": user.profile.instrument or "a"}),
+        "inbox_view": reverse("inbox"),
+        "thread_view": reverse("thread", args=[thread.id]),
+    }
+
+
+def pick_viewers(count, seed):
+    """``count`` (user, urls) pairs, chosen from chat participants by ``seed``."""
+    threads = list(
+        ChatThread.objects.select_related("user1__profile", "user2__profile")
+        .filter(user1__isnull=False, user2__isnull=False)
+        .order_by("id")
+    )
+    if not threads:
+        raise BenchmarkError("No chat threads to benchmark; fill the database with seed_data first.")
+    rng = random.Random(seed)
+    viewers = []
+    for thread in rng.sample(threads, min(count, len(threads))):
+        user = rng.choice((thread.user1, thread.user2))
+        viewers.append((user, viewer_urls(thread, user)))
+    return viewers
+
+
+def host():
+    """A host name ``ALLOWED_HOSTS`` accepts."""
+    for name in settings.ALLOWED_HOSTS:
+        if name not in ("*", "") and not name.startswith("."):
+            return name
+    return "localhost"
+
+
+def machine():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def dataset():
+    """Row counts of the tables the scenarios read."""
+    models = {
+        "users": User, "follows": Follow, "posts": Post, "likes": Like, "comments": Comment,
+        "threads": ChatThread, "messages": Message,
+    }
+    return {name: model.objects.count() for name, model in models.items()}
+
+
+def mismatches(report, baseline):
+    """Where ``baseline`` was measured on another machine or dataset, as a list of messages."""
+    differences = []
+    for part in ("machine", "dataset"):
+        before, after = baseline["meta"].get(part), report["meta"].get(part)
+        if before is None:
+            continue
+        for key in sorted(set(before) | set(after or {})):
+            if before.get(key) != (after or {}).get(key):
+                differences.append(f"{part} {key}: {(after or {}).get(key)}, baseline has {before.get(key)}")
+    return differences
+
+
+def check_scenarios(scenarios):
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise BenchmarkError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+
+
+def logged_in_clients(viewers, seed):
+    clients = []
+    for user, urls in pick_viewers(viewers, seed):
+        client = Client(SERVER_NAME=host())
+        client.force_login(user)
+        clients.append((client, urls))
+    return clients
+
+
+def run(scenarios=SCENARIOS, iterations=50, warmup=5, viewers=10, seed=0, cold=False):
+    """
+    Benchmark ``scenarios``; returns ``{"meta": {...}, "results": {scenario: summary}}``.
+
+    Each iteration requests every scenario once, cycling through the
+    viewers. The first ``warmup`` iterations aren't recorded. With
+    ``cold`` the cache is cleared before every request.
+    """
+    check_scenarios(scenarios)
+    clients = logged_in_clients(viewers, seed)
+
+    samples = {name: [] for name in scenarios}
+    for i in range(warmup + iterations):
+        client, urls = clients[i % len(clients)]
+        for name in scenarios:
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(urls[name], secure=True)
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise BenchmarkError(f"{name}: GET {urls[name]} returned {response.status_code}.")
+            if i >= warmup:
+                samples[name].append((elapsed, len(queries)))
+
+    return {
+        "meta": {
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "warmup": warmup,
+            "viewers": len(clients),
+            "seed": seed,
+            "cold": cold,
+            "async_views": settings.ASYNC_VIEWS,
+            "machine": machine(),
+            "dataset": dataset(),
+        },
+        "results": {name: summarize(values) for name, values in samples.items()},
+    }
+
+
+async def asgi_get(app, url, cookies):
+    """GET ``url`` through the ASGI ``app``; returns the status code."""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", host().encode()), (b"cookie", cookies.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": (host(), 443),
+    }
+    done = asyncio.Event()
+    status = None
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Django listens for a disconnect while the view runs.
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return status
+
+
+def run_concurrent(scenarios=SCENARIOS, iterations=200, concurrency=20, viewers=10, seed=0):
+    """
+    Benchmark ``scenarios`` through the ASGI handler with ``concurrency`` requests in flight.
+
+    Sends ``iterations`` requests per scenario, cycling through the
+    viewers, and adds ``rps``, the requests served per second, to each
+    summary. Queries aren't counted, as each request runs its queries on
+    its own thread.
+    """
+    check_scenarios(scenarios)
+    viewers = [
+        ("; ".join(f"{name}={morsel.value}" for name, morsel in client.cookies.items()), urls)
+        for client, urls in logged_in_clients(viewers, seed)
+    ]
+    app = ASGIHandler()
+
+    async def scenario(name):
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(i):
+            cookies, urls = viewers[i % len(viewers)]
+            async with slots:
+                start = time.perf_counter()
+                status = await asgi_get(app, urls[name], cookies)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                raise BenchmarkError(f"{name}: GET {urls[name]} returned {status}.")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(iterations)))
+        elapsed = time.perf_counter() - start
+        return {**summarize_latency(latencies), "rps": round(iterations / elapsed, 1)}
+
+    async def main():
+        return {name: await scenario(name) for name in scenarios}
+
+    return {
+        "meta": {
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "viewers": len(viewers),
+            "seed": seed,
+            "async_views": settings.ASYNC_VIEWS,
+            "machine": machine(),
+            "dataset": dataset(),
+        },
+        "results": asyncio.run(main()),
+    }
+
+
+def compare(report, baseline, tolerance=0.25, min_delta_ms=1.0):
+    """
+    Regressions of ``report`` against ``baseline`` as a list of messages.
+
+    A scenario regresses when it makes more queries per request, when its
+    p95 is more than ``tolerance`` (a fraction) and ``min_delta_ms``
+    slower, or when it serves more than ``tolerance`` fewer requests per
+    second. Scenarios missing from either side are skipped.
+    """
+    regressions = []
+    for name, before in baseline["results"].items():
+        after = report["results"].get(name)
+        if after is None:
+            continue
+        if "queries" in before and "queries" in after and after["queries"] > before["queries"]:
+            regressions.append(f"{name}: {after['queries']} queries per request, was {before['queries']}")
+        if "rps" in before and "rps" in after and after["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {after['rps']} requests/s, was {before['rps']}")
+        slower = after["p95_ms"] - before["p95_ms"]
+        if slower > before["p95_ms"] * tolerance and slower > min_delta_ms:
+            regressions.append(f"{name}: p95 {after['p95_ms']} ms, was {before['p95_ms']} ms")
+    return regressions
+
+
+def save(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
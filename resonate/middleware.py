@@ -0,0 +1,176 @@
+"""
+Query budgets and request timing.
+
+``QueryBudgetMiddleware`` profiles every request (see ``resonate.profiling``)
+and reports the query count, SQL time, template time and repeated query
+shapes:
+
+* in a ``Server-Timing`` header when ``SERVER_TIMING`` is on, so they show
+  up in the browser's network panel;
+* in a log record on the ``resonate.requests`` logger, with the numbers
+  attached as ``extra`` fields for structured log handlers.
+
+Views declare how many queries they may run with ``@query_budget(n)``. A
+request over budget is logged as a warning, and raises
+``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is on (the default under
+``manage.py test``), so a new N+1 pattern fails the test suite.
+
+Both middleware here work in sync and async mode, so an async view under
+ASGI runs without holding a thread for the whole request.
+``AsyncWhiteNoiseMiddleware`` is WhiteNoise's middleware made async-capable
+for that reason.
+"""
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .profiling import RequestProfile, current_profile
+
+logger = logging.getLogger("resonate.requests")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run per request, auth and session included."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def get_server_timing():
+    return getattr(settings, "SERVER_TIMING", False)
+
+
+def get_raise_on_budget():
+    return getattr(settings, "QUERY_BUDGET_RAISE", False)
+
+
+def record_queries(stack, profile):
+    """Route queries on this thread's connections through ``profile`` until ``stack`` closes."""
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(profile.record))
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile = RequestProfile()
+        request.query_profile = profile
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                record_queries(stack, profile)
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        self.report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        request.query_profile = profile
+        token = current_profile.set(profile)
+        # Connections belong to threads, and the async ORM runs its queries
+        # in the request's thread-sensitive thread, so wrap them there.
+        stack = ExitStack()
+        try:
+            await sync_to_async(record_queries)(stack, profile)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_profile.reset(token)
+
+        self.report(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, "query_budget", None)
+        request.view_name = f"{view_func.__module__}.{getattr(view_func, '__qualname__', type(view_func).__name__)}"
+
+    def report(self, request, response, profile):
+        budget = getattr(request, "query_budget", None)
+        duplicates = profile.duplicates()
+        stats = {
+            "method": request.method,
+            "path": request.path,
+            "view": getattr(request, "view_name", None),
+            "status": response.status_code,
+            "queries": profile.queries,
+            "query_budget": budget,
+            "sql_ms": round(profile.sql_ms, 2),
+            "template_ms": round(profile.template_ms, 2),
+            "total_ms": round(profile.total_ms, 2),
+            "duplicate_queries": duplicates,
+        }
+
+        if get_server_timing():
+            response["Server-Timing"] = ", ".join([
+                f'sql;dur={profile.sql_ms:.2f};desc="{profile.queries} queries"',
+                f"tpl;dur={profile.template_ms:.2f}",
+                f'dup;desc="{sum(duplicates.values())} repeated"',
+                f"total;dur={profile.total_ms:.2f}",
+            ])
+
+        over_budget = budget is not None and profile.queries > budget
+        level = logging.WARNING if over_budget else logging.INFO
+        logger.log(
+            level,
+            "%s %s -> %s: %d queries (%.1f ms SQL, %.1f ms templates)",
+            request.method, request.path, response.status_code,
+            profile.queries, profile.sql_ms, profile.template_ms,
+            extra={"request_profile": stats},
+        )
+
+        if over_budget and get_raise_on_budget():
+            repeated = "\n".join(
+                f"  {count}x {profile.statements[key]}" for key, count in duplicates.items()
+            )
+            raise QueryBudgetExceeded(
+                f"{stats['view']} ran {profile.queries} queries, over its budget of {budget}."
+                + (f"\nRepeated queries:\n{repeated}" if repeated else "")
+            )
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, without dropping async requests to sync for the rest of the stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
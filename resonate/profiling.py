@@ -0,0 +1,89 @@
+"""
+Per-request SQL and template timings.
+
+``QueryBudgetMiddleware`` (see ``resonate.middleware``) starts a
+``RequestProfile`` for every request and makes it current. Each database
+query is then recorded through ``connection.execute_wrapper``, and
+top-level template renders are timed by ``ProfiledDjangoTemplates``, the
+project's template backend.
+"""
+import contextvars
+import hashlib
+import re
+import time
+from collections import Counter
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+# Collapse IN lists and whitespace so one query shape has one fingerprint
+# however many ids it was run with.
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    normalized = WHITESPACE.sub(" ", IN_LIST.sub("IN (...)", sql)).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:8], normalized
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.shapes = Counter()
+        self.statements = {}
+        self._rendering = False
+
+    def record(self, execute, sql, params, many, context):
+        """An ``execute_wrapper`` that times each query and counts its shape."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.queries += 1
+            key, normalized = fingerprint(sql)
+            self.shapes[key] += 1
+            self.statements.setdefault(key, normalized)
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def duplicates(self):
+        """``{fingerprint: count}`` for query shapes run more than once, most repeated first."""
+        return {key: count for key, count in self.shapes.most_common() if count > 1}
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None or profile._rendering:
+            # Nested renders (inclusion tags, render_to_string in tags) are
+            # already inside the outer render's time.
+            return super().render(context, request)
+        profile._rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_ms += (time.perf_counter() - start) * 1000
+            profile._rendering = False
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the current request's profile."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,277 @@
+"""
+A small in-process stand-in for a Redis server.
+
+It speaks enough of the RESP protocol for the Redis pub/sub channel layer
+(PUBLISH, SUBSCRIBE, UNSUBSCRIBE plus connection housekeeping) and for
+Django's Redis cache backend (string keys with expiry, MULTI/EXEC
+pipelines), so that several workers can be tested against one shared
+broker and cache without installing Redis. It is not meant for production
+use.
+
+Run it standalone with ``python -m resonate.respserver --port 6379``.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode(value):
+    """Encode a Python value as a RESP2 reply."""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+OK = b"+OK\r\n"
+PONG = b"+PONG\r\n"
+QUEUED = b"+QUEUED\r\n"
+
+
+def error(message):
+    return b"-ERR %s\r\n" % message.encode()
+
+
+async def read_command(reader):
+    """Read one command as a list of bytes arguments, or None at EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.strip().split()
+
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        if not header.startswith(b"$"):
+            raise ProtocolError("expected bulk string")
+        data = await reader.readexactly(int(header[1:]) + 2)
+        args.append(data[:-2])
+    return args
+
+
+class RespServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.subscribers = {}
+        # key -> (value, expiry as a time.monotonic() deadline or None)
+        self.data = {}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def handle(self, reader, writer):
+        channels = set()
+        queued = None
+        try:
+            while True:
+                try:
+                    args = await read_command(reader)
+                except (ProtocolError, ValueError, asyncio.IncompleteReadError):
+                    break
+                if args is None:
+                    break
+                if not args:
+                    continue
+                command = args[0].upper()
+                if command == b"MULTI":
+                    queued, reply = [], OK
+                elif command == b"DISCARD":
+                    queued, reply = None, OK
+                elif command == b"EXEC":
+                    replies = [self.dispatch(name, rest, writer, channels) for name, rest in queued or ()]
+                    queued, reply = None, b"*%d\r\n" % len(replies) + b"".join(replies)
+                elif queued is not None:
+                    queued.append((command, args[1:]))
+                    reply = QUEUED
+                else:
+                    reply = self.dispatch(command, args[1:], writer, channels)
+                if reply is None:
+                    break
+                if reply:
+                    writer.write(reply)
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+    def dispatch(self, command, args, writer, channels):
+        """Return the reply bytes for a command, or None to close the connection."""
+        if command == b"PING":
+            if channels:
+                return encode([b"pong", args[0] if args else b""])
+            return encode(args[0]) if args else PONG
+        if command == b"ECHO":
+            return encode(args[0])
+        if command in (b"CLIENT", b"SELECT", b"AUTH"):
+            return OK
+        if command == b"QUIT":
+            writer.write(OK)
+            return None
+        if command == b"PUBLISH":
+            return encode(self.publish(args[0], args[1]))
+        if command == b"SUBSCRIBE":
+            replies = []
+            for channel in args:
+                channels.add(channel)
+                self.subscribers.setdefault(channel, set()).add(writer)
+                replies.append(encode([b"subscribe", channel, len(channels)]))
+            return b"".join(replies)
+        if command == b"UNSUBSCRIBE":
+            replies = []
+            for channel in args or list(channels):
+                channels.discard(channel)
+                self.subscribers.get(channel, set()).discard(writer)
+                replies.append(encode([b"unsubscribe", channel, len(channels)]))
+            return b"".join(replies) or encode([b"unsubscribe", None, 0])
+        try:
+            reply = self.execute(command, args)
+        except (IndexError, ValueError):
+            return error("syntax error or value is not an integer")
+        if reply is not None:
+            return reply
+        return error(f"unknown command '{command.decode(errors='replace')}'")
+
+    def lookup(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def expire(self, key, seconds):
+        if self.lookup(key) is None:
+            return 0
+        self.data[key] = (self.data[key][0], time.monotonic() + seconds if seconds is not None else None)
+        return 1
+
+    def execute(self, command, args):
+        """Return the reply to a key-value command, or None if the command is unknown."""
+        if command == b"GET":
+            return encode(self.lookup(args[0]))
+        if command == b"MGET":
+            return encode([self.lookup(key) for key in args])
+        if command == b"SET":
+            key, value = args[0], args[1]
+            options = [arg.upper() for arg in args[2:]]
+            exists = self.lookup(key) is not None
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                return encode(None)
+            expires = None
+            for unit, scale in ((b"EX", 1), (b"PX", 1000)):
+                if unit in options:
+                    expires = time.monotonic() + int(options[options.index(unit) + 1]) / scale
+            self.data[key] = (value, expires)
+            return OK
+        if command == b"MSET":
+            for key, value in zip(args[::2], args[1::2]):
+                self.data[key] = (value, None)
+            return OK
+        if command == b"DEL":
+            deleted = 0
+            for key in args:
+                if self.lookup(key) is not None:
+                    del self.data[key]
+                    deleted += 1
+            return encode(deleted)
+        if command == b"EXISTS":
+            return encode(sum(self.lookup(key) is not None for key in args))
+        if command in (b"INCR", b"INCRBY", b"DECR", b"DECRBY"):
+            delta = int(args[1]) if command.endswith(b"BY") else 1
+            if command.startswith(b"DECR"):
+                delta = -delta
+            value = int(self.lookup(args[0]) or 0) + delta
+            expires = self.data.get(args[0], (None, None))[1]
+            self.data[args[0]] = (str(value).encode(), expires)
+            return encode(value)
+        if command == b"EXPIRE":
+            return encode(self.expire(args[0], int(args[1])))
+        if command == b"PEXPIRE":
+            return encode(self.expire(args[0], int(args[1]) / 1000))
+        if command == b"PERSIST":
+            if self.lookup(args[0]) is None or self.data[args[0]][1] is None:
+                return encode(0)
+            return encode(self.expire(args[0], None))
+        if command in (b"FLUSHDB", b"FLUSHALL"):
+            self.data.clear()
+            return OK
+        return None
+
+    def publish(self, channel, data):
+        subscribers = self.subscribers.get(channel, set())
+        frame = encode([b"message", channel, data])
+        for subscriber in subscribers:
+            subscriber.write(frame)
+        return len(subscribers)
+
+
+def run_in_thread(host="127.0.0.1", port=0):
+    """Start a server on a background event loop; returns it once it is listening."""
+    started = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        holder["loop"] = loop
+        holder["server"] = loop.run_until_complete(RespServer(host, port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="respserver", daemon=True).start()
+    started.wait()
+    server = holder["server"]
+    server.stop = lambda: holder["loop"].call_soon_threadsafe(server.close)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    options = parser.parse_args()
+
+    async def serve():
+        server = await RespServer(options.host, options.port).start()
+        print(f"Listening on {server.url}", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+A small in-process stand-in for an S3-compatible object store.
+
+It understands enough of the S3 REST API for the media storage backend
+(bucket creation and path-style PUT, GET, HEAD and DELETE of objects, plus
+a minimal ListObjectsV2) so that the S3 code path can be exercised without
+real credentials or a network. Requests are not authenticated and objects
+are kept in memory. It is not meant for production use.
+
+Run it standalone with ``python -m resonate.s3server --port 9000``.
+"""
+import argparse
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+STORED_HEADERS = ("Content-Type", "Cache-Control", "Content-Disposition", "Content-Encoding")
+
+
+def read_chunked(stream):
+    """Read an HTTP/1.1 chunked body."""
+    body = bytearray()
+    while True:
+        size = int(stream.readline().split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            while stream.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return bytes(body)
+        body += stream.read(size)
+        stream.readline()
+
+
+def decode_aws_chunked(data):
+    """Strip the ``aws-chunked`` framing (and any trailing checksum) from a payload."""
+    body = bytearray()
+    position = 0
+    while True:
+        end = data.index(b"\r\n", position)
+        size = int(data[position:end].split(b";")[0], 16)
+        position = end + 2
+        if size == 0:
+            return bytes(body)
+        body += data[position:position + size]
+        position += size + 2
+
+
+class S3RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def target(self):
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        return bucket, key, parse_qs(url.query)
+
+    def read_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            body = read_chunked(self.rfile)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        streaming = self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-")
+        if streaming or "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = decode_aws_chunked(body)
+        return body
+
+    def reply(self, status, body=b"", headers=None, send_body=True):
+        self.send_response(status)
+        headers = headers or {}
+        headers.setdefault("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def error(self, status, code, send_body=True):
+        body = f"<?xml version=\"1.0\"?><Error><Code>{code}</Code></Error>".encode()
+        self.reply(status, body, {"Content-Type": "application/xml"}, send_body)
+
+    def do_PUT(self):
+        bucket, key, _ = self.target()
+        body = self.read_body()
+        store = self.server.store
+        with store.lock:
+            if not key:
+                store.buckets.setdefault(bucket, {})
+                return self.reply(200)
+            if bucket not in store.buckets:
+                return self.error(404, "NoSuchBucket")
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            headers = {name: self.headers[name] for name in STORED_HEADERS if self.headers.get(name)}
+            if headers.get("Content-Encoding", "").startswith("aws-chunked"):
+                del headers["Content-Encoding"]
+            headers.update({"ETag": etag, "Last-Modified": formatdate(usegmt=True)})
+            store.buckets[bucket][key] = (body, headers)
+        self.reply(200, headers={"ETag": etag})
+
+    def do_GET(self, send_body=True):
+        bucket, key, query = self.target()
+        store = self.server.store
+        with store.lock:
+            objects = store.buckets.get(bucket)
+            if objects is None:
+                return self.error(404, "NoSuchBucket", send_body)
+            if not key:
+                return self.list_objects(objects, query.get("prefix", [""])[0], send_body)
+            if key not in objects:
+                return self.error(404, "NoSuchKey", send_body)
+            body, headers = objects[key]
+        self.reply(200, body, {"Content-Type": "binary/octet-stream", **headers}, send_body)
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_DELETE(self):
+        bucket, key, _ = self.target()
+        store = self.server.store
+        with store.lock:
+            store.buckets.get(bucket, {}).pop(key, None)
+        self.reply(204)
+
+    def list_objects(self, objects, prefix, send_body):
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><Size>{len(body)}</Size>"
+            f"<ETag>{escape(headers['ETag'])}</ETag></Contents>"
+            for key, (body, headers) in sorted(objects.items()) if key.startswith(prefix)
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Prefix>{escape(prefix)}</Prefix><IsTruncated>false</IsTruncated>{contents}"
+            "</ListBucketResult>"
+        ).encode()
+        self.reply(200, body, {"Content-Type": "application/xml"}, send_body)
+
+
+class ObjectStore:
+    def __init__(self, buckets=()):
+        self.lock = threading.Lock()
+        self.buckets = {bucket: {} for bucket in buckets}
+
+
+class S3Server:
+    def __init__(self, host="127.0.0.1", port=0, buckets=("media",)):
+        self.store = ObjectStore(buckets)
+        self._server = ThreadingHTTPServer((host, port), S3RequestHandler)
+        self._server.daemon_threads = True
+        self._server.store = self.store
+        self.host, self.port = self._server.server_address[:2]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def run_in_thread(host="127.0.0.1", port=0, buckets=("media",)):
+    """Start a server on a background thread; returns it once it is listening."""
+    server = S3Server(host, port, buckets)
+    threading.Thread(target=server.serve_forever, name="s3server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--bucket", action="append", default=None, help="Bucket to create (repeatable).")
+    options = parser.parse_args()
+
+    server = S3Server(options.host, options.port, options.bucket or ["media"])
+    print(f"Listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
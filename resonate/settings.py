@@ -1,5 +1,6 @@
 import dj_database_url
 import os
+import sys
 from pathlib import Path
 from decouple import config, Csv
 
@@ -15,6 +16,8 @@ SECRET_KEY = config('SECRET_KEY')
 
 DEBUG = config('DEBUG', default=True, cast=bool)
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 if DEBUG:
     # Local Development: Allow localhost and standard IP addresses
     ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '::1']
@@ -59,12 +62,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'resonate.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', 
+    'resonate.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,7 +77,7 @@ ROOT_URLCONF = 'resonate.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'resonate.profiling.ProfiledDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,6 +86,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.fragments.fragment_cache',
             ],
         },
     },
@@ -89,6 +94,26 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'resonate.wsgi.application'
 
+# Request profiling (see resonate.middleware). Views over their
+# @query_budget raise under the test runner and are logged otherwise.
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=TESTING, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'resonate.requests': {
+            'handlers': ['console'],
+            'level': config('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 # ----------------------------------------------------------------------
 # DATABASES CONFIGURATION
 # ----------------------------------------------------------------------
@@ -114,6 +139,56 @@ else:
 # ----------------------------------------------------------------------
 
 
+# ----------------------------------------------------------------------
+# CACHE & SESSION CONFIGURATION
+# ----------------------------------------------------------------------
+
+# Each process keeps its own local-memory cache unless CACHE_URL points at
+# a shared Redis (e.g. redis://localhost:6379/1; resonate.respserver is a
+# local stand-in). Sessions and logged-in users are read from the cache and
+# only fall back to the database on a miss.
+CACHE_URL = config('CACHE_URL', default='')
+SHARED_CACHE = CACHE_URL.startswith(('redis://', 'rediss://'))
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': config('CACHE_KEY_PREFIX', default='resonate'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'resonate',
+        },
+    }
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# How long a logged-in user stays cached (see accounts.auth). With the
+# local-memory cache, changes made by another process show up only after
+# this expires.
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=300, cast=int)
+
+# How long the IDs a user follows stay cached (see accounts.follows). A
+# follow or unfollow only drops the entry from the cache of the process that
+# handled it, so with the local-memory cache and several workers the others
+# show the old follow state until it expires. The default is only long when
+# a shared cache is configured.
+FOLLOW_SET_CACHE_TIMEOUT = config(
+    'FOLLOW_SET_CACHE_TIMEOUT', default=3600 if SHARED_CACHE else AUTH_USER_CACHE_TIMEOUT, cast=int,
+)
+
+# How long post cards and profile headers stay cached (see accounts.fragments).
+# Changes invalidate them only in the cache of the process that made them, so
+# with the local-memory cache other workers show stale counts until this
+# expires. As above, the default is only long with a shared cache.
+FRAGMENT_CACHE_TIMEOUT = config('FRAGMENT_CACHE_TIMEOUT', default=86400 if SHARED_CACHE else 60, cast=int)
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -156,17 +231,56 @@ STATICFILES_FINDERS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media" 
 
-# FIX: Simple, universal storage configuration.
-# WARNING: Media files (user uploads) will be lost on deployment/restart on Render.
+# Uploads are stored under the hash of their contents and deduplicated
+# (see accounts.storage). Set MEDIA_STORAGE=s3 to keep them in an
+# S3-compatible bucket instead, e.g. the local stand-in started with
+# ``python -m resonate.s3server``.
+MEDIA_STORAGE = config('MEDIA_STORAGE', default='filesystem')
+
+if MEDIA_STORAGE == 's3':
+    DEFAULT_STORAGE = {
+        "BACKEND": "accounts.storage.ContentAddressedS3Storage",
+        "OPTIONS": {
+            "bucket_name": config('MEDIA_S3_BUCKET', default='media'),
+            "endpoint_url": config('MEDIA_S3_ENDPOINT_URL', default='') or None,
+            "access_key": config('MEDIA_S3_ACCESS_KEY', default=''),
+            "secret_key": config('MEDIA_S3_SECRET_KEY', default=''),
+            "region_name": config('MEDIA_S3_REGION', default='us-east-1'),
+            "custom_domain": config('MEDIA_S3_CUSTOM_DOMAIN', default='') or None,
+            "addressing_style": "path",
+            "querystring_auth": False,
+        },
+    }
+else:
+    # WARNING: Media files (user uploads) will be lost on deployment/restart on Render.
+    DEFAULT_STORAGE = {
+        "BACKEND": "accounts.storage.ContentAddressedStorage",
+    }
+
 STORAGES = {
-    "default": {
-        "BACKEND": "django.core.files.storage.FileSystemStorage",
-    },
+    "default": DEFAULT_STORAGE,
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
 }
 
+# Serve MEDIA_URL from Django; content-addressed files get immutable
+# far-future Cache-Control headers.
+SERVE_MEDIA = config('SERVE_MEDIA', default=DEBUG, cast=bool)
+
+# Uploaded avatars and post images get resized WebP/AVIF renditions from a
+# background pool (see accounts.images). 0 workers processes them inline.
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+IMAGE_RENDITION_FORMATS = config('IMAGE_RENDITION_FORMATS', default='webp,avif', cast=Csv())
+
+# Uploads always stream to a temporary file; bytes past the limit are
+# discarded and the form rejects the file (see accounts.uploads).
+FILE_UPLOAD_HANDLERS = ['accounts.uploads.SizeLimitedUploadHandler']
+IMAGE_UPLOAD_MAX_BYTES = config('IMAGE_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+IMAGE_MAX_PIXELS = config('IMAGE_MAX_PIXELS', default=40_000_000, cast=int)
+# Larger originals are downscaled to fit this box after upload.
+IMAGE_MAX_DIMENSION = config('IMAGE_MAX_DIMENSION', default=4096, cast=int)
+
 # ----------------------------------------------------------------------
 # END STATIC & MEDIA FILES CONFIGURATION
 # ----------------------------------------------------------------------
@@ -182,4 +296,84 @@ EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
-ASGI_APPLICATION = 'resonate.asgi.application'
\ No newline at end of file
+ASGI_APPLICATION = 'resonate.asgi.application'
+
+# Serve the read-heavy pages (feed, profiles, posts, search, inbox) from
+# their async views. Off by default: benchmarked under ASGI they served no
+# more requests per second than the sync views. Never turn it on under a
+# WSGI server, where each async view would need its own event loop.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# ----------------------------------------------------------------------
+# CHAT CONFIGURATION
+# ----------------------------------------------------------------------
+
+# The in-memory layer only reaches consumers in the same process. Set
+# CHANNEL_LAYER_URL (e.g. redis://localhost:6379/0) to fan group messages out
+# across every ASGI worker through Redis pub/sub.
+CHANNEL_LAYER_URL = config('CHANNEL_LAYER_URL', default='')
+
+if CHANNEL_LAYER_URL.startswith(('redis://', 'rediss://')):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_LAYER_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Incoming WebSocket messages are written in batches (see chat.writer).
+CHAT_FLUSH_INTERVAL_MS = config('CHAT_FLUSH_INTERVAL_MS', default=10, cast=int)
+CHAT_FLUSH_BATCH_SIZE = config('CHAT_FLUSH_BATCH_SIZE', default=50, cast=int)
+
+# Messages rendered with a thread and returned per "load older" request.
+CHAT_PAGE_SIZE = config('CHAT_PAGE_SIZE', default=50, cast=int)
+
+# ----------------------------------------------------------------------
+# FEED CONFIGURATION
+# ----------------------------------------------------------------------
+
+FEED_PAGE_SIZE = config('FEED_PAGE_SIZE', default=20, cast=int)
+COMMENTS_PER_POST = config('COMMENTS_PER_POST', default=3, cast=int)
+
+# Fan-out-on-write timelines. Authors with more followers than the limit are
+# merged into feeds at read time instead of being copied to every follower.
+# follow_toggle backfills an author's followers when an unfollow brings them
+# back to the limit. After changing the limit, or counts fixed by
+# reconcile_counters, run rebuild_timelines.
+FEED_FANOUT = config('FEED_FANOUT', default=False, cast=bool)
+FEED_FANOUT_FOLLOWER_LIMIT = config('FEED_FANOUT_FOLLOWER_LIMIT', default=10000, cast=int)
+FEED_FANOUT_BACKFILL = config('FEED_FANOUT_BACKFILL', default=100, cast=int)
+
+# Write-behind likes (see accounts.likebuffer): like_toggle records intents in
+# memory and a journal, and a background thread writes them in batches.
+LIKE_WRITE_BEHIND = config('LIKE_WRITE_BEHIND', default=False, cast=bool)
+LIKE_FLUSH_INTERVAL_MS = config('LIKE_FLUSH_INTERVAL_MS', default=1000, cast=int)
+LIKE_FLUSH_BATCH_SIZE = config('LIKE_FLUSH_BATCH_SIZE', default=500, cast=int)
+LIKE_JOURNAL_DIR = config('LIKE_JOURNAL_DIR', default=str(BASE_DIR / 'like-journal'))
+LIKE_JOURNAL_FSYNC = config('LIKE_JOURNAL_FSYNC', default=True, cast=bool)
+
+# Trending posts (see accounts.trending). Run decay_trending every
+# TRENDING_DECAY_INTERVAL minutes, e.g. from cron.
+TRENDING_LIKE_WEIGHT = config('TRENDING_LIKE_WEIGHT', default=1.0, cast=float)
+TRENDING_COMMENT_WEIGHT = config('TRENDING_COMMENT_WEIGHT', default=3.0, cast=float)
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=6.0, cast=float)
+TRENDING_DECAY_INTERVAL = config('TRENDING_DECAY_INTERVAL', default=15, cast=int)
+TRENDING_MIN_SCORE = config('TRENDING_MIN_SCORE', default=0.05, cast=float)
+TRENDING_PAGE_SIZE = config('TRENDING_PAGE_SIZE', default=20, cast=int)
+
+
+# ----------------------------------------------------------------------
+# SEARCH CONFIGURATION
+# ----------------------------------------------------------------------
+
+# Defaults to the backend matching the database engine (see accounts.search).
+MUSICIAN_SEARCH_BACKEND = config('MUSICIAN_SEARCH_BACKEND', default='') or None
+SEARCH_PAGE_SIZE = config('SEARCH_PAGE_SIZE', default=20, cast=int)
@@ -0,0 +1,253 @@
+"""
+Synthetic data for load tests and benchmarks.
+
+``generate`` fills the database with users, profiles, a follow graph,
+posts, likes, comments and chat threads at a configurable scale. Popularity
+follows a power law: a few users attract most follows and chat partners,
+and per-user activity (follows, posts, likes, comments, messages) is drawn
+from a Pareto distribution around the requested mean. Everything is
+inserted with ``bulk_create`` in batches, so signals don't run. Denormalized
+counters, facets and trending scores are rebuilt from the tables afterwards.
+
+The same seed and scale always produce the same data.
+"""
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts import counters, facets, trending
+from accounts.models import Comment, Follow, Like, Post, Profile, normalize_facet
+from chat.models import ChatThread, Message
+
+INSTRUMENTS = [
+    "Guitar", "Electric Guitar", "Bass", "Drums", "Piano", "Keyboards", "Violin",
+    "Cello", "Saxophone", "Trumpet", "Vocals", "Flute", "Clarinet", "Synth", "Ukulele",
+]
+LOCATIONS = [
+    "Berlin", "London", "New York", "Los Angeles", "Nashville", "Chicago", "Paris",
+    "Tokyo", "Melbourne", "Toronto", "Austin", "Lisbon", "Mumbai", "Seoul", "Bristol",
+]
+GENRES = ["jazz", "rock", "metal", "folk", "funk", "blues", "classical", "hip hop", "punk", "ambient"]
+CATEGORIES = [choice for choice, _ in Post.CATEGORY_CHOICES]
+PHRASES = [
+    "Looking for a band", "New cover up", "Gig this Friday", "Practising scales",
+    "Just finished recording", "Anyone up for a jam", "Teaching beginners", "Fresh demo",
+    "Rehearsal notes", "Studio day",
+]
+REPLIES = ["Sounds great!", "Count me in", "Love this", "Where's the gig?", "Nice tone", "What gear is that?"]
+
+# Pareto shape for per-user activity; its mean is SHAPE / (SHAPE - 1).
+SHAPE = 1.5
+# Exponent of the power law deciding who gets followed and messaged.
+POPULARITY_EXPONENT = 1.1
+
+
+def pareto(rng, mean, cap):
+    """A heavy-tailed count with roughly the given mean, at most ``cap``."""
+    if mean <= 0:
+        return 0
+    scale = mean * (SHAPE - 1) / SHAPE
+    return min(cap, int(rng.paretovariate(SHAPE) * scale))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def write_columns(model, objects, names):
+    """
+    Write the current value of fields ``names`` for saved ``objects``.
+
+    A plain ``UPDATE ... WHERE pk = %s`` run with ``executemany``;
+    ``bulk_update``'s CASE expressions are far slower at this size.
+    """
+    fields = [model._meta.get_field(name) for name in names]
+    quote = connection.ops.quote_name
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        quote(model._meta.db_table),
+        ", ".join(f"{quote(field.column)} = %s" for field in fields),
+        quote(model._meta.pk.column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [*(field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields), obj.pk]
+            for obj in objects
+        ])
+
+
+def insert(model, objects, batch_size, timestamps=None):
+    """
+    ``bulk_create`` ``objects`` and return them with primary keys set.
+
+    ``auto_now_add`` always stamps the current time on insert, so any
+    ``{field: [values]}`` in ``timestamps`` are written afterwards.
+    """
+    created = model.objects.bulk_create(objects, batch_size=batch_size)
+    for name, values in (timestamps or {}).items():
+        for obj, value in zip(created, values):
+            setattr(obj, name, value)
+        write_columns(model, created, [name])
+    return created
+
+
+class Generator:
+    def __init__(self, users, follows, posts, likes, comments, threads, messages,
+                 days=90, prefix="synth", seed=0, batch_size=1000):
+        self.scale = {
+            "users": users, "follows": follows, "posts": posts, "likes": likes,
+            "comments": comments, "threads": threads, "messages": messages,
+        }
+        self.days = days
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.counts = {}
+
+    def moment(self):
+        return self.now - timedelta(seconds=self.rng.uniform(0, self.days * 86400))
+
+    def popular(self, k):
+        """``k`` user IDs drawn with power-law popularity (with repeats)."""
+        return self.rng.choices(self.user_ids, cum_weights=self.popularity, k=k)
+
+    def run(self):
+        with transaction.atomic():
+            self.create_users()
+            self.create_follows()
+            self.create_posts()
+            self.create_threads()
+            counters.reconcile()
+            facets.rebuild()
+            trending.rebuild(self.now)
+        return self.counts
+
+    def create_users(self):
+        count = self.scale["users"]
+        # One unusable password shared by everyone; hashing one per user would dominate the run.
+        password = make_password(None)
+        users = insert(User, (
+            User(username=f"{self.prefix}{i}", password=password, date_joined=self.moment())
+            for i in range(count)
+        ), self.batch_size)
+        self.user_ids = [user.id for user in users]
+
+        profiles = []
+        for user_id in self.user_ids:
+            instrument = self.rng.choice(INSTRUMENTS)
+            location = self.rng.choice(LOCATIONS)
+            genres = " and ".join(self.rng.sample(GENRES, 2))
+            profiles.append(Profile(
+                user_id=user_id,
+                instrument=instrument,
+                location=location,
+                instrument_key=normalize_facet(instrument),
+                location_key=normalize_facet(location),
+                bio=f"{instrument} player from {location} into {genres}.",
+            ))
+        insert(Profile, profiles, self.batch_size)
+
+        # Rank users in a random order so popularity isn't tied to id.
+        ranks = list(range(1, count + 1))
+        self.rng.shuffle(ranks)
+        self.popularity = list(itertools.accumulate(rank ** -POPULARITY_EXPONENT for rank in ranks))
+        self.counts.update(users=count, profiles=count)
+
+    def create_follows(self):
+        def follows():
+            for follower in self.user_ids:
+                degree = pareto(self.rng, self.scale["follows"], len(self.user_ids) - 1)
+                for following in set(self.popular(degree)) - {follower}:
+                    yield Follow(follower_id=follower, following_id=following)
+
+        total = 0
+        for batch in batched(follows(), self.batch_size):
+            total += len(insert(Follow, batch, self.batch_size))
+        self.counts["follows"] = total
+
+    def create_posts(self):
+        def posts():
+            for author in self.user_ids:
+                for _ in range(pareto(self.rng, self.scale["posts"], 1000)):
+                    yield Post(
+                        author_id=author,
+                        title=self.rng.choice(PHRASES),
+                        description=f"{self.rng.choice(PHRASES)} #{self.rng.choice(GENRES).replace(' ', '')}",
+                        category=self.rng.choice(CATEGORIES),
+                    )
+
+        totals = {"posts": 0, "likes": 0, "comments": 0}
+        users = len(self.user_ids)
+        for batch in batched(posts(), self.batch_size):
+            created_at = [self.moment() for _ in batch]
+            batch = insert(Post, batch, self.batch_size, {"created_at": created_at})
+            likes, comments, comment_times = [], [], []
+            for post, posted in zip(batch, created_at):
+                for user_id in self.rng.sample(self.user_ids, pareto(self.rng, self.scale["likes"], users)):
+                    likes.append(Like(post_id=post.id, user_id=user_id))
+                for _ in range(pareto(self.rng, self.scale["comments"], 200)):
+                    comments.append(Comment(
+                        post_id=post.id, user_id=self.rng.choice(self.user_ids), text=self.rng.choice(REPLIES),
+                    ))
+                    comment_times.append(posted + timedelta(seconds=self.rng.uniform(0, (self.now - posted).total_seconds())))
+            insert(Like, likes, self.batch_size)
+            insert(Comment, comments, self.batch_size, {"created_at": comment_times})
+            totals["posts"] += len(batch)
+            totals["likes"] += len(likes)
+            totals["comments"] += len(comments)
+        self.counts.update(totals)
+
+    def create_threads(self):
+        pairs = set()
+        for user_id in self.user_ids:
+            for partner in self.popular(pareto(self.rng, self.scale["threads"], 100)):
+                if partner != user_id:
+                    pairs.add((min(user_id, partner), max(user_id, partner)))
+
+        threads = messages = 0
+        for batch in batched(sorted(pairs), self.batch_size):
+            # Sorted pairs satisfy the user1 < user2 constraint without save().
+            created = insert(ChatThread, [ChatThread(user1_id=a, user2_id=b) for a, b in batch], self.batch_size)
+            pending, times = [], []
+            for thread in created:
+                start = self.moment()
+                count = max(1, pareto(self.rng, self.scale["messages"], 500))
+                offsets = sorted(self.rng.uniform(0, (self.now - start).total_seconds()) for _ in range(count))
+                for offset in offsets:
+                    sender = self.rng.choice((thread.user1_id, thread.user2_id))
+                    pending.append(Message(thread_id=thread.id, sender_id=sender, content=self.rng.choice(REPLIES)))
+                    times.append(start + timedelta(seconds=offset))
+            saved = insert(Message, pending, self.batch_size, {"timestamp": times})
+
+            by_thread = {thread.id: thread for thread in created}
+            unanswered = {}
+            for message in saved:
+                thread = by_thread[message.thread_id]
+                # Messages are in time order, so the last one per thread wins.
+                if thread.last_message and thread.last_message.sender_id == message.sender_id:
+                    unanswered[thread.id] += 1
+                else:
+                    unanswered[thread.id] = 1
+                thread.last_message = message
+                thread.updated = message.timestamp
+            for thread in created:
+                # Half the recipients haven't read the messages since their last reply.
+                if self.rng.random() < 0.5:
+                    side = "user1" if thread.last_message.sender_id == thread.user2_id else "user2"
+                    setattr(thread, f"{side}_unread", unanswered[thread.id])
+            write_columns(ChatThread, created, ["last_message", "updated", "user1_unread", "user2_unread"])
+            threads += len(created)
+            messages += len(saved)
+        self.counts.update(threads=threads, messages=messages)
+
+
+def generate(**options):
+    """Generate a synthetic dataset; returns ``{table: rows_created}``."""
+    return Generator(**options).run()
@@ -2,11 +2,15 @@
 URL configuration for resonate project.
 ...
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.shortcuts import redirect, render
 from django.conf import settings
-from django.conf.urls.static import static
+from django.views.static import serve
+
+from accounts.storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed
 
 
 def landing_view(request):
@@ -14,6 +18,15 @@ def landing_view(request):
         return redirect("accounts:my_profile")
     return render(request, "landing.html")
 
+
+def media_view(request, path):
+    """Serve an upload; content-addressed names never change, so they can be cached for good."""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
@@ -21,7 +34,11 @@ urlpatterns = [
     path('chats/', include('chat.urls')),
 ]
 
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")), media_view, name="media"),
+    ]
+
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     from django.contrib.staticfiles.urls import staticfiles_urlpatterns
     urlpatterns += staticfiles_urlpatterns()
\ No newline at end of file